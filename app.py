@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import aws_cdk as core
+from aws_cdk import aws_lambda as lambda_
 
 from cdk.stacks.bedrock_agents_stack import BedrockAgentsStack
 from cdk.stacks.bedrock_data_stack import BedrockDataStack
@@ -27,6 +28,9 @@ app_stack = BedrockAppStack(
     br_kb_id=agent_stack.knowledge_base.knowledge_base_id,
     br_datasource_id=agent_stack.knowledge_base.data_source_id,
     okta_secret=data_stack.okta_secret,
+    # right-size with `python -m tools.app_tuning`
+    memory_size=10240,
+    architecture=lambda_.Architecture.X86_64,
     env=env,
 )
 
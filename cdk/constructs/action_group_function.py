@@ -0,0 +1,78 @@
+from typing import Dict, Optional
+import aws_cdk as core
+from aws_cdk import aws_lambda as lambda_
+from aws_cdk import aws_events as events
+from aws_cdk import aws_events_targets as targets
+from constructs import Construct
+from cdk.functions.action_group import WARMER_EVENT
+from cdk.constructs.function_image import FunctionImage
+
+
+class ActionGroupFunction(Construct):
+    """
+    Docker based Lambda function that executes a Bedrock agent action group.
+
+    Agent tool calls sit inside the model's reasoning loop, so cold starts are paid for by the user. The function is
+    published behind a `live` alias that can be given provisioned concurrency (pre-initialized execution
+    environments), auto-scaling of that provisioned concurrency and/or a scheduled warmer invocation.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        handler: str,
+        description: str,
+        timeout: core.Duration = core.Duration.seconds(60),
+        memory_size: int = 1024,
+        environment: Optional[Dict[str, str]] = None,
+        provisioned_concurrency: Optional[int] = None,
+        max_provisioned_concurrency: Optional[int] = None,
+        provisioned_utilization_target: float = 0.7,
+        warmer_interval: Optional[core.Duration] = None,
+        **kwargs,
+    ) -> None:
+        """
+        param handler: str: dotted path of the handler, ie. `cdk.functions.web_search.lambda_handler`
+        param provisioned_concurrency: int: pre-initialized environments on the alias (the minimum when scaling)
+        param max_provisioned_concurrency: int: auto-scale provisioned concurrency up to this many environments
+        param provisioned_utilization_target: float: provisioned concurrency utilization the auto-scaling targets
+        param warmer_interval: Duration: invoke the alias with a `WARMER_EVENT` on this schedule
+        """
+        super().__init__(scope, id, **kwargs)
+
+        self.function = lambda_.DockerImageFunction(
+            self,
+            "Function",
+            description=description,
+            code=FunctionImage.of(self).code(handler),  # the image shared by the stack's function handlers
+            timeout=timeout,
+            memory_size=memory_size,
+            environment=environment,
+        )
+
+        # Provisioned concurrency can only be configured on a version or alias
+        self.alias = lambda_.Alias(
+            self,
+            "Alias",
+            alias_name="live",
+            version=self.function.current_version,
+            provisioned_concurrent_executions=provisioned_concurrency,
+        )
+        if max_provisioned_concurrency:
+            scaling = self.alias.add_auto_scaling(
+                min_capacity=provisioned_concurrency or 1, max_capacity=max_provisioned_concurrency
+            )
+            scaling.scale_on_utilization(utilization_target=provisioned_utilization_target)
+
+        if warmer_interval:
+            events.Rule(
+                self,
+                "Warmer",
+                description=f"Keep {id} initialized",
+                schedule=events.Schedule.rate(warmer_interval),
+                targets=[targets.LambdaFunction(self.alias, event=events.RuleTargetInput.from_object(WARMER_EVENT))],
+            )
+
+        # The agent invokes the alias so that it gets the provisioned environments
+        self.function_arn = self.alias.function_arn
@@ -1,14 +1,12 @@
-import os
 import aws_cdk as core
 from aws_cdk import aws_bedrock as bedrock
 from aws_cdk import aws_lambda as lambda_
 from aws_cdk import aws_iam as iam
 from aws_cdk import custom_resources as cr
 from aws_cdk import aws_logs as logs
-from aws_cdk import aws_ecr_assets as ecr
 from constructs import Construct
 from cdk.constructs.bedrock_guardrail import BedrockGuardrail
-from cdk.stacks.helpers import prune_dir
+from cdk.constructs.function_image import FunctionImage
 
 
 class BedrockAgent(Construct):
@@ -85,24 +83,29 @@ class BedrockAgent(Construct):
     def add_code_interpretation(self):
         # Code Interpretation - requires CustomResource to enable this
         # https://docs.aws.amazon.com/bedrock/latest/userguide/agents-enable-code-interpretation.html
-        code_dir = os.path.join(os.path.dirname(__file__), "..", "..")
-        code_fn = lambda_.DockerImageFunction(
-            self,
-            "CodeHandler",
-            description="Bedrock Agent Code Interpretation Action Group Custom Resource Handler",
-            code=lambda_.DockerImageCode.from_image_asset(
-                directory=code_dir,
-                cmd=["cdk.functions.bedrock_agent_code.lambda_handler"],
-                platform=ecr.Platform.LINUX_AMD64,  # required when building on arm64 machines (mac m1)
-                exclude=prune_dir(keeps=["functions"]),  # keeps updates smaller and faster
-            ),
-            timeout=core.Duration.minutes(2),
-        )
-        code_fn.role.add_to_policy(iam.PolicyStatement(actions=["bedrock:*"], resources=["*"]))  # TODO tighten this up
+        handlers = {}
+        # onEvent starts the change and returns, isComplete is then polled until the new agent version is live,
+        # so long prepares and alias updates dont have to fit in a single invocation
+        for construct_id, handler in [
+            ("CodeHandler", "lambda_handler"),
+            ("CodeCompleteHandler", "is_complete_handler"),
+        ]:
+            handlers[handler] = lambda_.DockerImageFunction(
+                self,
+                construct_id,
+                description="Bedrock Agent Code Interpretation Action Group Custom Resource Handler",
+                code=FunctionImage.of(self).code(f"cdk.functions.bedrock_agent_code.{handler}"),
+                timeout=core.Duration.minutes(1),
+            )
+            # TODO tighten this up
+            handlers[handler].role.add_to_policy(iam.PolicyStatement(actions=["bedrock:*"], resources=["*"]))
         code_provider = cr.Provider(
             self,
             "CodeProvider",
-            on_event_handler=code_fn,
+            on_event_handler=handlers["lambda_handler"],
+            is_complete_handler=handlers["is_complete_handler"],
+            query_interval=core.Duration.seconds(10),
+            total_timeout=core.Duration.minutes(30),  # fail the deployment rather than wait for CloudFormation
             log_retention=logs.RetentionDays.ONE_DAY,
         )
         core.CustomResource(
@@ -139,9 +142,13 @@ class BedrockAgent(Construct):
         if action_group.action_group_executor.lambda_:
             # Create a lambda resource policy that grants the agent permission to invoke the lambda function
             # https://docs.aws.amazon.com/bedrock/latest/userguide/agents-permissions.html#agents-permissions-lambda
+            # the first action group keeps the original id so that its permission isnt replaced
+            permission_id = "InvokePermission"
+            if self.node.try_find_child(permission_id):
+                permission_id += action_group.action_group_name
             lambda_.CfnPermission(
                 self,
-                "InvokePermission",
+                permission_id,
                 action="lambda:InvokeFunction",
                 function_name=action_group.action_group_executor.lambda_,
                 principal="bedrock.amazonaws.com",
@@ -0,0 +1,43 @@
+import aws_cdk as core
+from aws_cdk import aws_lambda as lambda_
+from aws_cdk import aws_ecr_assets as ecr
+from constructs import Construct
+from cdk.stacks.helpers import prune_dir, root_dir
+
+# The cdk/ entries the function handlers import
+FUNCTION_IMAGE_KEEPS = ["__init__.py", "functions", "models.py"]
+
+
+class FunctionImage(Construct):
+    """
+    Docker image shared by all the Lambda functions of a stack that run a `cdk.functions` handler.
+
+    The image is built and pushed once per deploy and fingerprinted once per synth, each function selects its handler
+    with `cmd`. Use `FunctionImage.of(scope).code(handler)` rather than creating it directly.
+    """
+
+    ID = "FunctionImage"
+
+    def __init__(self, scope: Construct, id: str) -> None:
+        super().__init__(scope, id)
+        self.asset = ecr.DockerImageAsset(
+            self,
+            "Asset",
+            directory=root_dir,
+            platform=ecr.Platform.LINUX_AMD64,  # required when building on arm64 machines (mac m1)
+            exclude=prune_dir(keeps=FUNCTION_IMAGE_KEEPS),  # only what the Dockerfile copies
+        )
+
+    @classmethod
+    def of(cls, scope: Construct) -> "FunctionImage":
+        """Return the stack's function image, creating it on first use"""
+        stack = core.Stack.of(scope)
+        return stack.node.try_find_child(cls.ID) or cls(stack, cls.ID)
+
+    def code(self, handler: str) -> lambda_.DockerImageCode:
+        """
+        param handler: str: dotted path of the handler, ie. `cdk.functions.web_search.lambda_handler`
+        """
+        return lambda_.DockerImageCode.from_ecr(
+            self.asset.repository, tag_or_digest=self.asset.image_tag, cmd=[handler]
+        )
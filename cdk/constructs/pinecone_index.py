@@ -1,14 +1,12 @@
 import json
 import aws_cdk as core
-import os
 from aws_cdk import aws_secretsmanager as sm
 from aws_cdk import custom_resources as cr
 from aws_cdk import aws_lambda as lambda_
-from aws_cdk import aws_ecr_assets as ecr
 from cdk.functions import pinecone_index as pi_fn
 from constructs import Construct
 
-from cdk.stacks.helpers import prune_dir
+from cdk.constructs.function_image import FunctionImage
 
 
 class PineconeSecret(Construct):
@@ -38,7 +36,14 @@ class PinconeIndex(Construct):
         metric=pi_fn.DEFAULT_METRIC,
         cloud=pi_fn.DEFAULT_CLOUD,
         region=pi_fn.DEFAULT_REGION,
+        blue_green: bool = False,
+        copy_vectors: bool = True,
     ):
+        """
+        param blue_green: bool: when a change needs a new index (dimension, metric, cloud or region) create it next to
+            the current one, which is deleted once the stack has moved over, instead of deleting the current one first
+        param copy_vectors: bool: copy the vectors to the new index when the dimension is unchanged
+        """
         super().__init__(scope, id)
 
         # If name has any uppercase characters, raise an error
@@ -48,18 +53,12 @@ class PinconeIndex(Construct):
         self.secret = secret
 
         # Create a docker based lambda function that can manage the pinecone index (create, delete, etc.)
-        code_dir = os.path.join(os.path.dirname(__file__), "..", "..")  # root of this project
         self.handler = lambda_.DockerImageFunction(
             self,
             "Handler",
             description="Pinecone Index Custom Resource Handler",
-            code=lambda_.DockerImageCode.from_image_asset(
-                directory=code_dir,
-                cmd=["cdk.functions.pinecone_index.lambda_handler"],
-                platform=ecr.Platform.LINUX_AMD64,  # required when building on arm64 machines (mac m1)
-                exclude=prune_dir(keeps=["functions"]),  # keeps updates smaller and faster
-            ),
-            timeout=core.Duration.minutes(2),
+            code=FunctionImage.of(self).code("cdk.functions.pinecone_index.lambda_handler"),
+            timeout=core.Duration.minutes(10),  # waits for new indexes to be ready and copies vectors
             environment={pi_fn.PINECONE_API_KEY_SECRET_ENV_NAME: self.secret.secret_name},
         )
         self.secret.grant_read(self.handler)
@@ -83,6 +82,8 @@ class PinconeIndex(Construct):
                 "metric": metric,
                 "cloud": cloud,
                 "region": region,
+                "blue_green": str(blue_green).lower(),
+                "copy_vectors": str(copy_vectors).lower(),
             },
         )
         # Set the properties on the index for easy access
@@ -0,0 +1,66 @@
+"""Helpers shared by the Bedrock agent action group Lambda handlers"""
+
+import functools
+import time
+from typing import Any, Callable
+from aws_lambda_powertools import Logger
+
+# Scheduled (or harness) invocations send this event to initialize an execution environment without doing any work
+WARMER_EVENT = {"warmer": True}
+
+
+def is_warmer_event(event: dict) -> bool:
+    """Return True if the event is a warmer invocation rather than a Bedrock agent event"""
+    return isinstance(event, dict) and event.get("warmer") is True
+
+
+def warmer_response(init_started: float, init_finished: float) -> dict:
+    """Response for a warmer invocation, reports how long the module init took"""
+    return {"warmed": True, "initMs": round((init_finished - init_started) * 1000, 1), "uptimeS": uptime(init_started)}
+
+
+def uptime(init_started: float) -> float:
+    """Seconds since the execution environment started its init"""
+    return round(time.perf_counter() - init_started, 1)
+
+
+# The app's invoke_agent sends a correlation id per prompt as a session attribute, the agent passes the session
+# attributes to every action group call. Use with `logger.inject_lambda_context(correlation_id_path=...)`
+CORRELATION_ID_ATTRIBUTE = "correlationId"
+CORRELATION_ID_PATH = f"sessionAttributes.{CORRELATION_ID_ATTRIBUTE}"
+
+
+def _field(event: Any, name: str) -> Any:
+    return event.get(name) if isinstance(event, dict) else getattr(event, name, None)
+
+
+def log_span(logger: Logger) -> Callable:
+    """
+    Decorator for action group handlers, logs the duration of each agent call as a span
+    (`span`, `duration_ms`, `response_state`) that `python -m tools.waterfall` joins with the app's spans
+    """
+
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(event: Any, context: Any) -> Any:
+            if is_warmer_event(event):
+                return handler(event, context)
+            start, response_state = time.perf_counter(), "ERROR"
+            try:
+                response = handler(event, context)
+                response_state = response["response"]["functionResponse"].get("responseState") or "OK"
+                return response
+            finally:
+                name = f"{_field(event, 'actionGroup')}.{_field(event, 'function')}"
+                duration_ms = round((time.perf_counter() - start) * 1000, 1)
+                logger.info(
+                    f"{name} took {duration_ms}ms",
+                    span=name,
+                    duration_ms=duration_ms,
+                    response_state=response_state,
+                    session_id=_field(event, "sessionId"),
+                )
+
+        return wrapper
+
+    return decorator
@@ -1,12 +1,13 @@
 #!/usr/bin/env python
 import json
-import time
-from typing import Optional, List
+from typing import Dict, Optional
 import boto3
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.logging.formatter import LambdaPowertoolsFormatter
 from aws_lambda_powertools.utilities.data_classes import event_source, CloudFormationCustomResourceEvent
 from datetime import datetime
+from botocore.exceptions import ClientError
+from cdk.functions.waiter import Waiter, WaiterError
 
 formatter = LambdaPowertoolsFormatter(utc=True, log_record_order=["message", "params"])
 logger = Logger(service="bedrock-code", logger_formatter=formatter)
@@ -14,20 +15,33 @@ logger.setLevel("INFO")
 
 DEFAULT_REGION = "us-east-1"
 AGENT_GROUP_NAME = "code_interpreter"
-TEMP_ALIAS_NAME = f"CFN-TEMP-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+LIST_PAGE_SIZE = 1000  # the maximum page size of the bedrock-agent list apis
+DRAFT_VERSION = "DRAFT"  # the working version of the agent, the only one that can be changed and prepared
+TEMP_ALIAS_PREFIX = "CFN-TEMP-"
 
 
 class Agent:
     """Class to manage Bedrock Agent"""
 
     agent_id: str
+    waiter: Waiter
     _client: boto3.client
     _prepared_agent_details: dict
+    _aliases: Optional[Dict[str, dict]]
+    _action_groups: Optional[Dict[str, dict]]
 
-    def __init__(self, agent_id):
+    def __init__(self, agent_id, waiter: Waiter = None):
+        """
+        param waiter: Waiter: waits between steps in `run()`, defaults to waiting without a deadline
+        """
         self.agent_id = agent_id
+        self.waiter = waiter or Waiter()
         self._client = None
         self._prepared_agent_details = None
+        self._modified = False  # this run changed the agent since it was last prepared
+        # Listed once per run and kept up to date by the create, update and delete calls this class makes
+        self._aliases = None
+        self._action_groups = None
 
     @property
     def client(self) -> boto3.client:
@@ -37,136 +51,120 @@ class Agent:
         return self._client
 
     @property
-    def prepared_agent_details(self) -> dict:
+    def prepared_agent_details(self) -> Optional[dict]:
         """Return the details of the last boto prepare_agent() invocation"""
-        if not self._prepared_agent_details:
-            self._prepared_agent_details = self._prepare_agent()
         return self._prepared_agent_details
 
     @property
     def agent_prepared_version(self) -> str:
-        """Return the version of the agent that was prepared"""
-        return str(self.prepared_agent_details["agentVersion"])
+        """Return the version of the agent that is prepared"""
+        return DRAFT_VERSION
 
     def _get_agent(self) -> dict:
         """Return the agent details using boto get_agent()"""
         return self.client.get_agent(agentId=self.agent_id)["agent"]
 
-    def _get_agent_action_groups(self) -> List[dict]:
-        """Return the agent action groups using boto list_agent_action_groups()"""
-        return self.client.list_agent_action_groups(
-            agentId=self.agent_id, agentVersion=self.prepared_agent_details["agentVersion"]
-        )["actionGroupSummaries"]
-
-    def _get_agent_knowledge_bases(self) -> List[dict]:
-        """Return the agent knowledge bases using boto list_agent_knowledge_bases()"""
-        knowledge_bases = []
+    @property
+    def aliases(self) -> Dict[str, dict]:
+        """Return the agent aliases by name, listed once using boto list_agent_aliases()"""
+        if self._aliases is None:
+            self._aliases = {}
+            paginator = self.client.get_paginator("list_agent_aliases")
+            for page in paginator.paginate(agentId=self.agent_id, PaginationConfig={"PageSize": LIST_PAGE_SIZE}):
+                for alias in page["agentAliasSummaries"]:
+                    self._aliases[alias["agentAliasName"]] = alias
+        return self._aliases
 
-        paginator = self.client.get_paginator("list_agent_knowledge_bases")
-        for page in paginator.paginate(
-            agentId=self.agent_id,
-            agentVersion=self.agent_prepared_version,
-            PaginationConfig={"PageSize": 10},
-        ):
-            knowledge_bases.extend(page["agentKnowledgeBaseSummaries"])
-        return knowledge_bases
+    @property
+    def action_groups(self) -> Dict[str, dict]:
+        """Return the prepared agent's action groups by name, listed once using boto list_agent_action_groups()"""
+        if self._action_groups is None:
+            logger.info("list_agent_action_groups()", agent_id=self.agent_id, agent_version=self.agent_prepared_version)
+            self._action_groups = {}
+            paginator = self.client.get_paginator("list_agent_action_groups")
+            for page in paginator.paginate(
+                agentId=self.agent_id,
+                agentVersion=self.agent_prepared_version,
+                PaginationConfig={"PageSize": LIST_PAGE_SIZE},
+            ):
+                for action_group in page["actionGroupSummaries"]:
+                    self._action_groups[action_group["actionGroupName"]] = action_group
+        return self._action_groups
 
     def _get_alias_id(self, agent_alias_name: str) -> Optional[str]:
-        """Return the agent alias id using boto list_agent_aliases()"""
-        paginator = self.client.get_paginator("list_agent_aliases")
-        for page in paginator.paginate(agentId=self.agent_id):
-            for alias in page["agentAliasSummaries"]:
-                if alias["agentAliasName"] == agent_alias_name:
-                    return alias["agentAliasId"]
-
-    def _wait_for_agent_status(self, status) -> None:
-        """Wait for the agent status to be the desired status"""
-        while self.client.get_agent(agentId=self.agent_id)["agent"]["agentStatus"] != status:
-            time.sleep(2)
-
-    def _wait_for_alias_status(self, agent_alias_name: str, status) -> None:
-        """Wait for the agent alias status to be the desired status"""
+        """Return the agent alias id"""
+        return self.aliases.get(agent_alias_name, {}).get("agentAliasId")
+
+    def _get_alias(self, agent_alias_name: str) -> dict:
+        """Return the current agent alias details using boto get_agent_alias()"""
         agent_alias_id = self._get_alias_id(agent_alias_name)
-        while (
-            self.client.get_agent_alias(agentId=self.agent_id, agentAliasId=agent_alias_id)["agentAlias"][
-                "agentAliasStatus"
-            ]
-            != status
-        ):
-            time.sleep(2)
+        alias = self.client.get_agent_alias(agentId=self.agent_id, agentAliasId=agent_alias_id)["agentAlias"]
+        self.aliases[agent_alias_name] = alias
+        return alias
 
     def _prepare_agent(self) -> dict:
-        """Creates a DRAFT version of the agent, returns the details of the prepared agent"""
+        """Starts creating a DRAFT version of the agent, returns the details of the prepare request"""
         logger.info("prepare_agent() with agent_id", agent_id=self.agent_id)
 
         prepared_agent_details = self.client.prepare_agent(agentId=self.agent_id)
-        self._wait_for_agent_status("PREPARED")
+        self._modified = False
 
         return prepared_agent_details
 
-    def _create_agent_alias(self, agent_alias_name: str) -> dict:
-        """Create an agent alias and wait for it to be prepared"""
-        agent_alias = self.client.create_agent_alias(agentId=self.agent_id, agentAliasName=agent_alias_name)
-        self._wait_for_agent_status("PREPARED")
-        self._wait_for_alias_status(agent_alias_name, "PREPARED")
+    def _create_agent_alias(self, agent_alias_name: str) -> Optional[dict]:
+        """Start creating an agent alias, which creates a new version of the prepared agent"""
+        try:
+            agent_alias = self.client.create_agent_alias(agentId=self.agent_id, agentAliasName=agent_alias_name)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConflictException":
+                raise
+            logger.info(f"Alias {agent_alias_name} already exists but is not listed yet")
+            return None
+        self.aliases[agent_alias_name] = agent_alias["agentAlias"]
         return agent_alias
 
-    def _update_agent_alias(self, agent_alias_name: str, agent_version: int) -> dict:
-        """Update the agent alias with a new agent version returning the updated agent alias result"""
+    def _update_agent_alias(self, agent_alias_name: str, agent_version: str) -> dict:
+        """Start updating the agent alias to a new agent version returning the updated agent alias result"""
         agent_alias = self.client.update_agent_alias(
             agentAliasId=self._get_alias_id(agent_alias_name),
             agentAliasName=agent_alias_name,
             agentId=self.agent_id,
             routingConfiguration=[{"agentVersion": agent_version}],
         )
-        self._wait_for_agent_status("PREPARED")
+        self.aliases[agent_alias_name] = agent_alias["agentAlias"]
         return agent_alias
 
     def _delete_agent_alias(self, agent_alias_name: str) -> None:
         """Delete the agent alias"""
         agent_alias_id = self._get_alias_id(agent_alias_name)
         self.client.delete_agent_alias(agentId=self.agent_id, agentAliasId=agent_alias_id)
+        self.aliases.pop(agent_alias_name, None)
 
     def _get_agent_alias_version_number(self, agent_alias_name: str) -> Optional[str]:
         """Return the agent version number of the agent alias"""
-        result = self.client.get_agent_alias(agentId=self.agent_id, agentAliasId=self._get_alias_id(agent_alias_name))
-        return str(result["agentAlias"]["routingConfiguration"][0]["agentVersion"])
+        alias = self.aliases.get(agent_alias_name, {})
+        if not alias.get("routingConfiguration"):
+            alias = self._get_alias(agent_alias_name)
+        return str(alias["routingConfiguration"][0]["agentVersion"])
 
     def _get_action_group_id(self, action_group_name: str) -> Optional[str]:
         """Return the action group id if it exists"""
-        logger.info("list_agent_action_groups()", agent_id=self.agent_id, agent_version=self.agent_prepared_version)
-        result = self.client.list_agent_action_groups(agentId=self.agent_id, agentVersion=self.agent_prepared_version)[
-            "actionGroupSummaries"
-        ]
-        for action_group in result:
-            if action_group["actionGroupName"] == action_group_name:
-                logger.info(f"code_action_group exists id: {action_group.get('actionGroupId')}")
-                return action_group.get("actionGroupId")
+        if action_group := self.action_groups.get(action_group_name):
+            logger.info(f"code_action_group exists id: {action_group.get('actionGroupId')}")
+            return action_group.get("actionGroupId")
         logger.info(
             f"code_action_group named: '{action_group_name}' not found in agent:{self.agent_id} "
             f"v:{self.agent_prepared_version}"
         )
 
     def _prepare_if_needed(self) -> None:
-        """If the agent has been modified or any components have been added, prepare the agent again"""
-        components = [self._get_agent()]
-        components += self._get_agent_action_groups()
-        components += self._get_agent_knowledge_bases()
-
-        latest_update = max(component["updatedAt"] for component in components)
-        if latest_update > self.prepared_agent_details["preparedAt"]:
+        """Prepare the agent unless this run already prepared it and has not changed it since"""
+        if self._modified or not self._prepared_agent_details:
             self._prepared_agent_details = self._prepare_agent()
+        else:
+            logger.info("Agent prepared by this run and not modified since, skipping the prepare")
 
-    def _update_alias_with_new_version(self, agent_alias_name: str) -> None:
-        """Update the agent alias with a new version of the currently prepaired agent"""
-        if self._get_alias_id(TEMP_ALIAS_NAME):
-            self._delete_agent_alias(TEMP_ALIAS_NAME)
-        self.agent_alias = self._create_agent_alias(TEMP_ALIAS_NAME)  # This creates a version
-        new_agent_version = self._get_agent_alias_version_number(TEMP_ALIAS_NAME)
-        self.agent_alias = self._update_agent_alias(agent_alias_name, new_agent_version)
-        self._delete_agent_alias(TEMP_ALIAS_NAME)
-
-    def create_agent_code_action_group(self, agent_alias_name: str) -> str:
+    def _put_code_action_group(self) -> None:
         """Create or Update the agent code interpreter action group"""
         params = {
             "agentId": self.agent_id,
@@ -177,15 +175,14 @@ class Agent:
         }
         logger.info("create_agent_action_group()", params=params)
         if action_group_id := self._get_action_group_id(AGENT_GROUP_NAME):
-            self.client.update_agent_action_group(actionGroupId=action_group_id, **params)
+            result = self.client.update_agent_action_group(actionGroupId=action_group_id, **params)
         else:
-            self.client.create_agent_action_group(**params)
-        self._prepare_if_needed()
-        self._update_alias_with_new_version(agent_alias_name)
-        return self._get_action_group_id(AGENT_GROUP_NAME)
+            result = self.client.create_agent_action_group(**params)
+        self.action_groups[AGENT_GROUP_NAME] = result["agentActionGroup"]
+        self._modified = True
 
-    def delete_code_action_group(self, agent_alias_name: str) -> None:
-        """Delete the agent code interpreter action group"""
+    def _delete_code_action_group(self) -> None:
+        """Disable and delete the agent code interpreter action group"""
         if action_group_id := self._get_action_group_id(AGENT_GROUP_NAME):
             params = {
                 "actionGroupId": action_group_id,
@@ -205,23 +202,117 @@ class Agent:
             }
             logger.info("delete_agent_action_group() with params", params=params)
             self.client.delete_agent_action_group(**params)
+            self.action_groups.pop(AGENT_GROUP_NAME, None)
+            self._modified = True
+
+    def start(self, request_type: str, agent_alias_name: str) -> dict:
+        """
+        Apply the code interpreter action group change and start preparing the agent, returns immediately
+        param request_type: str: Create, Update or Delete
+        return: dict: the state `step()` needs, json serializable so it can be carried between invocations
+        """
+        if request_type == "Delete":
+            self._delete_code_action_group()
+        else:
+            self._put_code_action_group()
         self._prepare_if_needed()
-        self._update_alias_with_new_version(agent_alias_name)
+        return {
+            "temp_alias_name": f"{TEMP_ALIAS_PREFIX}{datetime.now().strftime('%Y%m%d%H%M%S')}",
+            "previous_version": self._get_agent_alias_version_number(agent_alias_name),
+            "prepared_at": self.prepared_agent_details["preparedAt"].isoformat(),
+        }
+
+    def step(self, agent_alias_name: str, state: dict) -> bool:
+        """
+        Take the next step towards pointing the alias at a new version of the prepared agent, without waiting.
+        The progress is worked out from the agent and alias status, so every step can run in a new invocation:
+        wait for the agent to be prepared, create a temporary alias (which creates the version), wait for it,
+        update the alias to its version, wait for that and delete the temporary alias.
+        param state: dict: returned by `start()`
+        return: bool: True when the alias points at the new version
+        """
+        agent = self._get_agent()
+        _raise_if_failed(f"agent {self.agent_id}", agent["agentStatus"], agent)
+        prepared_at = state.get("prepared_at")
+        if agent["agentStatus"] != "PREPARED" or (
+            prepared_at and agent["preparedAt"] < datetime.fromisoformat(prepared_at)
+        ):
+            logger.info("Waiting for the agent to be prepared", agent_status=agent["agentStatus"])
+            return False
+
+        temp_alias_name = state["temp_alias_name"]
+        if not self._get_alias_id(temp_alias_name):
+            self._get_alias(agent_alias_name)  # refresh the version
+            if self._get_agent_alias_version_number(agent_alias_name) != state["previous_version"]:
+                return True  # an earlier step already moved the alias and deleted the temporary alias
+            logger.info(f"Creating temporary alias {temp_alias_name} to version the agent")
+            self._create_agent_alias(temp_alias_name)
+            return False
+
+        temp_alias = self._get_alias(temp_alias_name)
+        _raise_if_failed(f"agent alias {temp_alias_name}", temp_alias["agentAliasStatus"], temp_alias)
+        if temp_alias["agentAliasStatus"] != "PREPARED":
+            logger.info(f"Waiting for alias {temp_alias_name}", alias_status=temp_alias["agentAliasStatus"])
+            return False
+        new_version = self._get_agent_alias_version_number(temp_alias_name)
+
+        alias = self._get_alias(agent_alias_name)
+        _raise_if_failed(f"agent alias {agent_alias_name}", alias["agentAliasStatus"], alias)
+        if alias["agentAliasStatus"] != "PREPARED":
+            logger.info(f"Waiting for alias {agent_alias_name}", alias_status=alias["agentAliasStatus"])
+            return False
+        if self._get_agent_alias_version_number(agent_alias_name) != new_version:
+            logger.info(f"Updating alias {agent_alias_name} to version {new_version}")
+            self._update_agent_alias(agent_alias_name, new_version)
+            return False
+
+        self._delete_agent_alias(temp_alias_name)
+        logger.info(f"Alias {agent_alias_name} updated to version {new_version}")
+        return True
+
+    def run(self, agent_alias_name: str, state: dict) -> None:
+        """Take steps until the alias points at the new version, waiting between them"""
+        self.waiter.wait(
+            f"agent alias {agent_alias_name} new version", poll=lambda: self.step(agent_alias_name, state), done=bool
+        )
+
+    def create_agent_code_action_group(self, agent_alias_name: str) -> str:
+        """Create or Update the agent code interpreter action group"""
+        self.run(agent_alias_name, self.start("Create", agent_alias_name))
+        return self._get_action_group_id(AGENT_GROUP_NAME)
+
+    def delete_code_action_group(self, agent_alias_name: str) -> None:
+        """Delete the agent code interpreter action group"""
+        self.run(agent_alias_name, self.start("Delete", agent_alias_name))
+
+
+def _raise_if_failed(name: str, status: str, resource: dict) -> None:
+    if status == "FAILED":
+        raise WaiterError(f"{name} failed: {resource.get('failureReasons') or status}")
 
 
 @logger.inject_lambda_context(log_event=True)
 @event_source(data_class=CloudFormationCustomResourceEvent)
 def lambda_handler(event: CloudFormationCustomResourceEvent, context):
+    """Custom resource onEvent handler, starts the change that `is_complete_handler` then polls to completion"""
 
     agent_id = event.resource_properties["agent_id"]
     agent_alias_name = event.resource_properties["agent_alias_name"]
     agent = Agent(agent_id)
     if event.request_type == "Delete":
-        agent.delete_code_action_group(agent_alias_name)
-        return {}
+        return {"Data": agent.start(event.request_type, agent_alias_name)}
     elif event.request_type == "Create" or event.request_type == "Update":
-        action_group_id = agent.create_agent_code_action_group(agent_alias_name)
-        return {"PhysicalResourceId": action_group_id}
+        state = agent.start(event.request_type, agent_alias_name)
+        return {"PhysicalResourceId": agent._get_action_group_id(AGENT_GROUP_NAME), "Data": state}
+
+
+@logger.inject_lambda_context(log_event=True)
+@event_source(data_class=CloudFormationCustomResourceEvent)
+def is_complete_handler(event: CloudFormationCustomResourceEvent, context):
+    """Custom resource isComplete handler, receives the onEvent Data and takes one step each time it is called"""
+
+    agent = Agent(event.resource_properties["agent_id"])
+    return {"IsComplete": agent.step(event.resource_properties["agent_alias_name"], event.get("Data") or {})}
 
 
 if __name__ == "__main__":
@@ -246,5 +337,11 @@ if __name__ == "__main__":
         "ResourceProperties": dict(agent_id=args.agent_id, agent_alias_name=args.agent_alias_name),
     }
 
+    # Call the handlers the way the custom resource provider framework does
     result = lambda_handler(event, MagicMock())
+    Waiter().wait(
+        "code interpreter action group",
+        poll=lambda: is_complete_handler({**event, **result}, MagicMock())["IsComplete"],
+        done=bool,
+    )
     print(json.dumps(result, indent=2))
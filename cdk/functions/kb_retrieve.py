@@ -0,0 +1,167 @@
+# Everything at module level runs once per execution environment (Lambda init), keep per request work in the handler
+import time
+
+INIT_STARTED = time.perf_counter()  # before the heavy imports below so the warmer can report the full init
+
+import json
+import os
+from typing import Optional
+
+import boto3
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from cdk.functions.action_group import CORRELATION_ID_PATH, is_warmer_event, log_span, warmer_response
+from cdk.functions.retrieval_cache import RetrievalCache, cache_key, latest_ingestion
+from cdk.models import BedrockEvent, BedrockResponseEvent
+
+logger = Logger(service="kb_retrieve", level="INFO", log_uncaught_exceptions=True)
+metrics = Metrics(namespace="BedrockAgents", service="kb_retrieve")
+
+KB_ID_ENV_NAME = "KB_ID"
+DATASOURCE_ID_ENV_NAME = "DATASOURCE_ID"
+NUMBER_OF_RESULTS = int(os.getenv("NUMBER_OF_RESULTS", "5"))
+MAX_RESULT_CHARS = 20000  # like web_search, keep the response within what the agent accepts
+
+
+_clients = {}
+
+
+def client(service: str) -> boto3.client:
+    """Return a boto3 client, created once per execution environment"""
+    if service not in _clients:
+        _clients[service] = boto3.client(service)
+    return _clients[service]
+
+
+def knowledge_base_generation() -> Optional[str]:
+    """Changes whenever an ingestion job of the knowledge base's data source completes"""
+    return latest_ingestion(client("bedrock-agent"), os.getenv(KB_ID_ENV_NAME), os.getenv(DATASOURCE_ID_ENV_NAME))
+
+
+# Hot questions are answered from memory instead of a Titan embedding and a Pinecone query
+CACHE = RetrievalCache(
+    ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", "900")),
+    max_entries=int(os.getenv("RETRIEVAL_CACHE_SIZE", "512")),
+    check_interval=float(os.getenv("RETRIEVAL_CACHE_CHECK_INTERVAL", "60")),
+    generation=knowledge_base_generation if os.getenv(DATASOURCE_ID_ENV_NAME) else None,
+)
+
+
+def retrieve(knowledge_base_id: str, query: str, configuration: dict) -> str:
+    """Call the knowledge base and return the results as the json the agent receives"""
+    resp = client("bedrock-agent-runtime").retrieve(
+        knowledgeBaseId=knowledge_base_id, retrievalQuery={"text": query}, retrievalConfiguration=configuration
+    )
+    results = [
+        {
+            "content": result.get("content", {}).get("text"),
+            "uri": result.get("location", {}).get("s3Location", {}).get("uri"),
+            "score": result.get("score"),
+        }
+        for result in resp.get("retrievalResults", [])
+    ]
+    return json.dumps(results)[:MAX_RESULT_CHARS]
+
+
+def cached_retrieve(knowledge_base_id: str, query: str, retrieval_filter: Optional[dict] = None) -> str:
+    vector_search = {"numberOfResults": NUMBER_OF_RESULTS}
+    if retrieval_filter:
+        vector_search["filter"] = retrieval_filter
+    configuration = {"vectorSearchConfiguration": vector_search}
+    key = cache_key(knowledge_base_id, query, configuration)
+
+    start = time.perf_counter()
+    response, hit = CACHE.get_or_retrieve(key, lambda: retrieve(knowledge_base_id, query, configuration))
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    metrics.add_metric(name="RetrievalCacheHit" if hit else "RetrievalCacheMiss", unit=MetricUnit.Count, value=1)
+    metrics.add_metric(name="RetrievalLatency", unit=MetricUnit.Milliseconds, value=latency_ms)
+    logger.info(
+        "Retrieval cache hit" if hit else "Retrieval cache miss",
+        latency_ms=round(latency_ms, 1),
+        hit_rate=round(CACHE.stats.hit_rate, 3),
+        entries=len(CACHE),
+    )
+    return response
+
+
+def warm_up() -> None:
+    """Run the event validation and response building once during init so the first agent call doesnt pay for it"""
+    event = BedrockEvent.from_event(
+        dict(
+            messageVersion="1.0",
+            agent={"name": "warmer", "id": "warmer", "alias": "warmer", "version": "warmer"},
+            inputText="",
+            sessionId="warmer",
+            actionGroup="knowledge_base",
+            function="retrieve",
+            parameters=[{"name": "query", "type": "string", "value": "warmer"}],
+            sessionAttributes={},
+            promptSessionAttributes={},
+        )
+    )
+    BedrockResponseEvent.response_dict_from_event(event, "")
+    CACHE.check_generation()
+
+
+@metrics.log_metrics
+@logger.inject_lambda_context(correlation_id_path=CORRELATION_ID_PATH)
+@log_span(logger)
+def lambda_handler(event: dict, context) -> dict:
+
+    if is_warmer_event(event):
+        # Scheduled warmer invocation, the init above already did the expensive work
+        return warmer_response(INIT_STARTED, INIT_FINISHED)
+
+    # Validate the event once, the responses below reuse the parsed event
+    bedrock_event = BedrockEvent.from_event(event)
+
+    if bedrock_event.function.lower() != "retrieve":
+        error_msg = f"Invalid function: {bedrock_event.function}"
+        logger.error(error_msg)
+        return BedrockResponseEvent.response_dict_from_event(bedrock_event, error_msg, response_state="FAILURE")
+
+    parameters = {parameter.name: parameter.value for parameter in bedrock_event.parameters}
+    try:
+        retrieval_filter = json.loads(parameters["filter"]) if parameters.get("filter") else None
+    except json.JSONDecodeError:
+        return BedrockResponseEvent.response_dict_from_event(
+            bedrock_event, "filter must be a json retrieval filter", response_state="REPROMPT"
+        )
+    response = cached_retrieve(os.getenv(KB_ID_ENV_NAME), parameters["query"], retrieval_filter)
+    return BedrockResponseEvent.response_dict_from_event(bedrock_event, response)
+
+
+warm_up()
+INIT_FINISHED = time.perf_counter()
+
+
+if __name__ == "__main__":
+    import argparse
+    from unittest.mock import MagicMock
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query", help="Query string")
+    parser.add_argument("-n", "--repeat", type=int, default=2, help="ask the same question this many times")
+    args = parser.parse_args()
+    event = BedrockEvent(
+        messageVersion="1.0",
+        agent={"name": "kb_retrieve", "id": "kb_retrieve", "alias": "kb_retrieve", "version": "1.0"},
+        inputText="input_text",
+        sessionId="session_id",
+        actionGroup="knowledge_base",
+        function="retrieve",
+        parameters=[{"name": "query", "type": "string", "value": args.query}],
+        sessionAttributes={},
+        promptSessionAttributes={},
+    ).model_dump()
+
+    for _ in range(args.repeat):
+        resp_dict = lambda_handler(event, MagicMock())
+    response = BedrockResponseEvent.model_validate(resp_dict)
+    print("----")
+    print(response.get_response_body())
+    print(CACHE.stats)
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 import os
 import json
+from typing import Optional
 from pinecone import Pinecone, ServerlessSpec
+from pinecone.exceptions import NotFoundException
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities import parameters
+from cdk.functions import secret_cache
+from cdk.functions.waiter import Waiter
 
 logger = Logger(service="pinecone-index")
 logger.setLevel("INFO")
@@ -13,63 +16,166 @@ DEFAULT_CLOUD = "aws"
 DEFAULT_METRIC = "cosine"
 DEFAULT_DIMENSION = 1024
 PINECONE_API_KEY_SECRET_ENV_NAME = "PINECONE_API_KEY_SECRET_NAME"
+PINECONE_API_KEY_ENV_NAME = "PINECONE_API_KEY"
+FAILED_STATES = ("InitializationFailed", "Terminating")
+MAX_NAME_LENGTH = 45
+
+# Fetch the api key during init, requests are served from the cache
+secret_cache.SECRETS.prefetch(os.getenv(PINECONE_API_KEY_SECRET_ENV_NAME))
+
+
+def get_api_key() -> str:
+    return secret_cache.get_secret_value(
+        os.getenv(PINECONE_API_KEY_SECRET_ENV_NAME), key="apiKey", env_var=PINECONE_API_KEY_ENV_NAME
+    )
+
+
+def describe_index(pc: Pinecone, name: str) -> dict:
+    logger.info(f"Describing index '{name}'")
+    description = pc.describe_index(name).to_dict()
+    logger.info(f"Index '{name}' description", description=description)
+    return description
+
+
+def wait_until_ready(pc: Pinecone, name: str, waiter: Waiter) -> dict:
+    """Wait for the index to be ready to serve, returns its description"""
+    return waiter.wait(
+        f"pinecone index '{name}' ready",
+        poll=lambda: pc.describe_index(name).to_dict(),
+        done=lambda index: index["status"]["ready"],
+        failed=lambda index: index["status"]["state"] in FAILED_STATES and index["status"]["state"],
+    )
+
+
+def delete_index(pc: Pinecone, name: str, host: Optional[str] = None) -> dict:
+    """Delete the index if it exists, when `host` is given only if it is still that index (not a newer one)"""
+    logger.info(f"Deleting index '{name}'")
+    index = next(filter(lambda i: i.name == name, pc.list_indexes().indexes), None)
+    if index is None:
+        logger.info(f"Index '{name}' does not exist, doing nothing")
+    elif host and index.host != host:
+        logger.info(f"Index '{name}' was replaced by '{index.host}', doing nothing")
+    else:
+        result = pc.delete_index(name)
+        logger.info(f"Index '{name}' was deleted", result=result)
+    return {"name": name, "host": "none"}
+
+
+def find_index(pc: Pinecone, name: str, props: dict) -> Optional[dict]:
+    """The description of the index `name` if it exists with the dimension, metric, cloud and region of `props`"""
+    try:
+        description = pc.describe_index(name).to_dict()
+    except NotFoundException:
+        return None
+    serverless = description.get("spec", {}).get("serverless", {})
+    current = dict(description, cloud=serverless.get("cloud"), region=serverless.get("region"))
+    if any(str(current.get(key)) != str(props[key]) for key in ("dimension", "metric", "cloud", "region")):
+        logger.info(f"Index '{name}' exists with other properties, not reusing it", description=description)
+        return None
+    return description
+
+
+def create_index(pc: Pinecone, name: str, dimension: int, metric: str, spec: ServerlessSpec, waiter: Waiter) -> dict:
+    logger.info(f"Creating index '{name}'", dimension=dimension, metric=metric)
+    result = pc.create_index(name=name, dimension=dimension, metric=metric, spec=spec)
+    logger.info(f"Index '{name}' was created", result=result)
+    return wait_until_ready(pc, name, waiter)
+
+
+def copy_vectors(pc: Pinecone, source_host: str, target_host: str) -> int:
+    """Copy every vector (values and metadata) in every namespace of the source index, returns the count"""
+    source, target = pc.Index(host=source_host), pc.Index(host=target_host)
+    copied = 0
+    for namespace in source.describe_index_stats().namespaces or {"": None}:
+        for ids in source.list(namespace=namespace):  # pages of ids
+            vectors = list(source.fetch(ids=ids, namespace=namespace).vectors.values())
+            target.upsert(vectors=vectors, namespace=namespace, show_progress=False)
+            copied += len(vectors)
+    logger.info(f"Copied {copied} vectors from '{source_host}' to '{target_host}'")
+    return copied
+
+
+def blue_green_name(name: str, dimension: int, metric: str) -> str:
+    """Name for the replacement index, unique for the properties that force a replacement"""
+    return f"{name}-{metric}-{dimension}"[:MAX_NAME_LENGTH]
+
+
+def update_index(pc: Pinecone, props: dict, old_props: dict, physical_id: str, blue_green: bool, waiter: Waiter):
+    """
+    Update the index in place when possible, otherwise replace it.
+    Pinecone cant change the dimension, metric, cloud or region of an index, only those changes (or a new name)
+    need a new index. With `blue_green` the new index is created next to the old one, vectors are copied when the
+    dimension is unchanged and CloudFormation deletes the old index once the stack has moved to the new one.
+    An existing index with the target name and properties is reused, ie. the old index when a rollback goes back to it.
+    """
+    host, _, current_name = physical_id.partition("/")
+    name, spec = props["name"], props["spec"]
+    recreate = [key for key in ("dimension", "metric", "cloud", "region") if str(props[key]) != str(old_props.get(key))]
+    if not recreate and name == old_props.get("name"):
+        logger.info(f"Index '{current_name}' is unchanged")
+        return describe_index(pc, current_name)
+    if not recreate or blue_green:
+        # A new index beside the current one, the physical id changes so CloudFormation deletes the current one
+        if recreate:
+            name = blue_green_name(name, props["dimension"], props["metric"])
+        if name != current_name and find_index(pc, name, props):
+            logger.info(f"Reusing index '{name}'")
+            return wait_until_ready(pc, name, waiter)
+        index = create_index(pc, name, props["dimension"], props["metric"], spec, waiter)
+        if str(props["dimension"]) == str(old_props.get("dimension")) and props["copy_vectors"]:
+            copy_vectors(pc, host, index["host"])
+        return index
+    if name != current_name and find_index(pc, name, props):
+        logger.info(f"Reusing index '{name}' instead of replacing '{current_name}'")
+        return wait_until_ready(pc, name, waiter)
+    logger.info(f"Replacing index '{current_name}'", changed=recreate)
+    delete_index(pc, current_name)
+    waiter.wait(
+        f"pinecone index '{current_name}' deleted",
+        poll=lambda: [i.name for i in pc.list_indexes().indexes],
+        done=lambda names: current_name not in names,
+    )
+    return create_index(pc, name, props["dimension"], props["metric"], spec, waiter)
+
+
+def get_props(properties: dict) -> dict:
+    return dict(
+        name=properties["name"],
+        dimension=int(properties.get("dimension", DEFAULT_DIMENSION)),
+        metric=properties.get("metric", DEFAULT_METRIC),
+        cloud=properties.get("cloud", DEFAULT_CLOUD),
+        region=properties.get("region", DEFAULT_REGION),
+        copy_vectors=str(properties.get("copy_vectors", "true")).lower() == "true",
+    )
 
 
 @logger.inject_lambda_context(log_event=True)
 def lambda_handler(event, context):
-    secret_name = os.getenv(PINECONE_API_KEY_SECRET_ENV_NAME)
-    logger.info(f"secret_name: {secret_name}")
-    api_key: str = os.getenv("PINECONE_API_KEY") or json.loads(parameters.get_secret(secret_name)).get("apiKey")
+    logger.info(f"secret_name: {os.getenv(PINECONE_API_KEY_SECRET_ENV_NAME)}")
+    api_key = get_api_key()
     logger.info(f"api_key: {api_key[:5]}...")
 
     # Create a pinecone client
     pc = Pinecone(api_key=api_key)
-    name = event["ResourceProperties"]["name"]
-
-    props = dict(
-        name=name,
-        dimension=int(event["ResourceProperties"].get("dimension", DEFAULT_DIMENSION)),
-        metric=event["ResourceProperties"].get("metric", DEFAULT_METRIC),
-        spec=ServerlessSpec(
-            cloud=event["ResourceProperties"].get("cloud", DEFAULT_CLOUD),
-            region=event["ResourceProperties"].get("region", DEFAULT_REGION),
-        ),
-    )
-
-    def describe_index(name: str) -> dict:
-        logger.info(f"Describing index '{name}'")
-        description = pc.describe_index(name).to_dict()
-        logger.info(f"Index '{name}' description", description=description)
-        return description
-
-    def delete_index(name: str) -> dict:
-        logger.info(f"Deleting index '{name}'")
-        index_exists = any(filter(lambda i: i.name == name, pc.list_indexes().indexes))
-        if index_exists:
-            result = pc.delete_index(name)
-            logger.info(f"Index '{name}' was deleted", result=result)
-        else:
-            logger.info(f"Index '{name}' does not exist, doing nothing")
-        return {"name": name, "host": "none"}
-
-    def create_index(name: str, dimension: int, metric: str, spec: ServerlessSpec) -> dict:
-        logger.info(f"Creating index '{name}'", props=props)
-        result = pc.create_index(name=name, dimension=dimension, metric=metric, spec=spec)
-        logger.info(f"Index '{name}' was created", result=result)
-        return describe_index(name)
-
-    def replace_index(name: str, dimension: int, metric: str, spec: ServerlessSpec) -> dict:
-        logger.info(f"Replacing index '{name}'")
-        delete_index(name)
-        return create_index(name, dimension, metric, spec)
+    # Fail with a clear error before the Lambda times out, rather than leaving CloudFormation waiting
+    waiter = Waiter.for_lambda_context(context)
+    props = get_props(event["ResourceProperties"])
+    props["spec"] = ServerlessSpec(cloud=props["cloud"], region=props["region"])
+    physical_id = event.get("PhysicalResourceId", "")
 
     if event.get("RequestType") == "Delete":
-        index = delete_index(name)
+        if "/" in physical_id:
+            host, _, name = physical_id.partition("/")
+            delete_index(pc, name, host)
+        else:  # the create failed before reporting the index
+            delete_index(pc, props["name"])
         return {}
     elif event.get("RequestType") == "Create":
-        index = create_index(**props)
+        index = create_index(pc, props["name"], props["dimension"], props["metric"], props["spec"], waiter)
     elif event.get("RequestType") == "Update":
-        index = replace_index(**props)
+        old_props = get_props(event["OldResourceProperties"])
+        blue_green = str(event["ResourceProperties"].get("blue_green", "false")).lower() == "true"
+        index = update_index(pc, props, old_props, physical_id, blue_green, waiter)
     return {"PhysicalResourceId": index["host"] + "/" + index["name"], "Data": index}
 
 
@@ -100,14 +206,32 @@ if __name__ == "__main__":
         "-r", "--region", default=DEFAULT_REGION, help=f"region for the index. default: {DEFAULT_REGION}"
     )
     parser.add_argument("-c", "--cloud", default=DEFAULT_CLOUD, help=f"cloud for the index. default: {DEFAULT_CLOUD}")
+    parser.add_argument(
+        "--blue_green", action="store_true", help="on update, create any replacement index next to the current one"
+    )
 
     args = parser.parse_args()
     event = {
         "RequestType": args.action.capitalize(),
         "ResourceProperties": dict(
-            name=args.name, dimension=args.dimension, metric=args.metric, cloud=args.cloud, region=args.region
+            name=args.name,
+            dimension=args.dimension,
+            metric=args.metric,
+            cloud=args.cloud,
+            region=args.region,
+            blue_green=str(args.blue_green).lower(),
         ),
     }
+    if args.action == "update":
+        # Update from the properties of the existing index
+        current = Pinecone(api_key=get_api_key()).describe_index(args.name).to_dict()
+        event["PhysicalResourceId"] = current["host"] + "/" + current["name"]
+        event["OldResourceProperties"] = dict(
+            name=current["name"],
+            dimension=current["dimension"],
+            metric=current["metric"],
+            **current["spec"]["serverless"],
+        )
 
     result = lambda_handler(event, MagicMock())
     print(json.dumps(result, indent=2))
@@ -0,0 +1,352 @@
+"""
+Client side rate limiting for upstream apis called from action group handlers.
+
+* `RateLimiter` is a token bucket whose rate adapts to the upstream: it backs off multiplicatively on throttles (429)
+  and recovers additively on success.
+* The bucket state lives in a pluggable `BucketStore`, `InMemoryBucketStore` limits one execution environment while
+  `DynamoDBBucketStore` shares the bucket across every container of the function.
+* `Coalescer` lets identical in-flight calls of one execution environment share a single upstream call, and
+  `DynamoDBCoalescer` extends it across containers with an in-flight marker and a short lived result in the same table.
+"""
+
+import hashlib
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Optional, Tuple, TypeVar
+import boto3
+from botocore.exceptions import ClientError
+from aws_lambda_powertools import Logger
+
+logger = Logger(service="rate_limit")
+
+T = TypeVar("T")
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a token would not be available within the allowed wait"""
+
+
+class BucketStore(ABC):
+    """Holds token bucket state"""
+
+    @abstractmethod
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        """Take a token from the bucket `key`, returning the seconds to wait until it may be used (0 if now)"""
+
+    @abstractmethod
+    def refund(self, key: str, capacity: float) -> None:
+        """Give back a token taken by a call that wont be sent, never above `capacity`"""
+
+
+def _take(tokens: float, updated_at: float, now: float, rate: float, capacity: float) -> Tuple[float, float]:
+    """Refill the bucket since `updated_at` and take a token, returning the new token count and the wait"""
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate) - 1
+    return tokens, (-tokens / rate if tokens < 0 else 0.0)
+
+
+class InMemoryBucketStore(BucketStore):
+    """Token buckets for a single execution environment"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        with self._lock:
+            now = self._clock()
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens, wait = _take(tokens, updated_at, now, rate, capacity)
+            self._buckets[key] = (tokens, now)
+            return wait
+
+    def refund(self, key: str, capacity: float) -> None:
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated_at = self._buckets[key]
+                self._buckets[key] = (min(capacity, tokens + 1), updated_at)
+
+
+class DynamoDBBucketStore(BucketStore):
+    """
+    Token buckets shared across containers in a DynamoDB table with a string partition key `pk`.
+    Updates are optimistic (conditional on the previous `updatedAt`), if the table is unavailable the store fails
+    open so that rate limiting never breaks the tool.
+    """
+
+    def __init__(self, table_name: str, client=None, clock: Callable[[], float] = time.time, max_attempts=5):
+        self.table_name = table_name
+        self._client = client
+        self._clock = clock
+        self.max_attempts = max_attempts
+
+    @property
+    def client(self):
+        if not self._client:
+            self._client = boto3.client("dynamodb")
+        return self._client
+
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        for _ in range(self.max_attempts):
+            try:
+                item = self.client.get_item(TableName=self.table_name, Key={"pk": {"S": key}}, ConsistentRead=True)
+                now = self._clock()
+                if item := item.get("Item"):
+                    previous = item["updatedAt"]["N"]
+                    tokens, wait = _take(float(item["tokens"]["N"]), float(previous), now, rate, capacity)
+                    condition = {"ConditionExpression": "updatedAt = :previous"}
+                    condition["ExpressionAttributeValues"] = {":previous": {"N": previous}}
+                else:
+                    tokens, wait = _take(capacity, now, now, rate, capacity)
+                    condition = {"ConditionExpression": "attribute_not_exists(pk)"}
+                self.client.put_item(
+                    TableName=self.table_name,
+                    Item={"pk": {"S": key}, "tokens": {"N": repr(tokens)}, "updatedAt": {"N": repr(now)}},
+                    **condition,
+                )
+                return wait
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                    continue  # another container took a token first, try again with its state
+                logger.exception(f"Rate limit store '{self.table_name}' unavailable, not limiting")
+                return 0.0
+            except Exception:
+                logger.exception(f"Rate limit store '{self.table_name}' unavailable, not limiting")
+                return 0.0
+        logger.warning(f"Rate limit bucket '{key}' is contended, not limiting", attempts=self.max_attempts)
+        return 0.0
+
+    def refund(self, key: str, capacity: float) -> None:
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"pk": {"S": key}},
+                UpdateExpression="ADD tokens :one",
+                ConditionExpression="attribute_exists(pk) AND tokens <= :full",  # full buckets stay full
+                ExpressionAttributeValues={":one": {"N": "1"}, ":full": {"N": repr(capacity - 1)}},
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                logger.exception(f"Rate limit store '{self.table_name}' unavailable, token not refunded")
+        except Exception:
+            logger.exception(f"Rate limit store '{self.table_name}' unavailable, token not refunded")
+
+
+class RateLimiter:
+    """Token bucket rate limiter with adaptive (AIMD) rate and jittered exponential backoff for throttles"""
+
+    def __init__(
+        self,
+        key: str,
+        rate: float,
+        capacity: float,
+        store: Optional[BucketStore] = None,
+        min_rate: float = 0.1,
+        decrease_factor: float = 0.5,
+        increase_step: float = 0.1,
+        base_backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        param key: str: bucket name, limiters with the same key and store share the bucket
+        param rate: float: tokens (requests) per second, also the maximum the adaptive rate recovers to
+        param capacity: float: bucket size, the burst allowed after an idle period
+        param min_rate: float: the adaptive rate never drops below this
+        param decrease_factor: float: rate multiplier applied on every throttle
+        param increase_step: float: requests per second added back on every success
+        """
+        self.key = key
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.store = store or InMemoryBucketStore()
+        self.min_rate = min_rate
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait: Optional[float] = None) -> float:
+        """Block until a request may be sent, returning the seconds waited"""
+        wait = self.store.take(self.key, self.rate, self.capacity)
+        if max_wait is not None and wait > max_wait:
+            # the rejected call isnt sent, without the refund rejections would use up the budget under overload
+            self.store.refund(self.key, self.capacity)
+            raise RateLimitTimeout(f"'{self.key}' would wait {wait:.2f}s, more than the allowed {max_wait:.2f}s")
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Slow down after a throttle and return the seconds to wait before retrying"""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        logger.warning(f"'{self.key}' throttled, rate reduced to {self.rate:.2f}/s", attempt=attempt)
+        try:
+            return min(self.max_backoff, float(retry_after))
+        except (TypeError, ValueError):
+            # full jitter so that throttled containers dont retry in lock step
+            return random.uniform(0, min(self.max_backoff, self.base_backoff * 2**attempt))
+
+
+class Coalescer:
+    """Share one call between identical concurrent calls (single flight)"""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T], max_wait: Optional[float] = None) -> T:
+        """
+        Call `fn`, or wait for the identical call in flight and return its result
+        param max_wait: float: seconds to wait for a call made by another container, the calls of this one are awaited
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            logger.info("Coalesced with an in-flight call", key=str(key))
+            return future.result()
+        try:
+            future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
+
+
+class DynamoDBCoalescer(Coalescer):
+    """
+    Share one call between identical calls of every container, in a DynamoDB table with a string partition key `pk`.
+    The first call puts an in-flight marker (conditional put) and replaces it with its result for `result_ttl` seconds,
+    the others poll for that result. Only `str` results are shared, and if the leader fails, takes longer than
+    `max_wait` or the table is unavailable the others make their own call.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        client=None,
+        lease: float = 30.0,
+        result_ttl: float = 60.0,
+        poll_interval: float = 0.2,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        param lease: float: seconds after which the marker of a leader that never finished (crashed) is ignored
+        param result_ttl: float: seconds a result is shared after the call, also to identical calls made later
+        param poll_interval: float: seconds between reads of a follower waiting for the result
+        """
+        super().__init__()
+        self.table_name = table_name
+        self._client = client
+        self.lease = lease
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._sleep = sleep
+
+    @property
+    def client(self):
+        if not self._client:
+            self._client = boto3.client("dynamodb")
+        return self._client
+
+    def do(self, key: Hashable, fn: Callable[[], T], max_wait: Optional[float] = None) -> T:
+        # the identical calls of this container wait in memory for the one that coordinates with the others
+        return super().do(key, lambda: self._do(key, fn, max_wait))
+
+    def _do(self, key: Hashable, fn: Callable[[], T], max_wait: Optional[float]) -> T:
+        pk = "coalesce#" + hashlib.sha256(repr(key).encode()).hexdigest()
+        now = self._clock()
+        expires_at = {"N": repr(now + self.lease)}
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={"pk": {"S": pk}, "expiresAt": expires_at},
+                ConditionExpression="attribute_not_exists(pk) OR expiresAt < :now",
+                ExpressionAttributeValues={":now": {"N": repr(now)}},
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                logger.exception(f"Coalescing table '{self.table_name}' unavailable, not coalescing")
+                return fn()
+            result = self._wait(pk, max_wait)  # another container is making the call, or made it recently
+            if result is None:
+                return fn()
+            logger.info("Coalesced with a call of another container", key=str(key))
+            return result
+        except Exception:
+            logger.exception(f"Coalescing table '{self.table_name}' unavailable, not coalescing")
+            return fn()
+
+        try:
+            result = fn()
+        except Exception:
+            self._release(pk, expires_at)
+            raise
+        if not isinstance(result, str):
+            self._release(pk, expires_at)
+            return result
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "pk": {"S": pk},
+                    "result": {"S": result},
+                    "expiresAt": {"N": repr(self._clock() + self.result_ttl)},
+                },
+            )
+        except Exception:
+            logger.exception(f"Coalescing table '{self.table_name}' unavailable, result not shared")
+            self._release(pk, expires_at)
+        return result
+
+    def _wait(self, pk: str, max_wait: Optional[float]) -> Optional[str]:
+        """The result of the call made by another container, None if there wont be one in time"""
+        until = self._clock() + (self.lease if max_wait is None else min(max_wait, self.lease))
+        while True:
+            try:
+                item = self.client.get_item(TableName=self.table_name, Key={"pk": {"S": pk}}, ConsistentRead=True)
+            except Exception:
+                logger.exception(f"Coalescing table '{self.table_name}' unavailable, not coalescing")
+                return None
+            item = item.get("Item")
+            if item is None or float(item["expiresAt"]["N"]) < self._clock():
+                return None  # the leader failed or crashed
+            if "result" in item:
+                return item["result"]["S"]
+            if self._clock() + self.poll_interval > until:
+                logger.warning("Gave up waiting for the call of another container", max_wait=max_wait)
+                return None
+            self._sleep(self.poll_interval)
+
+    def _release(self, pk: str, expires_at: dict) -> None:
+        """Delete the in-flight marker so the waiting containers make their own call"""
+        try:
+            self.client.delete_item(
+                TableName=self.table_name,
+                Key={"pk": {"S": pk}},
+                ConditionExpression="expiresAt = :expires",  # still this call's marker
+                ExpressionAttributeValues={":expires": expires_at},
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                logger.exception(f"Coalescing table '{self.table_name}' unavailable, marker not released")
+        except Exception:
+            logger.exception(f"Coalescing table '{self.table_name}' unavailable, marker not released")
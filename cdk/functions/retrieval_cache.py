@@ -0,0 +1,153 @@
+"""
+Per execution environment cache of knowledge base `Retrieve` results.
+
+Results are keyed on the normalized query, the knowledge base id and the retrieval configuration (filter, number of
+results). An entry is served until its TTL expires or the knowledge base's data changes. Data changes are detected by a
+"generation", ie. the completion time of the latest ingestion job, which is looked up at most once per
+`check_interval` so that the check costs one `ListIngestionJobs` call per interval rather than one per request.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Tuple
+from aws_lambda_powertools import Logger
+
+logger = Logger(service="retrieval_cache")
+
+DEFAULT_TTL = 15 * 60  # seconds a result is served
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_CHECK_INTERVAL = 60  # seconds between ingestion job lookups
+
+WORD_PATTERN = re.compile(r"\w+")
+_UNKNOWN = object()  # generation before the first lookup, the cached entries are assumed current
+
+
+def normalize_query(query: str) -> str:
+    """Lower case words only, so questions that differ in case, spacing or punctuation share an entry"""
+    return " ".join(WORD_PATTERN.findall(query.lower()))
+
+
+def cache_key(knowledge_base_id: str, query: str, configuration: Optional[dict] = None) -> str:
+    key = json.dumps([knowledge_base_id, normalize_query(query), configuration or {}], sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def latest_ingestion(client, knowledge_base_id: str, data_source_id: str) -> Optional[str]:
+    """
+    Return the completion time of the data source's latest complete ingestion job, None if there is none
+    param client: boto3.client: bedrock-agent
+    """
+    jobs = client.list_ingestion_jobs(
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        filters=[{"attribute": "STATUS", "operator": "EQ", "values": ["COMPLETE"]}],
+        sortBy={"attribute": "STARTED_AT", "order": "DESCENDING"},
+        maxResults=1,
+    ).get("ingestionJobSummaries", [])
+    return str(jobs[0]["updatedAt"]) if jobs else None
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0  # misses because the entry was older than the TTL
+    invalidations: int = 0  # times the cache was cleared because an ingestion job completed
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+
+
+class RetrievalCache:
+    """LRU cache with a TTL that is cleared when the knowledge base generation changes"""
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+        generation: Optional[Callable[[], Optional[str]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        param generation: Callable: returns a value that changes when the knowledge base data changes, ie.
+        `latest_ingestion()`. Without it entries are only expired by the TTL
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._generation_fn = generation
+        self._clock = clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation: Any = _UNKNOWN
+        self._next_check = 0.0
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def check_generation(self, force: bool = False) -> None:
+        """Clear the cache if an ingestion job completed since the last check, errors keep the cache"""
+        if not self._generation_fn or (not force and self._clock() < self._next_check):
+            return
+        self._next_check = self._clock() + self.check_interval
+        try:
+            generation = self._generation_fn()
+        except Exception:
+            logger.exception("Failed to look up the knowledge base generation, keeping the cached results")
+            return
+        with self._lock:
+            if generation != self._generation:
+                if self._generation is not _UNKNOWN and self._entries:
+                    logger.info("Knowledge base changed, clearing retrieval cache", entries=len(self._entries))
+                    self.stats.invalidations += 1
+                    self._entries.clear()
+                self._generation = generation
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.stats.invalidations += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        self.check_generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry.value
+            if entry:
+                del self._entries[key]
+                self.stats.expired += 1
+            self.stats.misses += 1
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(value=value, expires_at=self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_retrieve(self, key: str, retrieve: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return the cached value or the result of `retrieve()` (which is cached), and whether it was a hit"""
+        value = self.get(key)
+        if value is not None:
+            return value, True
+        value = retrieve()
+        self.put(key, value)
+        return value, False
@@ -0,0 +1,137 @@
+"""
+Per execution environment cache of Secrets Manager secrets.
+
+Secrets are fetched once (ideally during the Lambda init by `prefetch()`), served from memory afterwards and refreshed
+on a background thread shortly before they expire, so no request waits on Secrets Manager. If a refresh fails the
+cached value keeps being served until a later refresh succeeds.
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.utilities import parameters
+
+logger = Logger(service="secret_cache")
+
+DEFAULT_TTL = 15 * 60  # seconds a secret is served before it is considered expired
+DEFAULT_REFRESH_MARGIN = 5 * 60  # start refreshing in the background this many seconds before expiry
+DEFAULT_RETRY_INTERVAL = 30  # seconds between background refresh attempts after a failure
+
+
+def fetch_secret(secret_name: str) -> str:
+    """Fetch the secret string from Secrets Manager, bypassing the powertools cache"""
+    return parameters.get_secret(secret_name, force_fetch=True)
+
+
+@dataclass
+class _Entry:
+    value: str
+    fetched_at: float
+    refresh_at: float
+    refreshing: bool = False
+    parsed: Optional[dict] = field(default=None, repr=False)
+
+
+class SecretCache:
+    """Cache secrets by name with a TTL and background refresh before expiry"""
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+        retry_interval: float = DEFAULT_RETRY_INTERVAL,
+        fetcher: Callable[[str], str] = fetch_secret,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self._fetcher = fetcher
+        self._clock = clock
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, secret_name: Optional[str]) -> None:
+        """Fetch a secret during init so that the first request doesnt have to, errors are logged not raised"""
+        if not secret_name:
+            return
+        try:
+            self._fetch(secret_name)
+        except Exception:
+            logger.exception(f"Failed to prefetch secret '{secret_name}', it will be fetched on first use")
+
+    def get(self, secret_name: str) -> str:
+        """Return the cached secret string, fetching it only if it has never been fetched"""
+        return self._get_entry(secret_name).value
+
+    def get_json(self, secret_name: str) -> dict:
+        """Return the cached secret parsed as json, parsed once per fetched value"""
+        entry = self._get_entry(secret_name)
+        if entry.parsed is None:
+            entry.parsed = json.loads(entry.value)
+        return entry.parsed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _get_entry(self, secret_name: str) -> _Entry:
+        entry = self._entries.get(secret_name)
+        if entry is None:
+            return self._fetch(secret_name)
+        if self._clock() >= entry.refresh_at:
+            self._refresh_in_background(secret_name, entry)
+        return entry
+
+    def _fetch(self, secret_name: str) -> _Entry:
+        start = self._clock()
+        value = self._fetcher(secret_name)
+        now = self._clock()
+        entry = _Entry(value=value, fetched_at=now, refresh_at=now + max(0, self.ttl - self.refresh_margin))
+        with self._lock:
+            self._entries[secret_name] = entry
+        logger.info(f"Fetched secret '{secret_name}'", duration_ms=round((now - start) * 1000, 1))
+        return entry
+
+    def _refresh_in_background(self, secret_name: str, entry: _Entry) -> None:
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+
+        def refresh() -> None:
+            try:
+                self._fetch(secret_name)
+            except Exception:
+                expired = self._clock() >= entry.fetched_at + self.ttl
+                logger.exception(f"Failed to refresh secret '{secret_name}', serving cached value", expired=expired)
+                entry.refresh_at = self._clock() + self.retry_interval
+            finally:
+                entry.refreshing = False
+
+        threading.Thread(target=refresh, name=f"refresh-{secret_name}", daemon=True).start()
+
+
+# Shared by every handler in the execution environment
+SECRETS = SecretCache()
+
+
+def get_secret_value(secret_name: Optional[str], key: Optional[str] = None, env_var: Optional[str] = None) -> str:
+    """
+    Resolve a secret value, the environment variable `env_var` wins so local runs dont need Secrets Manager
+    param secret_name: str: Secrets Manager secret name or arn
+    param key: str: key of the value when the secret is a json object, None to return the whole secret string
+    param env_var: str: environment variable that overrides the secret
+    return: str: the secret value
+    """
+    if env_var and (value := os.getenv(env_var)):
+        return value
+    if not secret_name:
+        raise ValueError(f"No secret name provided and environment variable '{env_var}' is not set")
+    if key:
+        return SECRETS.get_json(secret_name)[key]
+    return SECRETS.get(secret_name)
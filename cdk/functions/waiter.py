@@ -0,0 +1,102 @@
+"""Polling waiter with jittered exponential backoff and an overall deadline, used by the custom resource handlers"""
+
+import random
+import time
+from typing import Callable, Optional, TypeVar
+from aws_lambda_powertools import Logger
+
+logger = Logger(service="waiter")
+
+T = TypeVar("T")
+
+DEFAULT_SAFETY_MARGIN = 10.0  # seconds kept back from the Lambda timeout to report the failure to CloudFormation
+
+
+class WaiterError(Exception):
+    """Raised when the resource being waited on reaches a failed state"""
+
+
+class WaiterTimeout(WaiterError):
+    """Raised when the resource did not reach the desired state before the deadline"""
+
+
+class Waiter:
+    """Poll until a condition is met, sleeping with jittered exponential backoff between polls"""
+
+    def __init__(
+        self,
+        base_delay: float = 1.0,
+        max_delay: float = 10.0,
+        multiplier: float = 2.0,
+        deadline: Optional[float] = None,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        param base_delay: float: seconds to wait after the first poll
+        param max_delay: float: the delay between polls never grows beyond this
+        param multiplier: float: the delay grows by this factor after every poll
+        param deadline: float: `clock()` time after which waits fail with WaiterTimeout, None to wait forever
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.deadline = deadline
+        self._sleep = sleep
+        self._clock = clock
+        self.polls = 0  # total polls across all waits
+        self.waited = 0.0  # total seconds spent waiting across all waits
+
+    @classmethod
+    def for_lambda_context(cls, context, safety_margin: float = DEFAULT_SAFETY_MARGIN, **kwargs) -> "Waiter":
+        """Waiter whose deadline is `safety_margin` seconds before the Lambda invocation times out"""
+        waiter = cls(**kwargs)
+        remaining_ms = context.get_remaining_time_in_millis() if context else None
+        if isinstance(remaining_ms, (int, float)):  # MagicMock contexts (local runs) dont have a deadline
+            waiter.deadline = waiter._clock() + remaining_ms / 1000 - safety_margin
+        return waiter
+
+    @property
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline"""
+        return None if self.deadline is None else self.deadline - self._clock()
+
+    def delay(self, attempt: int) -> float:
+        """Delay before poll `attempt` + 1, half fixed and half random so that concurrent waiters spread out"""
+        delay = min(self.max_delay, self.base_delay * self.multiplier**attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def wait(
+        self,
+        name: str,
+        poll: Callable[[], T],
+        done: Callable[[T], bool],
+        failed: Callable[[T], Optional[str]] = lambda _: None,
+    ) -> T:
+        """
+        Poll until `done(result)` is true
+        param name: str: description of what is being waited on, used in logs and errors
+        param poll: Callable: returns the current state, ie. a boto describe call
+        param done: Callable: returns True when the state is the desired state
+        param failed: Callable: returns a failure reason when the state can never become the desired state
+        return: the result of the last poll
+        """
+        start = self._clock()
+        attempt = 0
+        while True:
+            result = poll()
+            self.polls += 1
+            attempt += 1
+            if done(result):
+                waited = self._clock() - start
+                logger.info(f"Waited for {name}", polls=attempt, waited_s=round(waited, 1))
+                return result
+            if reason := failed(result):
+                raise WaiterError(f"{name} failed after {attempt} polls: {reason}")
+            delay = self.delay(attempt - 1)
+            if self.deadline is not None and self._clock() + delay > self.deadline:
+                raise WaiterTimeout(
+                    f"Timed out waiting for {name} after {attempt} polls and {self._clock() - start:.1f}s"
+                )
+            self._sleep(delay)
+            self.waited += delay
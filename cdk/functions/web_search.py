@@ -1,21 +1,72 @@
+# Everything at module level runs once per execution environment (Lambda init), keep per request work in the handler
+import time
+
+INIT_STARTED = time.perf_counter()  # before the heavy imports below so the warmer can report the full init
+
 import json
-from typing import Union
+import os
+from typing import Optional, Union
 
 from pydantic import BaseModel
+from cdk.functions import rate_limit, secret_cache
+from cdk.functions.action_group import CORRELATION_ID_PATH, is_warmer_event, log_span, warmer_response
 from cdk.models import BedrockEvent, BedrockResponseEvent
 import requests
 from aws_lambda_powertools import Logger
 
 logger = Logger(service="web_search", level="INFO", log_uncaught_exceptions=True)
 
+# Jina endpoints can be overridden to point at a local mock (see tools/lambda_harness.py)
+JINA_SEARCH_URL_ENV_NAME = "JINA_SEARCH_URL"
+JINA_READER_URL_ENV_NAME = "JINA_READER_URL"
+DEFAULT_JINA_SEARCH_URL = "https://s.jina.ai/"
+DEFAULT_JINA_READER_URL = "https://r.jina.ai/"
+
+
+# The Jina api key is the `jinaApiKey` value of the SECRET_NAME secret, or JINA_API_KEY for local runs
+SECRET_NAME_ENV_NAME = "SECRET_NAME"
+JINA_API_KEY_ENV_NAME = "JINA_API_KEY"
+JINA_API_KEY_SECRET_KEY = "jinaApiKey"
+
+
+class JinaKeyMissing(Exception):
+    """Raised when the secret has no Jina api key value"""
+
 
 def get_jina_key() -> str:
-    # TODO: Move to secrets manager
-    return "jina_97228772f32c4a16940e126332078a54xPAPfYHZwAkQ4tCUNn4USrROSqSe"
+    secret_name = os.getenv(SECRET_NAME_ENV_NAME)
+    try:
+        return secret_cache.get_secret_value(secret_name, key=JINA_API_KEY_SECRET_KEY, env_var=JINA_API_KEY_ENV_NAME)
+    except KeyError:
+        message = f"The secret '{secret_name}' has no '{JINA_API_KEY_SECRET_KEY}' value"
+        raise JinaKeyMissing(f"{message} and {JINA_API_KEY_ENV_NAME} is not set") from None
 
 
 def get_jina_auth_header() -> dict:
-    return {"Authorization": f"Bearer {get_jina_key()}"}
+    return {"Authorization": f"Bearer {get_jina_key()}", "Accept": "application/json"}
+
+
+# Reuse the TLS connections to Jina across invocations and fetch the api key during init
+SESSION = requests.Session()
+secret_cache.SECRETS.prefetch(os.getenv(SECRET_NAME_ENV_NAME))
+
+# Client side rate limiting toward Jina, shared by all containers when RATE_LIMIT_TABLE is set. Throttled calls are
+# retried here with backoff rather than returned to the agent as a REPROMPT, which would cost a whole model turn.
+RATE_LIMIT_TABLE_ENV_NAME = "RATE_LIMIT_TABLE"
+JINA_LIMITER = rate_limit.RateLimiter(
+    key="jina",
+    rate=float(os.getenv("JINA_RATE_LIMIT", "5")),  # requests per second
+    capacity=float(os.getenv("JINA_BURST", "10")),
+    store=rate_limit.DynamoDBBucketStore(table) if (table := os.getenv(RATE_LIMIT_TABLE_ENV_NAME)) else None,
+)
+JINA_MAX_RETRIES = int(os.getenv("JINA_MAX_RETRIES", "3"))
+JINA_MAX_WAIT = float(os.getenv("JINA_MAX_WAIT", "10"))  # seconds a call may wait for the rate limiter
+# Identical calls share one Jina call, across containers through the rate limit table when it is set
+COALESCER = (
+    rate_limit.DynamoDBCoalescer(table) if (table := os.getenv(RATE_LIMIT_TABLE_ENV_NAME)) else rate_limit.Coalescer()
+)
+# Seconds of the Lambda timeout kept to answer the agent, the Jina calls and retries stop before then
+JINA_DEADLINE_MARGIN = float(os.getenv("JINA_DEADLINE_MARGIN", "2"))
 
 
 class JinaError(BaseModel):
@@ -23,13 +74,63 @@ class JinaError(BaseModel):
     message: str
 
 
-def jina_search(query: str) -> Union[str, JinaError]:
-    base_url = "https://s.jina.ai/"
-    headers = get_jina_auth_header()
-    headers["Accept"] = "application/json"
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left until the deadline, None without one"""
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def deadline_from(context) -> Optional[float]:
+    """The time.monotonic() by which the Jina calls must be done for the handler to answer before Lambda times out"""
+    remaining_ms = getattr(context, "get_remaining_time_in_millis", lambda: None)()
+    if not isinstance(remaining_ms, (int, float)):
+        return None  # not a Lambda context, ie. the local runner below
+    return time.monotonic() + remaining_ms / 1000 - JINA_DEADLINE_MARGIN
+
+
+def jina_get(url: str, deadline: Optional[float] = None) -> requests.Response:
+    """
+    GET a Jina url through the rate limiter, retrying throttled (429) responses with backoff
+    param deadline: float: time.monotonic() the waits, call and retries must end by, RateLimitTimeout when they cant
+    """
+    for attempt in range(JINA_MAX_RETRIES + 1):
+        max_wait, timeout = JINA_MAX_WAIT, None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise rate_limit.RateLimitTimeout(f"No time left to call Jina after {attempt} attempts")
+            max_wait = min(max_wait, remaining)
+        JINA_LIMITER.acquire(max_wait=max_wait)
+        if deadline is not None:
+            timeout = max(deadline - time.monotonic(), 0.1)
+        resp = SESSION.get(url, headers=get_jina_auth_header(), timeout=timeout)
+        if resp.status_code != 429:
+            JINA_LIMITER.on_success()
+            return resp
+        delay = JINA_LIMITER.on_throttle(attempt, resp.headers.get("Retry-After"))
+        if attempt < JINA_MAX_RETRIES:
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                break  # the retry would end after the deadline, answer with the throttled response
+            time.sleep(delay)
+    return resp
+
+
+def jina_search(query: str, session_id: str = None, deadline: Optional[float] = None) -> Union[str, JinaError]:
+    """Search, identical searches from the same session share one Jina call"""
+    try:
+        return COALESCER.do(("search", session_id, query), lambda: _jina_search(query, deadline), remaining(deadline))
+    except rate_limit.RateLimitTimeout as e:
+        logger.error(f"Rate limited search query: {query}. {e}")
+        return JinaError(status_code=429, message=str(e))
+    except requests.Timeout as e:
+        logger.error(f"Timed out search query: {query}. {e}")
+        return JinaError(status_code=504, message=f"Jina search timed out: {e}")
+
+
+def _jina_search(query: str, deadline: Optional[float] = None) -> Union[str, JinaError]:
+    base_url = os.getenv(JINA_SEARCH_URL_ENV_NAME, DEFAULT_JINA_SEARCH_URL)
     query = requests.utils.quote(query)
     logger.info(f"Searching query: '{query}'")
-    resp = requests.get(base_url + query, headers=headers)
+    resp = jina_get(base_url + query, deadline)
     # TODO: handle response status code != 200
     if resp.status_code != 200:
         logger.error(f"Failed to search query: {query}. Status code: {resp.status_code}. Response: {resp.text}")
@@ -43,12 +144,22 @@ def jina_search(query: str) -> Union[str, JinaError]:
     return json.dumps(data)
 
 
-def jina_retrieve(url: str) -> Union[str, JinaError]:
-    base_url = "https://r.jina.ai/"
-    headers = get_jina_auth_header()
-    headers["Accept"] = "application/json"
+def jina_retrieve(url: str, session_id: str = None, deadline: Optional[float] = None) -> Union[str, JinaError]:
+    """Retrieve, identical retrievals from the same session share one Jina call"""
+    try:
+        return COALESCER.do(("retrieve", session_id, url), lambda: _jina_retrieve(url, deadline), remaining(deadline))
+    except rate_limit.RateLimitTimeout as e:
+        logger.error(f"Rate limited retrieve url: {url}. {e}")
+        return JinaError(status_code=429, message=str(e))
+    except requests.Timeout as e:
+        logger.error(f"Timed out retrieve url: {url}. {e}")
+        return JinaError(status_code=504, message=f"Jina retrieve timed out: {e}")
+
+
+def _jina_retrieve(url: str, deadline: Optional[float] = None) -> Union[str, JinaError]:
+    base_url = os.getenv(JINA_READER_URL_ENV_NAME, DEFAULT_JINA_READER_URL)
     logger.info(f"Retrieving url: {url}")
-    resp = requests.get(base_url + url, headers=headers)
+    resp = jina_get(base_url + url, deadline)
     if resp.status_code != 200:
         logger.error(f"Failed to retrieve url: {url}. Status code: {resp.status_code}. Response: {resp.text}")
         return JinaError(status_code=resp.status_code, message=resp.text)
@@ -58,35 +169,71 @@ def jina_retrieve(url: str) -> Union[str, JinaError]:
     return json.dumps(data)
 
 
-@logger.inject_lambda_context
+def warm_up() -> None:
+    """Run the event validation and response building once during init so the first agent call doesnt pay for it"""
+    event = BedrockEvent.from_event(
+        dict(
+            messageVersion="1.0",
+            agent={"name": "warmer", "id": "warmer", "alias": "warmer", "version": "warmer"},
+            inputText="",
+            sessionId="warmer",
+            actionGroup="web_search",
+            function="search",
+            parameters=[{"name": "query", "type": "string", "value": "warmer"}],
+            sessionAttributes={},
+            promptSessionAttributes={},
+        )
+    )
+    BedrockResponseEvent.response_dict_from_event(event, "")
+
+
+@logger.inject_lambda_context(correlation_id_path=CORRELATION_ID_PATH)
+@log_span(logger)
 def lambda_handler(event: dict, context) -> dict:
 
-    bedrock_event = BedrockEvent.model_validate(event)
+    if is_warmer_event(event):
+        # Scheduled warmer invocation, the init above already did the expensive work
+        return warmer_response(INIT_STARTED, INIT_FINISHED)
+
+    # Validate the event once, the responses below reuse the parsed event
+    bedrock_event = BedrockEvent.from_event(event)
+    deadline = deadline_from(context)
+
+    function = bedrock_event.function.lower()
+    if function not in ("search", "retrieve"):
+        error_msg = f"Invalid function: {bedrock_event.function}"
+        logger.error(error_msg)
+        return BedrockResponseEvent.response_dict_from_event(bedrock_event, error_msg, response_state="FAILURE")
 
-    if bedrock_event.function.lower() == "search":
+    try:
+        get_jina_key()  # cached, a misconfigured secret fails the call instead of every Jina call and retry
+    except JinaKeyMissing as e:
+        logger.error(str(e))
+        return BedrockResponseEvent.response_dict_from_event(
+            bedrock_event, f"Web search is not configured: {e}", response_state="FAILURE"
+        )
+
+    if function == "search":
         query = list(map(lambda x: x.value, filter(lambda x: x.name == "query", bedrock_event.parameters)))[0]
-        response = jina_search(query)
+        response = jina_search(query, bedrock_event.sessionId, deadline)
         if isinstance(response, JinaError):
             # Try search again
-            return BedrockResponseEvent.response_event_from_event(
+            return BedrockResponseEvent.response_dict_from_event(
                 bedrock_event, response.message, response_state="REPROMPT"
-            ).model_dump()
+            )
 
-    elif bedrock_event.function.lower() == "retrieve":
+    else:
         url = list(map(lambda x: x.value, filter(lambda x: x.name == "url", bedrock_event.parameters)))[0]
-        response = jina_retrieve(url)
+        response = jina_retrieve(url, bedrock_event.sessionId, deadline)
         if isinstance(response, JinaError):
             # Dont retry retrieve
-            return BedrockResponseEvent.response_event_from_event(bedrock_event, response.message).model_dump()
+            return BedrockResponseEvent.response_dict_from_event(bedrock_event, response.message)
+
+    return BedrockResponseEvent.response_dict_from_event(bedrock_event, response)
 
-    else:
-        error_msg = f"Invalid function: {bedrock_event.function}"
-        logger.error(error_msg)
-        return BedrockResponseEvent.response_event_from_event(
-            bedrock_event, error_msg, response_state="FAILURE"
-        ).model_dump()
 
-    return BedrockResponseEvent.response_event_from_event(bedrock_event, response).model_dump()
+warm_up()
+INIT_FINISHED = time.perf_counter()
 
 
 if __name__ == "__main__":
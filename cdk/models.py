@@ -28,9 +28,19 @@ class BedrockEvent(BaseModel):
     sessionAttributes: Dict[str, str]
     promptSessionAttributes: Dict[str, str]
 
+    @classmethod
+    def from_event(cls, event: Union["BedrockEvent", dict]) -> "BedrockEvent":
+        """Validate a raw lambda event, events that have already been validated are returned as is"""
+        if isinstance(event, cls):
+            return event
+        return cls.model_validate(event)
+
 
 # Response Event Function Details schema
 # https://docs.aws.amazon.com/bedrock/latest/userguide/agents-lambda.html#agents-lambda-response
+RESPONSE_STATES = (None, "FAILURE", "REPROMPT")
+
+
 class ResponseBody(BaseModel):
     body: str
 
@@ -71,8 +81,7 @@ class BedrockResponseEvent(BaseModel):
     def response_event_from_event(
         event: Union[BedrockEvent, dict], response_body: str, response_state: Literal["REPROMPT", "FAILURE"] = None
     ) -> "BedrockResponseEvent":
-        if isinstance(event, dict):
-            event = BedrockEvent.model_validate(event)
+        event = BedrockEvent.from_event(event)
         resp = BedrockResponseEvent(
             messageVersion="1.0",
             response=Response(
@@ -90,5 +99,31 @@ class BedrockResponseEvent(BaseModel):
             resp.response.functionResponse.responseState = response_state
         return resp
 
+    @staticmethod
+    def response_dict_from_event(
+        event: Union[BedrockEvent, dict], response_body: str, response_state: Literal["REPROMPT", "FAILURE"] = None
+    ) -> dict:
+        """
+        Same result as `response_event_from_event(...).model_dump()` without building and dumping the models.
+        This runs on every tool call, so handlers should validate the event once and pass the BedrockEvent here.
+        """
+        event = BedrockEvent.from_event(event)
+        if response_state not in RESPONSE_STATES:
+            raise ValueError(f"Invalid response_state: '{response_state}', must be one of {RESPONSE_STATES}")
+        return {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event.actionGroup,
+                "function": event.function,
+                "functionResponse": {
+                    "responseState": response_state,
+                    "responseBody": {"TEXT": {"body": response_body}},
+                },
+            },
+            "sessionAttributes": dict(event.sessionAttributes),
+            "promptSessionAttributes": dict(event.promptSessionAttributes),
+            "knowledgeBasesConfiguration": None,
+        }
+
     def get_response_body(self) -> str:
         return self.response.functionResponse.responseBody["TEXT"].body
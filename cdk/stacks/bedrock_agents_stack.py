@@ -1,20 +1,25 @@
-import os
 import aws_cdk as core
 from aws_cdk import aws_bedrock as bedrock
 from aws_cdk import aws_s3 as s3
-from aws_cdk import aws_lambda as lambda_
-from aws_cdk import aws_ecr_assets as ecr
+from aws_cdk import aws_dynamodb as dynamodb
+from aws_cdk import aws_iam as iam
 from constructs import Construct
 from cdk.constructs import pinecone_index as pi
+from cdk.constructs.action_group_function import ActionGroupFunction
 from cdk.constructs.bedrock_agent import BedrockAgent
 from cdk.constructs.bedrock_guardrail import BedrockGuardrail
 from cdk.constructs.bedrock_pinecone_knowledgebase import BedrockPineconeKnowledgeBase
-from cdk.stacks.helpers import prune_dir
 
 
 class BedrockAgentsStack(core.Stack):
 
-    def __init__(self, scope: Construct, construct_id: str, secret: pi.PineconeSecret, **kwargs) -> None:
+    def __init__(
+        self, scope: Construct, construct_id: str, secret: pi.PineconeSecret, retrieval_cache: bool = False, **kwargs
+    ) -> None:
+        """
+        param retrieval_cache: bool: give the agent the knowledge base through the `kb_retrieve` action group, which
+        caches retrieval results, rather than associating the knowledge base with the agent
+        """
         super().__init__(scope, construct_id, **kwargs)
 
         # Agent
@@ -40,29 +45,40 @@ class BedrockAgentsStack(core.Stack):
             description="Bedrock Demo Agent Knowledge Base",
             pinecone_secret=secret,
         )
-        self.bedrock_agent.add_knowledge_base(
-            bedrock.CfnAgent.AgentKnowledgeBaseProperty(
-                description="Knowlegdebase for contracts and documents are private and wont be found online",
-                knowledge_base_id=self.knowledge_base.knowledge_base.attr_knowledge_base_id,
+        kb_description = "Knowlegdebase for contracts and documents are private and wont be found online"
+        if retrieval_cache:
+            self.add_cached_knowledge_base(kb_description)
+        else:
+            self.bedrock_agent.add_knowledge_base(
+                bedrock.CfnAgent.AgentKnowledgeBaseProperty(
+                    description=kb_description,
+                    knowledge_base_id=self.knowledge_base.knowledge_base.attr_knowledge_base_id,
+                )
             )
-        )
 
         # Web Search Tool
-        code_dir = os.path.join(os.path.dirname(__file__), "..", "..")  # root of this project
-        web_search_fn = lambda_.DockerImageFunction(
+        # Token bucket shared by all WebSearchTool containers so that together they respect the Jina rate limit, and
+        # the in-flight markers and short lived results that let them share identical Jina calls
+        rate_limit_table = dynamodb.Table(
+            self,
+            "RateLimitTable",
+            partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expiresAt",
+            removal_policy=core.RemovalPolicy.DESTROY,
+        )
+        # Set provisioned_concurrency / max_provisioned_concurrency or warmer_interval to avoid cold starts
+        web_search_fn = ActionGroupFunction(
             self,
             "WebSearchTool",
+            handler="cdk.functions.web_search.lambda_handler",
             description="Web Search Tool for Bedrock Agent",
-            code=lambda_.DockerImageCode.from_image_asset(
-                directory=code_dir,
-                cmd=["cdk.functions.web_search.lambda_handler"],
-                platform=ecr.Platform.LINUX_AMD64,  # required when building on arm64 machines (mac m1)
-                exclude=prune_dir(keeps=["functions", "models.py"]),  # keeps updates smaller and faster
-            ),
             timeout=core.Duration.seconds(60),
             memory_size=1024,
-            environment={"SECRET_NAME": secret.secret_name},
+            environment={"SECRET_NAME": secret.secret_name, "RATE_LIMIT_TABLE": rate_limit_table.table_name},
         )
+        rate_limit_table.grant_read_write_data(web_search_fn.function)
+        secret.grant_read(web_search_fn.function)  # the Jina api key is the `jinaApiKey` value of this secret
         self.bedrock_agent.add_action_group(
             bedrock.CfnAgent.AgentActionGroupProperty(
                 action_group_name="web_search",
@@ -119,3 +135,55 @@ class BedrockAgentsStack(core.Stack):
             self, "BedrockDemoCodeBucket", removal_policy=core.RemovalPolicy.DESTROY, auto_delete_objects=True
         )
         self.code_bucket.grant_read(self.bedrock_agent.role)
+
+    def add_cached_knowledge_base(self, description: str) -> None:
+        """Knowledge base lookups through a Lambda that caches the `Retrieve` results of repeated questions"""
+        kb_retrieve_fn = ActionGroupFunction(
+            self,
+            "KbRetrieveTool",
+            handler="cdk.functions.kb_retrieve.lambda_handler",
+            description="Cached knowledge base retrieval for Bedrock Agent",
+            timeout=core.Duration.seconds(30),
+            memory_size=512,
+            environment={
+                "KB_ID": self.knowledge_base.knowledge_base_id,
+                # the cache is cleared when an ingestion job of this data source completes
+                "DATASOURCE_ID": self.knowledge_base.data_source_id,
+                "RETRIEVAL_CACHE_TTL": "900",
+            },
+        )
+        kb_retrieve_fn.function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["bedrock:Retrieve", "bedrock:ListIngestionJobs"],
+                resources=[self.knowledge_base.knowledge_base.attr_knowledge_base_arn],
+            )
+        )
+        self.bedrock_agent.add_action_group(
+            bedrock.CfnAgent.AgentActionGroupProperty(
+                action_group_name="knowledge_base",
+                description=description,
+                skip_resource_in_use_check_on_delete=True,
+                action_group_executor=bedrock.CfnAgent.ActionGroupExecutorProperty(lambda_=kb_retrieve_fn.function_arn),
+                function_schema=bedrock.CfnAgent.FunctionSchemaProperty(
+                    functions=[
+                        bedrock.CfnAgent.FunctionProperty(
+                            name="retrieve",
+                            description="Search the private knowledge base for passages relevant to a question",
+                            parameters={
+                                "query": bedrock.CfnAgent.ParameterDetailProperty(
+                                    type="string",
+                                    description="the question to search the knowledge base for",
+                                    required=True,
+                                ),
+                                "filter": bedrock.CfnAgent.ParameterDetailProperty(
+                                    type="string",
+                                    description="optional json metadata filter, ie. "
+                                    '{"equals": {"key": "type", "value": "contract"}}',
+                                    required=False,
+                                ),
+                            },
+                        ),
+                    ]
+                ),
+            )
+        )
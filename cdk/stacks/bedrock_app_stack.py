@@ -10,7 +10,9 @@ from aws_cdk import aws_certificatemanager as acm
 from aws_cdk import aws_secretsmanager as sm
 from aws_cdk import aws_cloudfront as cf
 from aws_cdk import aws_cloudfront_origins as origins
+from aws_cdk import aws_dynamodb as dynamodb
 from constructs import Construct
+from cdk.stacks.helpers import UI_DOCKERFILE_KEEPS, prune_dir
 
 
 class BedrockAppStack(core.Stack):
@@ -25,8 +27,14 @@ class BedrockAppStack(core.Stack):
         br_kb_id: str,
         br_datasource_id: str,
         okta_secret: sm.ISecret,
+        memory_size: int = 10240,
+        architecture: lambda_.Architecture = lambda_.Architecture.X86_64,
         **kwargs,
     ) -> None:
+        """
+        param memory_size: int: memory (and so CPU share) of the app function, see `python -m tools.app_tuning`
+        param architecture: lambda_.Architecture: X86_64 or ARM_64, the app image is built for it
+        """
         super().__init__(scope, construct_id, **kwargs)
 
         # create function
@@ -34,6 +42,16 @@ class BedrockAppStack(core.Stack):
         zone_name = "css-lab1.cloudshift.cc"
         fqdn = f"{host_name}.{zone_name}"
 
+        # Server side sessions shared by all the app containers, the session cookie is only the id
+        session_table = dynamodb.Table(
+            self,
+            "SessionTable",
+            partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expiresAt",
+            removal_policy=core.RemovalPolicy.DESTROY,
+        )
+
         code_dir = os.path.join(os.path.dirname(__file__), "..", "..")  # root of this project
         lambda_fn = lambda_.DockerImageFunction(
             self,
@@ -43,10 +61,13 @@ class BedrockAppStack(core.Stack):
                 directory=code_dir,
                 file="Dockerfile.ui",
                 cmd=["python3", "gradio_app/app.py"],
-                platform=ecr.Platform.LINUX_AMD64,  # required when building on arm64 machines (mac m1)
+                # the image platform must match the function architecture (whatever machine builds it)
+                platform=ecr.Platform.LINUX_ARM64 if architecture.name == "arm64" else ecr.Platform.LINUX_AMD64,
+                # only what Dockerfile.ui copies, so function or cdk changes dont rebuild the app image
+                exclude=prune_dir(keeps=None, base_dir="gradio_app", root_keeps=UI_DOCKERFILE_KEEPS),
             ),
-            architecture=lambda_.Architecture.X86_64,
-            memory_size=10240,
+            architecture=architecture,
+            memory_size=memory_size,
             timeout=core.Duration.minutes(5),
             environment={
                 "BEDROCK_AGENT_ID": br_agent_id,
@@ -55,14 +76,23 @@ class BedrockAppStack(core.Stack):
                 "KB_ID": br_kb_id,
                 "DATASOURCE_ID": br_datasource_id,
                 "OKTA_SECRET_ARN": okta_secret.secret_arn,
+                "SESSION_TABLE": session_table.table_name,
                 "HOST_NAME": f"https://{fqdn}",
                 "LOG_LEVEL": "DEBUG",
+                # keep a fraction of the per request debug logs and at most 5 a second per line, see gradio_app/logs.py
+                "LOG_SAMPLE_RATES": "gradio_app.fixes=0.01,gradio_app.middleware=0.1,gradio_app.helpers=0.1",
+                "LOG_RATE_LIMIT": "5",
+                # the adapter must stream like the function URL below, see tools/lwa_emulator.py
+                "AWS_LWA_INVOKE_MODE": "response_stream",
             },
         )
 
         # Allow app to read/write to the kb bucket so we can maintain the kb from the app
         br_kb_bucket.grant_read_write(lambda_fn)
 
+        # Allow app to keep the user sessions
+        session_table.grant_read_write_data(lambda_fn)
+
         # Allow app to read the Okta secret
         okta_secret.grant_read(lambda_fn)
 
@@ -125,6 +155,11 @@ class BedrockAppStack(core.Stack):
         cf_log_bucket.add_lifecycle_rule(enabled=True, expiration=core.Duration.days(30))
 
         # Create a CloudFront distribution
+        app_origin = origins.FunctionUrlOrigin(
+            fn_url,
+            read_timeout=core.Duration.seconds(60),  # need an aws rate-limit change to go higher
+            custom_headers={"x-forwarded-host": fqdn},  # required for app to build correct urls
+        )
         cdn = cf.Distribution(
             self,
             "MyDistribution",
@@ -134,11 +169,7 @@ class BedrockAppStack(core.Stack):
             http_version=cf.HttpVersion.HTTP2,
             log_bucket=cf_log_bucket,
             default_behavior=cf.BehaviorOptions(
-                origin=origins.FunctionUrlOrigin(
-                    fn_url,
-                    read_timeout=core.Duration.seconds(60),  # need an aws rate-limit change to go higher
-                    custom_headers={"x-forwarded-host": fqdn},  # required for app to build correct urls
-                ),
+                origin=app_origin,
                 allowed_methods=cf.AllowedMethods.ALLOW_ALL,
                 viewer_protocol_policy=cf.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
                 cache_policy=cf.CachePolicy.CACHING_DISABLED,
@@ -147,6 +178,45 @@ class BedrockAppStack(core.Stack):
             ),
         )
 
+        # Gradio's JS, CSS and fonts are cached at the edge, the app sends them with a long Cache-Control (immutable
+        # for the content hashed /assets) and precompressed, see gradio_app/static.py. Only the first fetch of each
+        # asset (per edge location and encoding) reaches the Lambda. Assets dont need the session cookie.
+        static_cache_policy = cf.CachePolicy(
+            self,
+            "StaticAssetsCachePolicy",
+            comment="Gradio static assets, honours the app's Cache-Control",
+            min_ttl=core.Duration.seconds(0),
+            default_ttl=core.Duration.days(1),
+            max_ttl=core.Duration.days(365),
+            cookie_behavior=cf.CacheCookieBehavior.none(),
+            header_behavior=cf.CacheHeaderBehavior.none(),
+            query_string_behavior=cf.CacheQueryStringBehavior.none(),
+            enable_accept_encoding_gzip=True,  # cache the br and gzip variants separately
+            enable_accept_encoding_brotli=True,
+        )
+        # Gradio streams the chat updates as server sent events from /gradio/queue/data. CloudFront must pass them
+        # through as they come, never compress (and so buffer) them.
+        cdn.add_behavior(
+            "/gradio/queue/*",
+            app_origin,
+            allowed_methods=cf.AllowedMethods.ALLOW_ALL,
+            viewer_protocol_policy=cf.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+            cache_policy=cf.CachePolicy.CACHING_DISABLED,
+            origin_request_policy=cf.OriginRequestPolicy.ALL_VIEWER_EXCEPT_HOST_HEADER,
+            compress=False,
+            response_headers_policy=cf.ResponseHeadersPolicy.SECURITY_HEADERS,
+        )
+        for path_pattern in ["/gradio/assets/*", "/gradio/static/*"]:
+            cdn.add_behavior(
+                path_pattern,
+                app_origin,
+                allowed_methods=cf.AllowedMethods.ALLOW_GET_HEAD,
+                viewer_protocol_policy=cf.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                cache_policy=static_cache_policy,
+                compress=True,  # for any asset without a precompressed variant
+                response_headers_policy=cf.ResponseHeadersPolicy.SECURITY_HEADERS,
+            )
+
         # Origin Access Control for the Lambda function URL invoked by the CloudFront distribution
         oac = cf.CfnOriginAccessControl(
             self,
@@ -182,3 +252,5 @@ class BedrockAppStack(core.Stack):
 
         # Output the CloudFront distribution URL
         core.CfnOutput(self, "GradioUrl", value=f"https://{fqdn}")
+        # make cf-logs CF_LOG_BUCKET=<value>
+        core.CfnOutput(self, "CloudFrontLogBucket", value=cf_log_bucket.bucket_name)
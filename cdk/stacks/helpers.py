@@ -1,13 +1,29 @@
+import functools
 import os
-from typing import List
+from typing import List, Optional, Sequence, Tuple
 
 root_dir = os.path.join(os.path.dirname(__file__), "..", "..")  # root of this project
 
+# Project root files the function and app Dockerfiles copy, see `prune_dir()`
+DOCKERFILE_KEEPS = ("Dockerfile", "pyproject.toml", "poetry.lock")
+UI_DOCKERFILE_KEEPS = ("Dockerfile.ui", "pyproject.toml", "poetry.lock")
 
-def prune_dir(keeps: List[str], base_dir="cdk") -> List[str]:
-    """used for the DockerImageCode `exclude` parameter so that simple stack updates dont require a new Docker image"""
-    excludes = []
-    for lib_dir in os.listdir(os.path.join(root_dir, base_dir)):
-        if lib_dir not in keeps:
+
+def prune_dir(keeps: Optional[List[str]], base_dir="cdk", root_keeps: Sequence[str] = DOCKERFILE_KEEPS) -> List[str]:
+    """
+    used for the DockerImageCode `exclude` parameter so that simple stack updates dont require a new Docker image.
+    The build context is an allow-list: every project root entry but `root_keeps` and `base_dir`, and every `base_dir`
+    entry but `keeps` (all of them when None), is excluded, so CDK fingerprints and stages only the files the image is
+    built from.
+    """
+    return list(_prune_dir(None if keeps is None else tuple(keeps), base_dir, tuple(root_keeps)))
+
+
+@functools.lru_cache(maxsize=None)
+def _prune_dir(keeps: Optional[Tuple[str, ...]], base_dir: str, root_keeps: Tuple[str, ...]) -> Tuple[str, ...]:
+    # Listed once per synth, constructs asking for the same context get the same (cached) excludes
+    excludes = [name for name in sorted(os.listdir(root_dir)) if name not in root_keeps and name != base_dir]
+    for lib_dir in sorted(os.listdir(os.path.join(root_dir, base_dir))):
+        if keeps is not None and lib_dir not in keeps:
             excludes.append(os.path.join(base_dir, lib_dir))
-    return excludes
+    return tuple(excludes + ["**/__pycache__", "**/*.pyc"])
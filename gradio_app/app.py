@@ -1,21 +1,23 @@
 import os
+import time
+import uuid
 from typing import Generator
 import gradio as gr
 from dotenv import load_dotenv
-from gradio_app import helpers, models, kb, oauth_okta, middleware, fixes  # , cw_metrics
+from gradio_app import concurrency, helpers, kb, logs, oauth_okta, middleware, fixes, profiling, static  # , cw_metrics
 import gradio.route_utils
 
 from fastapi import FastAPI, Depends, Request
 from starlette.responses import RedirectResponse
-from aws_lambda_powertools import Logger
 import uvicorn
 
-logger = Logger(service="gradio_app")
+logger = logs.get_logger("gradio_app")
 
 
 load_dotenv()
 
 
+@profiling.profiled("invoke_agent")  # opt-in, see gradio_app/profiling.py
 def invoke_agent(prompt: str, chatbot: gr.Chatbot, trace=False, request: gr.Request = None) -> Generator[any, any, any]:
     """
     Function to interact with the Bedrock agent and return the response
@@ -27,6 +29,8 @@ def invoke_agent(prompt: str, chatbot: gr.Chatbot, trace=False, request: gr.Requ
     """
     events = []  # empty event list to hold the events for debugging
     request_dict = helpers.request_as_dict(request)  # Convert the request object to a dict
+    # Ties the logs of this prompt together across the app and the action group Lambdas, see tools/waterfall.py
+    correlation_id = request_dict["correlation_id"] = uuid.uuid4().hex
     chatbot.append(gr.ChatMessage(role="user", content=prompt))  # Add users prompt text to the chatbot history
 
     # Before we invoke the agent, Yield the ( chatbot, empty prompt str, request_dict, & events )
@@ -34,33 +38,41 @@ def invoke_agent(prompt: str, chatbot: gr.Chatbot, trace=False, request: gr.Requ
     yield chatbot, "", request_dict, events
 
     # Send the prompt to the Bedrock agent. The sessionId is the session_hash from the request
-    response = helpers.BOTO.bedrock_runtime_client.invoke_agent(
-        agentId=os.getenv("BEDROCK_AGENT_ID"),
-        agentAliasId=os.getenv("BEDROCK_AGENT_ALIAS_ID"),
-        sessionId=request.session_hash,
-        endSession=False,
-        enableTrace=trace,
-        inputText=prompt,
-    )
-
-    # Loop through the response chunks (and traces if enableTrace=True) and add them to the chatbot history
-    for i, event_chunk in enumerate(response.get("completion")):
-        if chunk := event_chunk.get("chunk"):
-            # This is a chunk of the AI response, add it to the chatbot history
-            chunk = models.EventStreamChunk.model_validate(chunk)
-            chatbot.append(gr.ChatMessage(role="assistant", content=chunk.text))
-
-        if event_trace := event_chunk.get("trace"):
-            # This is a trace chunk, get the message and add it to chatbot history (if it isnt already there)
-            for msg in models.EventStreamTrace.model_validate(event_trace).messages:
-                if not any(filter(lambda m: isinstance(m, dict) and m.get("content") == msg.content, chatbot)):
-                    metadata = {"title": f"{i}. {msg.title}"}
-                    chatbot.append(gr.ChatMessage(role="assistant", content=msg.content, metadata=metadata))
-
-        # Add the raw event chunk to the list of events for debugging
-        events.append(event_chunk)
-        # For each event chunk, yield the ( chatbot, empty prompt str, request_dict, & events )
-        yield chatbot, "", request_dict, events
+    start, marks = time.perf_counter(), []
+    try:
+        response = helpers.BOTO.bedrock_runtime_client.invoke_agent(
+            agentId=os.getenv("BEDROCK_AGENT_ID"),
+            agentAliasId=os.getenv("BEDROCK_AGENT_ALIAS_ID"),
+            sessionId=request.session_hash,
+            endSession=False,
+            enableTrace=trace,
+            inputText=prompt,
+            # passed by the agent to the action group Lambdas in `sessionAttributes`
+            sessionState={"sessionAttributes": {"correlationId": correlation_id}},
+        )
+
+        # Loop through the response chunks (and traces if enableTrace=True) and add them to the chatbot history
+        for i, event_chunk in enumerate(response.get("completion")):
+            marks.append(
+                {"offset_ms": round((time.perf_counter() - start) * 1000, 1), "event": helpers.event_label(event_chunk)}
+            )
+            helpers.append_event_chunk(chatbot, i, event_chunk)
+
+            # Add the raw event chunk to the list of events for debugging
+            events.append(event_chunk)
+            # For each event chunk, yield the ( chatbot, empty prompt str, request_dict, & events )
+            yield chatbot, "", request_dict, events
+    finally:
+        # The span also covers the time gradio takes to send each update to the browser
+        duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(
+            f"invoke_agent took {duration_ms}ms",
+            span="invoke_agent",
+            duration_ms=duration_ms,
+            correlation_id=correlation_id,
+            session_id=request.session_hash,
+            marks=marks,
+        )
 
 
 def get_salutation(request: gr.Request) -> str:
@@ -88,24 +100,35 @@ with gr.Blocks(title="Bedrock Agent Demo") as demo:
             events = gr.JSON(label="Events")  # Shows the raw events for debugging
             request = gr.JSON(label="Request")  # Shows the http request details for debugging
         prompt.submit(
-            fn=invoke_agent, inputs=[prompt, chatbot, trace_chkbox], outputs=[chatbot, prompt, request, events]
+            fn=invoke_agent,
+            inputs=[prompt, chatbot, trace_chkbox],
+            outputs=[chatbot, prompt, request, events],
+            **concurrency.CHAT.listener_kwargs(),  # its own workers, KB operations cant hold up streaming answers
         )
 
     with gr.Tab(label="KB"):
         gr.Markdown("Knowledge Base Articles")
         kb_refresh_btn = gr.Button("Refresh Knowledgebase Data", variant="primary")
-        kb_file_list = gr.HTML(kb.get_kb_docs)  # List of KB documents in html table
+        kb_file_list = gr.HTML()  # List of KB documents in html table
         kb_uploader = gr.File(label="Upload New Article")  # File uploader
-        kb_ingestion_jobs_list = gr.DataFrame(kb.get_kb_ingestion_jobs)  # The ingestion jobs table
-        kb_uploader.upload(kb.upload_kb_doc, inputs=kb_uploader, outputs=kb_file_list)
-        kb_refresh_btn.click(kb.get_kb_ingestion_jobs, outputs=kb_ingestion_jobs_list)
-        kb_refresh_btn.click(kb.get_kb_docs, outputs=kb_file_list)
+        kb_ingestion_jobs_list = gr.DataFrame()  # The ingestion jobs table
+        # Loaded with the page in the kb concurrency group, rather than as callable values in the default one
+        demo.load(kb.get_kb_docs, outputs=kb_file_list, **concurrency.KB.listener_kwargs())
+        demo.load(kb.get_kb_ingestion_jobs, outputs=kb_ingestion_jobs_list, **concurrency.KB.listener_kwargs())
+        kb_uploader.upload(
+            kb.upload_kb_doc, inputs=kb_uploader, outputs=kb_file_list, **concurrency.KB.listener_kwargs()
+        )
+        kb_refresh_btn.click(
+            kb.get_kb_ingestion_jobs, outputs=kb_ingestion_jobs_list, **concurrency.KB.listener_kwargs()
+        )
+        kb_refresh_btn.click(kb.get_kb_docs, outputs=kb_file_list, **concurrency.KB.listener_kwargs())
 
     # with gr.Tab(label="Metrics"):  # TODO this is very slow
     #     gr.Markdown("Bedrock Metrics")
     #     for plot in cw_metrics.get_plots(helpers.BOTO.client("cloudwatch")):
     #         gr.Plot(plot)
 
+concurrency.configure_queue(demo)  # group limits and queue sizes from the environment, see gradio_app/concurrency.py
 app = FastAPI()  # Gradio will be mounted in the FastAPI app as /gradio
 gradio.route_utils.get_root_url = fixes.get_root_url  # patch get_root_url() in gradio.route_utils
 # Below, `root_path` is non-standard parameter used by monkey patch
@@ -113,6 +136,8 @@ app = gr.mount_gradio_app(app, demo, path="/gradio", auth_dependency=oauth_okta.
 app = oauth_okta.init_okta(app)  # Configure the Okta OAuth2 authentication
 app.add_middleware(middleware.XForwardedHostMiddleware)  # update host header using X-Forwarded-Host header
 app.add_middleware(middleware.LambdaRequestLogger)  # Log the incoming request to debug
+app.add_middleware(static.StaticAssetMiddleware, mount_path="/gradio")  # Cacheable (precompressed) Gradio assets
+app.add_middleware(concurrency.QueueFullMiddleware)  # Retry-After when the queue is full
 
 
 @app.get("/")
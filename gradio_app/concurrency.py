@@ -0,0 +1,187 @@
+"""
+Concurrency groups, limits and queue sizes of the Gradio queue, configured by the environment.
+
+Unless told otherwise Gradio gives every event listener its own concurrency id with a limit of 1: one chat answer
+streams at a time however many users wait, and all listeners share the one queue size, so a burst of KB refreshes (S3
+listing and pandas) fills the queue and chat prompts are turned away. The listeners are put in groups, each with its
+own concurrency limit and queue size (`none` for unbounded):
+
+* `chat`: `CHAT_CONCURRENCY_LIMIT` (default 10) events run at once, `CHAT_QUEUE_MAX_SIZE` (default 50) wait
+* `kb`: `KB_CONCURRENCY_LIMIT` (default 2), `KB_QUEUE_MAX_SIZE` (default 10)
+* the other listeners: Gradio's `GRADIO_DEFAULT_CONCURRENCY_LIMIT` (default 1)
+
+`QUEUE_MAX_SIZE` (default 100) bounds the waiting events of all groups. A join that doesnt fit is answered with a 503
+and `Retry-After: QUEUE_RETRY_AFTER` (default 5 seconds). The waiting and running events and the rejected joins of each
+group are published as CloudWatch metrics (embedded metric format) every `QUEUE_METRICS_INTERVAL` seconds (default 60,
+0 disables).
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+import gradio as gr
+from aws_lambda_powertools.metrics import EphemeralMetrics, MetricUnit
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from gradio_app import logs
+
+logger = logs.get_logger("gradio_app.concurrency")
+
+METRICS_NAMESPACE = "BedrockAgents"
+DEFAULT_GROUP = "default"  # the listeners without a group, each has its own concurrency id in Gradio
+QUEUE_FULL = "Queue is full."  # gradio answers pushes rejected with this prefix with a 503
+
+
+def int_env(name: str, default: Optional[int]) -> Optional[int]:
+    """An int environment variable, `none` is None (unbounded)"""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return None if value.lower() == "none" else int(value)
+
+
+@dataclass
+class ConcurrencyGroup:
+    name: str
+    concurrency_limit: Optional[int]
+    max_size: Optional[int]  # waiting events
+
+    @classmethod
+    def from_env(cls, name: str, concurrency_limit: Optional[int], max_size: Optional[int]) -> "ConcurrencyGroup":
+        """The group with `<NAME>_CONCURRENCY_LIMIT` and `<NAME>_QUEUE_MAX_SIZE` overriding the defaults"""
+        prefix = name.upper()
+        return cls(
+            name,
+            int_env(f"{prefix}_CONCURRENCY_LIMIT", concurrency_limit),
+            int_env(f"{prefix}_QUEUE_MAX_SIZE", max_size),
+        )
+
+    def listener_kwargs(self) -> dict:
+        """The arguments of a Gradio event listener (`.click()`, `.submit()`, ...) that put it in this group"""
+        return dict(concurrency_id=self.name, concurrency_limit=self.concurrency_limit)
+
+
+CHAT = ConcurrencyGroup.from_env("chat", concurrency_limit=10, max_size=50)
+KB = ConcurrencyGroup.from_env("kb", concurrency_limit=2, max_size=10)
+GROUPS = {group.name: group for group in (CHAT, KB)}
+
+
+def limit_group_sizes(
+    queue, groups: Dict[str, ConcurrencyGroup] = GROUPS, on_reject: Callable[[str], None] = lambda group: None
+) -> None:
+    """
+    Reject the events of a group whose waiting events reached its `max_size`, Gradio only bounds the total
+    param queue: gradio.queueing.Queue: the queue of the Blocks, `blocks._queue`
+    param on_reject: Callable[[str], None]: called with the group name of each rejected event
+    """
+    push = queue.push
+
+    async def bounded_push(body, request, username):
+        fn = queue.blocks.fns.get(body.fn_index)
+        name = fn.concurrency_id if fn is not None and fn.concurrency_id in groups else DEFAULT_GROUP
+        group = groups.get(name)
+        event_queue = queue.event_queue_per_concurrency_id.get(name)
+        if group and group.max_size is not None and event_queue and len(event_queue.queue) >= group.max_size:
+            result = False, f"{QUEUE_FULL} The {name} queue holds {group.max_size} events."
+        else:
+            result = await push(body, request, username)
+        if not result[0] and result[1].startswith(QUEUE_FULL):
+            logger.warning(f"Rejected a {name} event: {result[1]}", concurrency_group=name)
+            on_reject(name)
+        return result
+
+    queue.push = bounded_push
+
+
+class QueueMetrics:
+    """Publishes the waiting and running events and the rejected joins of each concurrency group"""
+
+    def __init__(self, queue, interval: float = 60, groups: Dict[str, ConcurrencyGroup] = GROUPS, metrics=None):
+        """
+        param queue: gradio.queueing.Queue: the queue of the Blocks, `blocks._queue`
+        param interval: float: seconds between publications
+        """
+        self.queue = queue
+        self.interval = interval
+        self.groups = groups
+        self.metrics = metrics or EphemeralMetrics(namespace=METRICS_NAMESPACE, service="gradio_app")
+        self._rejected: Counter = Counter()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def reject(self, group: str) -> None:
+        with self._lock:
+            self._rejected[group] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """Waiting, running and rejected (since the last snapshot) events by group"""
+        with self._lock:
+            rejected, self._rejected = self._rejected, Counter()
+        stats = {name: dict(waiting=0, running=0, rejected=0) for name in [*self.groups, *rejected]}
+        for concurrency_id, event_queue in list(self.queue.event_queue_per_concurrency_id.items()):
+            name = concurrency_id if concurrency_id in self.groups else DEFAULT_GROUP
+            group = stats.setdefault(name, dict(waiting=0, running=0, rejected=0))
+            group["waiting"] += len(event_queue.queue)
+            group["running"] += event_queue.current_concurrency
+        for name, count in rejected.items():
+            stats[name]["rejected"] = count
+        return stats
+
+    def publish(self) -> None:
+        for name, group in self.snapshot().items():
+            self.metrics.add_dimension(name="ConcurrencyGroup", value=name)
+            self.metrics.add_metric(name="QueueWaitingEvents", unit=MetricUnit.Count, value=group["waiting"])
+            self.metrics.add_metric(name="QueueRunningEvents", unit=MetricUnit.Count, value=group["running"])
+            self.metrics.add_metric(name="QueueRejectedEvents", unit=MetricUnit.Count, value=group["rejected"])
+            self.metrics.flush_metrics()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="queue-metrics", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("Failed to publish the queue metrics")
+
+
+def configure_queue(blocks: gr.Blocks) -> gr.Blocks:
+    """Enable the queue of the Blocks with the sizes, group limits and metrics configured by the environment"""
+    blocks.queue(max_size=int_env("QUEUE_MAX_SIZE", 100))
+    metrics = QueueMetrics(blocks._queue, float(os.getenv("QUEUE_METRICS_INTERVAL", "60")))
+    limit_group_sizes(blocks._queue, on_reject=metrics.reject)
+    if metrics.interval > 0:
+        metrics.start()
+    groups = {
+        group.name: dict(concurrency_limit=group.concurrency_limit, max_size=group.max_size)
+        for group in GROUPS.values()
+    }
+    logger.info("Gradio queue configured", max_size=blocks._queue.max_size, groups=groups)
+    return blocks
+
+
+class QueueFullMiddleware:
+    """Adds `Retry-After` to the 503 Gradio answers a queue join with when the queue is full, so clients back off"""
+
+    def __init__(self, app: ASGIApp, retry_after: Optional[int] = None):
+        self.app = app
+        self.retry_after = str(retry_after if retry_after is not None else int_env("QUEUE_RETRY_AFTER", 5))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].endswith("/queue/join"):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] == 503:
+                MutableHeaders(scope=message).append("Retry-After", self.retry_after)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,7 +1,8 @@
+import logging
 from fastapi import Request
-from aws_lambda_powertools import Logger
+from gradio_app import logs
 
-logger = Logger(service="gradio_app.fixes")
+logger = logs.get_logger("gradio_app.fixes")
 
 
 # Gradio mounted with fastapi via https in behind proxy returns wrong path
@@ -12,10 +13,11 @@ def get_root_url(request: Request, route_path: str, root_path: str | None):
     monkeypatch the root_path function and provide an absolute root_path without host instead.
     Since we aret not including the host it works behind a proxy.
     """
-    logger.debug(
-        f"get_root_url() monkey patch returning root_path: {root_path}",
-        request_url_path=request.url.path,
-        route_path=route_path,
-        root_path=root_path,
-    )
+    if logger.isEnabledFor(logging.DEBUG):  # called for every url gradio builds, skip building the message
+        logger.debug(
+            f"get_root_url() monkey patch returning root_path: {root_path}",
+            request_url_path=request.url.path,
+            route_path=route_path,
+            root_path=root_path,
+        )
     return root_path
@@ -1,13 +1,14 @@
 from time import time
 import os
 import boto3
+import gradio as gr
 from starlette.requests import Request
-from aws_lambda_powertools import Logger
 from dotenv import load_dotenv
+from gradio_app import logs, models
 
 load_dotenv()
 
-logger = Logger(service="gradio_app.helpers")
+logger = logs.get_logger("gradio_app.helpers")
 
 
 def request_as_dict(request: Request) -> dict:
@@ -25,6 +26,44 @@ def request_as_dict(request: Request) -> dict:
     )
 
 
+def append_event_chunk(chatbot: list, index: int, event_chunk: dict) -> None:
+    """
+    Add an event of the InvokeAgent response stream to the chatbot history
+    param chatbot: list: The chatbot messages
+    param index: int: The position of the event in the stream. This will be prefixed to trace titles
+    param event_chunk: dict: A `chunk` (part of the answer) or `trace` event
+    """
+    if chunk := event_chunk.get("chunk"):
+        # This is a chunk of the AI response, add it to the chatbot history
+        chunk = models.EventStreamChunk.model_validate(chunk)
+        chatbot.append(gr.ChatMessage(role="assistant", content=chunk.text))
+
+    if event_trace := event_chunk.get("trace"):
+        # This is a trace chunk, get the message and add it to chatbot history (if it isnt already there)
+        for msg in models.EventStreamTrace.model_validate(event_trace).messages:
+            if not any(filter(lambda m: isinstance(m, dict) and m.get("content") == msg.content, chatbot)):
+                metadata = {"title": f"{index}. {msg.title}"}
+                chatbot.append(gr.ChatMessage(role="assistant", content=msg.content, metadata=metadata))
+
+
+def event_label(event_chunk: dict) -> str:
+    """
+    Short name of an InvokeAgent response event for the latency waterfall, ie. `chunk`,
+    `orchestrationTrace.rationale` or `orchestrationTrace.invocationInput:web_search.search`
+    """
+    if "chunk" in event_chunk:
+        return "chunk"
+    trace = event_chunk.get("trace", {}).get("trace", {})
+    trace_type, steps = next(iter(trace.items()), ("unknown", {}))
+    step, detail = next(iter(steps.items()), ("", {})) if isinstance(steps, dict) else ("", {})
+    label = f"{trace_type}.{step}" if step else trace_type
+    if step == "invocationInput" and (action_group := detail.get("actionGroupInvocationInput")):
+        label += f":{action_group.get('actionGroupName')}.{action_group.get('function')}"
+    elif step == "invocationInput" and detail.get("invocationType"):
+        label += f":{detail['invocationType']}"
+    return label
+
+
 class Boto:
     # A class to hold the client so that it can be reused
     _br_client: boto3.client = None
@@ -52,21 +91,18 @@ class Boto:
     def bedrock_runtime_client(self):
         if not self._brrt_client:
             self._brrt_client = self.client("bedrock-agent-runtime")
-        logger.debug("reusing exiting bedrock runtime client")
         return self._brrt_client
 
     @property
     def bedrock_client(self):
         if not self._br_client:
             self._br_client = self.client("bedrock-agent")
-        logger.debug("reusing exiting bedrock client")
         return self._br_client
 
     @property
     def s3_client(self):
         if not self._s3_client:
             self._s3_client = self.client("s3")
-        logger.debug("reusing exiting s3 client")
         return self._s3_client
 
 
@@ -1,14 +1,18 @@
 import os
 from textwrap import dedent
-from gradio_app import helpers
+import gradio as gr
+from gradio_app import helpers, logs, profiling
 import pandas as pd
-from aws_lambda_powertools import Logger
 
-logger = Logger(service="gradio_app.kb")
+logger = logs.get_logger("gradio_app.kb")
 
 
-def get_kb_ingestion_jobs(max_results=25) -> pd.DataFrame:
-    """Returns a DataFrame of the ingestion jobs for the knowledge base"""
+@profiling.profiled("kb.get_kb_ingestion_jobs")
+def get_kb_ingestion_jobs(max_results=25, request: gr.Request = None) -> pd.DataFrame:
+    """
+    Returns a DataFrame of the ingestion jobs for the knowledge base
+    param request: gr.Request: Populated by Gradio, lets the X-Profile header select the call for profiling
+    """
     datasource_id = os.environ.get("DATASOURCE_ID")
     kb_id = os.environ.get("KB_ID")
     logger.info(f"Getting ingestion jobs for datasource: {datasource_id} and kb: {kb_id}")
@@ -31,7 +35,8 @@ def get_kb_ingestion_jobs(max_results=25) -> pd.DataFrame:
     return df
 
 
-def get_kb_docs() -> str:
+@profiling.profiled("kb.get_kb_docs")
+def get_kb_docs(request: gr.Request = None) -> str:
     bucket_name = os.environ.get("KB_BUCKET")
     logger.info(f"Getting kb documents from bucket: {bucket_name}")
     response = helpers.BOTO.s3_client.list_objects_v2(Bucket=bucket_name)
@@ -63,6 +68,7 @@ def get_kb_docs() -> str:
     return df.to_html(escape=False)  # Return the HTML representation of the DataFrame
 
 
-def upload_kb_doc(file_path):
+@profiling.profiled("kb.upload_kb_doc")
+def upload_kb_doc(file_path, request: gr.Request = None):
     helpers.BOTO.s3_client.upload_file(file_path, os.environ.get("KB_BUCKET"), os.path.basename(file_path))
     return get_kb_docs()
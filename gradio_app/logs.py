@@ -0,0 +1,145 @@
+"""
+Loggers for the app that keep debug logging affordable in production.
+
+Gradio polls and streams through the app all the time, a few debug lines per request add up to a lot of synchronous
+stdout writes and CloudWatch ingestion. `get_logger()` returns a Powertools Logger whose records:
+
+* below INFO are sampled per logger, `LOG_SAMPLE_RATES="gradio_app.fixes=0.01,gradio_app.middleware=0.1"`
+  (`LOG_DEBUG_SAMPLE_RATE` is the default rate, 1)
+* below INFO are rate limited per call site to `LOG_RATE_LIMIT` records per second (0 to disable), the number of
+  dropped records is added to the next one as `suppressed`
+* are written to stdout by a background thread (`LOG_ASYNC=false` to write synchronously), formatting happens only
+  for the records that pass the filters. Lambda freezes the thread between invocations, `flush()` writes the queued
+  records before a response ends (see `middleware.LambdaRequestLogger`)
+* are written once, they dont propagate to the `gradio_app` logger
+
+Expensive debug messages should still be guarded with `logger.isEnabledFor(logging.DEBUG)`.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Optional, Tuple
+from aws_lambda_powertools import Logger
+
+DEFAULT_RATE_LIMIT = 20  # records per second per call site
+LOG_QUEUE: queue.SimpleQueue = queue.SimpleQueue()
+_listener: Optional[QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def sample_rates(value: Optional[str] = None) -> Dict[str, float]:
+    """Parse `LOG_SAMPLE_RATES`, `logger=rate` pairs separated by commas"""
+    value = os.getenv("LOG_SAMPLE_RATES", "") if value is None else value
+    rates = {}
+    for pair in filter(None, (pair.strip() for pair in value.split(","))):
+        name, _, rate = pair.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a `rate` fraction of the records below `level`"""
+
+    def __init__(self, rate: float, level: int = logging.INFO, rng: Callable[[], float] = random.random):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+        self._rng = rng
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.level or self.rate >= 1 or self._rng() < self.rate
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site for the records below `level`"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, level: int = logging.INFO, clock=time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or rate
+        self.level = level
+        self._clock = clock
+        self._buckets: Dict[Tuple[str, int], list] = {}  # call site -> [tokens, updated_at, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.level or self.rate <= 0:
+            return True
+        key, now = (record.pathname, record.lineno), self._clock()
+        with self._lock:
+            bucket = self._buckets.setdefault(key, [self.burst, now, 0])
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class _FlushMarker:
+    """Put on the queue by `flush()`, set once the listener got to it"""
+
+    def __init__(self):
+        self.written = threading.Event()
+
+
+class _Listener(QueueListener):
+    def handle(self, record) -> None:
+        if isinstance(record, _FlushMarker):
+            record.written.set()
+        else:
+            super().handle(record)
+
+
+def _start_listener() -> None:
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = _Listener(LOG_QUEUE, logging.StreamHandler(sys.stdout))
+            _listener.start()
+            atexit.register(stop_listener)
+
+
+def stop_listener() -> None:
+    """Write the queued records and stop the background writer"""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def flush(timeout: float = 1.0) -> bool:
+    """Wait up to `timeout` seconds for the background writer to write the records queued so far"""
+    if _listener is None:
+        return True
+    marker = _FlushMarker()
+    LOG_QUEUE.put(marker)
+    return marker.written.wait(timeout)
+
+
+def get_logger(service: str) -> Logger:
+    """A Powertools Logger with per logger sampling, per call site rate limiting and a background writer"""
+    if os.getenv("LOG_ASYNC", "true").lower() == "true":
+        handler = QueueHandler(LOG_QUEUE)  # formats the record, the listener thread writes it
+        _start_listener()
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+    rate = sample_rates().get(service, float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1")))
+    handler.addFilter(SamplingFilter(rate))
+    handler.addFilter(RateLimitFilter(float(os.getenv("LOG_RATE_LIMIT", DEFAULT_RATE_LIMIT))))
+    logger = Logger(service=service, logger_handler=handler)
+    # gradio_app.* are children of the gradio_app logger, without this its handler writes their records a second time
+    logging.getLogger(service).propagate = False
+    return logger
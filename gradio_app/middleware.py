@@ -1,31 +1,70 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.datastructures import MutableHeaders
-from aws_lambda_powertools import Logger
+import logging
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from gradio_app import logs
 
-logger = Logger(service="gradio_app.middeleware")
+logger = logs.get_logger("gradio_app.middleware")
 
+# Plain ASGI middleware rather than BaseHTTPMiddleware, which runs the app in a separate task and pipes every response
+# chunk through a memory stream. That adds latency to each streamed token and gets in the way of Gradio's SSE streams.
 
-class LambdaRequestLogger(BaseHTTPMiddleware):
-    """Middleware to log the incoming request"""
 
-    async def dispatch(self, request, call_next):
-        logger.debug(f"Request: {request.method} {request.url}", request=request.scope)
-        response = await call_next(request)
-        return response
+class LambdaRequestLogger:
+    """
+    Middleware to log the incoming request, only when debug logging is enabled.
+    Also writes the queued log records before the last chunk of each response: Lambda freezes the background writer
+    once the response is sent, the records of the invocation would wait for the next one or be lost.
+    """
 
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-class XForwardedHostMiddleware(BaseHTTPMiddleware):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "websocket") and logger.isEnabledFor(logging.DEBUG):
+            method = scope.get("method", "WEBSOCKET")
+            logger.debug(f"Request: {method} {scope['path']}", request=request_summary(scope))
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                await run_in_threadpool(logs.flush)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def request_summary(scope: Scope) -> dict:
+    """The parts of the scope worth logging, the full scope holds the app, router, session and more"""
+    return dict(
+        method=scope.get("method"),
+        path=scope["path"],
+        query_string=scope.get("query_string", b"").decode("latin-1"),
+        headers={key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]},
+        client=scope.get("client"),
+    )
+
+
+class XForwardedHostMiddleware:
     """Middleware to set the host header using the X-Forwarded-Host header"""
 
-    async def dispatch(self, request, call_next):
-        mutable_req_hdrs = MutableHeaders(request.headers)
-        if x_forwarded_host := mutable_req_hdrs.get("X-Forwarded-Host"):
-            logger.debug(
-                f"Replacing 'Host' header currently: '{mutable_req_hdrs.get('Host')}' "
-                f"with 'X-Forwarded-Host' header value: '{x_forwarded_host}'"
-            )
-            mutable_req_hdrs["Host"] = x_forwarded_host
-        request._headers = mutable_req_hdrs
-        request.scope.update(headers=request.headers.raw)
-        response = await call_next(request)
-        return response
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "websocket"):
+            forwarded_host = None
+            for key, value in scope["headers"]:
+                if key == b"x-forwarded-host":
+                    forwarded_host = value
+                    break
+            if forwarded_host is not None:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        f"Replacing 'Host' header with 'X-Forwarded-Host' header value: '{forwarded_host.decode()}'"
+                    )
+                # Starlette builds request.headers (and url, url_for) from the raw scope headers
+                scope["headers"] = [(key, value) for key, value in scope["headers"] if key != b"host"]
+                scope["headers"].append((b"host", forwarded_host))
+        await self.app(scope, receive, send)
@@ -1,13 +1,17 @@
 import os
 import json
+import asyncio
+import functools
+import time
 from typing import Optional
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
-from aws_lambda_powertools import Logger
+from gradio_app import logs
 from aws_lambda_powertools.utilities import parameters
-from authlib.integrations.starlette_client import OAuth, OAuthError
-from starlette.middleware.sessions import SessionMiddleware
+from authlib.integrations.starlette_client import OAuth, OAuthError, StarletteOAuth2App
 from starlette.responses import RedirectResponse
+from gradio_app.session_store import session_store_from_env
+from gradio_app.sessions import ServerSideSessionMiddleware, SignedCookieSessionMiddleware
 
 # Enable debug logging for authlib
 # import logging
@@ -18,7 +22,72 @@ from starlette.responses import RedirectResponse
 
 load_dotenv()
 
-logger = Logger(service="gradio_app.oauth.okta")
+logger = logs.get_logger("gradio_app.oauth.okta")
+
+# Values read from the Okta secret, each can be overridden by an environment variable of the same name
+OKTA_SETTINGS = ("OKTA_OAUTH2_ISSUER", "OKTA_OAUTH2_CLIENT_ID", "OKTA_OAUTH2_CLIENT_SECRET", "SESSION_SECRET")
+JWKS_TTL = 24 * 60 * 60  # seconds the Okta signing keys are used before they are fetched again
+JWKS_MIN_REFRESH_INTERVAL = 5 * 60  # an unknown key id refetches the keys at most this often
+
+
+@functools.lru_cache(maxsize=None)
+def okta_settings() -> dict:
+    """The Okta settings, the secret `OKTA_SECRET_ARN` is fetched once per container"""
+    settings = {}
+    if okta_secret_arn := os.getenv("OKTA_SECRET_ARN"):
+        logger.info(f"Getting Okta secret from {okta_secret_arn}")
+        settings.update(json.loads(parameters.get_secret(okta_secret_arn)))
+    settings.update({key: os.environ[key] for key in OKTA_SETTINGS if os.getenv(key)})
+    return settings
+
+
+class OktaOAuth2App(StarletteOAuth2App):
+    """
+    Authlib client that caches the Okta signing keys (JWKS) for `JWKS_TTL`.
+
+    Authlib refetches the keys when an ID token is signed with a key id it doesnt know (Okta rotated its keys), that
+    is limited to once every `JWKS_MIN_REFRESH_INTERVAL` so bogus tokens cant make every callback call Okta. When a
+    fetch fails the cached keys keep being used.
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._jwks: Optional[dict] = None
+        self._jwks_fetched_at = 0.0
+        self._jwks_lock: Optional[asyncio.Lock] = None
+
+    def _jwks_fresh(self, force: bool) -> bool:
+        age = self.clock() - self._jwks_fetched_at
+        return self._jwks is not None and age < (JWKS_MIN_REFRESH_INTERVAL if force else JWKS_TTL)
+
+    async def fetch_jwk_set(self, force: bool = False) -> dict:
+        if self._jwks_fresh(force):
+            return self._jwks
+        self._jwks_lock = self._jwks_lock or asyncio.Lock()
+        async with self._jwks_lock:  # concurrent callbacks share one fetch
+            if self._jwks_fresh(force):
+                return self._jwks
+            start = self.clock()
+            try:
+                self._jwks = await super().fetch_jwk_set(force=True)
+            except Exception:
+                if self._jwks is None:
+                    raise
+                logger.exception("Failed to refresh the Okta JWKS, using the cached keys")
+                self._jwks_fetched_at = self.clock() - JWKS_TTL + JWKS_MIN_REFRESH_INTERVAL  # retry later
+            else:
+                logger.info("Fetched Okta JWKS", duration_ms=round((self.clock() - start) * 1000, 1), force=force)
+                self._jwks_fetched_at = self.clock()
+        return self._jwks
+
+    async def warm_jwk_set(self) -> None:
+        """Fetch the keys while the user is on the Okta login page so the callback doesnt have to"""
+        try:
+            await self.fetch_jwk_set()
+        except Exception:
+            logger.exception("Failed to prefetch the Okta JWKS, it will be fetched by the callback")
 
 
 def get_user(request: Request) -> Optional[str]:
@@ -27,23 +96,25 @@ def get_user(request: Request) -> Optional[str]:
 
 def init_okta(app: FastAPI) -> FastAPI:
     # Configure OAuth
-    if okta_secret_arn := os.getenv("OKTA_SECRET_ARN"):
-        logger.info(f"Getting Okta secret from {okta_secret_arn}")
-        okta_secret = json.loads(parameters.get_secret(okta_secret_arn))
+    settings = okta_settings()
     oauth = OAuth()
-    okta_issuer = os.getenv("OKTA_OAUTH2_ISSUER") or okta_secret.get("OKTA_OAUTH2_ISSUER")
+    okta_issuer = settings.get("OKTA_OAUTH2_ISSUER")
     oauth.register(
         name="okta",
-        client_id=os.getenv("OKTA_OAUTH2_CLIENT_ID") or okta_secret.get("OKTA_OAUTH2_CLIENT_ID"),
-        client_secret=os.getenv("OKTA_OAUTH2_CLIENT_SECRET") or okta_secret.get("OKTA_OAUTH2_CLIENT_SECRET"),
+        client_cls=OktaOAuth2App,
+        client_id=settings.get("OKTA_OAUTH2_CLIENT_ID"),
+        client_secret=settings.get("OKTA_OAUTH2_CLIENT_SECRET"),
         access_token_url=f"{okta_issuer}/v1/token",
         authorize_url=f"{okta_issuer}/v1/authorize",
         # redirect_uri=f"{os.getenv('HOST_NAME') or 'http://localhost:8080'}/auth",
         jwks_uri=f"{okta_issuer}/v1/keys",
         client_kwargs={"scope": "openid email profile"},
     )
-    SECRET_KEY = os.getenv("SESSION_SECRET") or okta_secret.get("SESSION_SECRET")
-    app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
+    if store := session_store_from_env():  # the cookie is only a session id
+        app.add_middleware(ServerSideSessionMiddleware, store=store)
+    else:
+        app.add_middleware(SignedCookieSessionMiddleware, secret_key=settings.get("SESSION_SECRET"))
+    background_tasks = set()  # keep a reference so the tasks arent garbage collected
 
     @app.route("/logout")
     async def logout(request: Request):
@@ -52,16 +123,22 @@ def init_okta(app: FastAPI) -> FastAPI:
 
     @app.route("/login")
     async def login(request: Request):
+        task = asyncio.create_task(oauth.okta.warm_jwk_set())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
         # This is the URL that the Okta login page will redirect back to after authentication
         return await oauth.okta.authorize_redirect(request, request.url_for("auth"))
 
     @app.route("/auth")
     async def auth(request: Request):
+        start = time.perf_counter()
         try:
             access_token = await oauth.okta.authorize_access_token(request)
-        except OAuthError:
+        except OAuthError as e:
+            logger.warning(f"Okta authorization failed: {e}")
             return RedirectResponse(url="/")
         request.session["user"] = dict(access_token)["userinfo"]
+        logger.info("Okta callback", duration_ms=round((time.perf_counter() - start) * 1000, 1))
         return RedirectResponse(url="/")
 
     return app
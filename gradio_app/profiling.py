@@ -0,0 +1,211 @@
+"""
+Opt-in sampling profiler for the Gradio event handlers.
+
+A profiled call registers the threads it runs on (Gradio runs each step of a generator in a worker thread) and a
+single sampler thread records their stacks every `PROFILE_INTERVAL_MS`. Nothing runs when no call is profiled. The
+profile is written in the collapsed stack format (`frame;frame;frame count`, the flame graph input) to `PROFILE_DIR`
+or `PROFILE_S3_URI`, named after the handler and tagged with the request id. Merge them with `tools/merge_profiles.py`.
+
+Calls are profiled when:
+* `PROFILE_SAMPLE_RATE` (0 to 1, default 0) selects them at random
+* the request has the header `X-Profile` set to `PROFILE_TOKEN` (only when `PROFILE_TOKEN` is set)
+"""
+
+import functools
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Dict, Optional, Set
+import boto3
+import gradio as gr
+from gradio_app import logs
+
+logger = logs.get_logger("gradio_app.profiling")
+
+DEFAULT_INTERVAL_MS = 10
+DEFAULT_PROFILE_DIR = "/tmp/profiles"  # the only writable directory in Lambda
+PROFILE_HEADER = "x-profile"
+
+
+class Profile:
+    """The stack samples of one profiled call"""
+
+    def __init__(self, name: str, request_id: str):
+        self.name = name
+        self.request_id = request_id
+        self.stacks: Counter = Counter()
+        self.threads: Set[int] = set()
+        self.started = time.time()
+        self.duration = 0.0
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    @property
+    def key(self) -> str:
+        started = time.strftime("%Y%m%dT%H%M%S", time.gmtime(self.started))
+        return f"{self.name}/{started}-{self.request_id}.collapsed"
+
+
+def collapse(frame) -> str:
+    """The stack of the frame, root first, as `function (file:line);...`"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":"))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """Samples the threads of the active profiles, the thread only runs while there are some"""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL_MS / 1000):
+        self.interval = interval
+        self._profiles: Set[Profile] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def stop(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def sample(self) -> None:
+        frames = sys._current_frames()
+        with self._lock:
+            profiles = list(self._profiles)
+        for profile in profiles:
+            for thread_id in list(profile.threads):
+                if (frame := frames.get(thread_id)) is not None:
+                    profile.stacks[collapse(frame)] += 1
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+            self.sample()
+            time.sleep(self.interval)
+
+
+SAMPLER = Sampler(float(os.getenv("PROFILE_INTERVAL_MS", DEFAULT_INTERVAL_MS)) / 1000)
+
+
+def write_profile(profile: Profile) -> str:
+    """Write the collapsed stacks to `PROFILE_S3_URI` or `PROFILE_DIR`, returns where"""
+    if s3_uri := os.getenv("PROFILE_S3_URI"):
+        bucket, _, prefix = s3_uri[len("s3://") :].partition("/")  # noqa: E203
+        key = f"{prefix.rstrip('/')}/{profile.key}".lstrip("/")
+        boto3.client("s3").put_object(Bucket=bucket, Key=key, Body=profile.collapsed().encode("utf-8"))
+        return f"s3://{bucket}/{key}"
+    path = os.path.join(os.getenv("PROFILE_DIR", DEFAULT_PROFILE_DIR), *profile.key.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(profile.collapsed())
+    return path
+
+
+def _finish(profile: Profile) -> None:
+    try:
+        location = write_profile(profile)
+        logger.info(
+            f"Profile of {profile.name} written to {location}",
+            profile=profile.name,
+            request_id=profile.request_id,
+            samples=sum(profile.stacks.values()),
+            duration_ms=round(profile.duration * 1000, 1),
+        )
+    except Exception:
+        logger.exception(f"Failed to write the profile of {profile.name}")
+
+
+def should_profile(headers: Dict[str, str]) -> bool:
+    if (token := os.getenv("PROFILE_TOKEN")) and headers.get(PROFILE_HEADER) == token:
+        return True
+    rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    return rate > 0 and random.random() < rate
+
+
+def request_id(headers: Dict[str, str]) -> str:
+    """The Lambda (function url) trace id of the request if there is one, a random id otherwise"""
+    return headers.get("x-amzn-trace-id", "").replace("Root=", "").split(";")[0] or uuid.uuid4().hex
+
+
+def profiled(name: str) -> Callable:
+    """
+    Decorator for Gradio event handlers (functions or generators), profiles the calls selected by `should_profile()`.
+    The `gr.Request` is taken from the call arguments, the `X-Profile` header only works for handlers that take one
+    (`request: gr.Request = None`, Gradio fills it in).
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        def start(args, kwargs) -> Optional[Profile]:
+            request = next((a for a in [*args, *kwargs.values()] if isinstance(a, gr.Request)), None)
+            headers = dict(request.headers) if request is not None and request.headers is not None else {}
+            if not should_profile(headers):
+                return None
+            return Profile(name, request_id(headers))
+
+        def run(profile: Profile, step: Callable):
+            thread_id = threading.get_ident()
+            profile.threads.add(thread_id)
+            SAMPLER.start(profile)
+            started = time.perf_counter()
+            try:
+                return step()
+            finally:
+                profile.duration += time.perf_counter() - started
+                profile.threads.discard(thread_id)
+
+        def finish(profile: Profile) -> None:
+            SAMPLER.stop(profile)
+            threading.Thread(target=_finish, args=(profile,), name="profile-writer", daemon=True).start()
+
+        if inspect.isgeneratorfunction(fn):
+
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                if (profile := start(args, kwargs)) is None:
+                    yield from fn(*args, **kwargs)
+                    return
+                generator = None
+                try:
+                    generator = run(profile, lambda: fn(*args, **kwargs))
+                    while True:
+                        try:  # each step can run on a different thread
+                            value = run(profile, lambda: next(generator))
+                        except StopIteration:
+                            return
+                        yield value
+                finally:
+                    if generator is not None:
+                        generator.close()  # when gradio closed this one, ie. the user cancelled
+                    finish(profile)
+
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if (profile := start(args, kwargs)) is None:
+                return fn(*args, **kwargs)
+            try:
+                return run(profile, lambda: fn(*args, **kwargs))
+            finally:
+                finish(profile)
+
+        return wrapper
+
+    return decorator
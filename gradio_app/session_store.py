@@ -0,0 +1,194 @@
+"""
+Server side session storage for `sessions.ServerSideSessionMiddleware`, the session cookie only carries an opaque id.
+
+* `SessionStore` holds a session's json payload and its expiry (epoch seconds) by session id.
+* `MemorySessionStore` is a LRU for a single container, `SQLiteSessionStore` a local file (tests, local runs) and
+  `DynamoDBSessionStore` is shared by every container of the app so sessions survive cold starts and scaling.
+* `CachedSessionStore` reads through a short lived memory cache so polls dont hit the durable store.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+import boto3
+from gradio_app import logs
+
+logger = logs.get_logger("gradio_app.session_store")
+
+Record = Tuple[str, float]  # (json payload, expires at)
+
+
+class SessionStore(ABC):
+    """Holds sessions by id"""
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Record]:
+        """The payload and expiry of the session, None if it doesnt exist or has expired"""
+
+    @abstractmethod
+    def save(self, session_id: str, payload: str, expires_at: float) -> None:
+        """Create or replace the session"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Remove the session, if it exists"""
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions of a single container, the least recently used are dropped beyond `max_entries`"""
+
+    def __init__(self, max_entries: int = 1024, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._sessions: OrderedDict[str, Record] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[Record]:
+        with self._lock:
+            if (record := self._sessions.get(session_id)) is None:
+                return None
+            if record[1] <= self._clock():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return record
+
+    def save(self, session_id: str, payload: str, expires_at: float) -> None:
+        with self._lock:
+            self._sessions[session_id] = (payload, expires_at)
+            self._sessions.move_to_end(session_id)
+            if len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a local SQLite database, processes using the same file share them"""
+
+    def __init__(self, path: str = ":memory:", clock: Callable[[], float] = time.time):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(id TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def load(self, session_id: str) -> Optional[Record]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT payload, expires_at FROM sessions WHERE id = ? AND expires_at > ?", (session_id, self._clock())
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def save(self, session_id: str, payload: str, expires_at: float) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO sessions (id, payload, expires_at) VALUES (?, ?, ?)",
+                (session_id, payload, expires_at),
+            )
+            self._connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (self._clock(),))
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+class DynamoDBSessionStore(SessionStore):
+    """
+    Sessions in a DynamoDB table with a string partition key `pk`, `expiresAt` should be the table's TTL attribute.
+    DynamoDB deletes expired items lazily, so the expiry is also checked on load.
+    """
+
+    def __init__(self, table_name: str, client=None, clock: Callable[[], float] = time.time):
+        self.table_name = table_name
+        self._client = client
+        self._clock = clock
+
+    @property
+    def client(self):
+        if not self._client:
+            self._client = boto3.client("dynamodb")
+        return self._client
+
+    def load(self, session_id: str) -> Optional[Record]:
+        # consistent, the session is read right after the login callback wrote it
+        item = self.client.get_item(TableName=self.table_name, Key={"pk": {"S": session_id}}, ConsistentRead=True)
+        if (item := item.get("Item")) is None or float(item["expiresAt"]["N"]) <= self._clock():
+            return None
+        return item["payload"]["S"], float(item["expiresAt"]["N"])
+
+    def save(self, session_id: str, payload: str, expires_at: float) -> None:
+        item = {"pk": {"S": session_id}, "payload": {"S": payload}, "expiresAt": {"N": str(int(expires_at))}}
+        self.client.put_item(TableName=self.table_name, Item=item)
+
+    def delete(self, session_id: str) -> None:
+        self.client.delete_item(TableName=self.table_name, Key={"pk": {"S": session_id}})
+
+
+class CachedSessionStore(SessionStore):
+    """
+    Read through memory cache in front of a durable store. A session changed by another container (ie. a logout) is
+    seen here after at most `ttl` seconds.
+    """
+
+    def __init__(
+        self, store: SessionStore, ttl: float = 60, max_entries: int = 1024, clock: Callable[[], float] = time.time
+    ):
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._cache: OrderedDict[str, Tuple[Optional[Record], float]] = OrderedDict()  # id -> (record, cached until)
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[Record]:
+        now = self._clock()
+        with self._lock:
+            if (cached := self._cache.get(session_id)) is not None and cached[1] > now:
+                self._cache.move_to_end(session_id)
+                record = cached[0]
+                return record if record is None or record[1] > now else None
+        record = self.store.load(session_id)
+        self._remember(session_id, record)  # misses are cached too
+        return record
+
+    def save(self, session_id: str, payload: str, expires_at: float) -> None:
+        self.store.save(session_id, payload, expires_at)
+        self._remember(session_id, (payload, expires_at))
+
+    def delete(self, session_id: str) -> None:
+        self.store.delete(session_id)
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def _remember(self, session_id: str, record: Optional[Record]) -> None:
+        with self._lock:
+            self._cache[session_id] = (record, self._clock() + self.ttl)
+            self._cache.move_to_end(session_id)
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+
+def session_store_from_env() -> Optional[SessionStore]:
+    """
+    The session store configured by the environment, None for signed cookie sessions
+    `SESSION_TABLE`: DynamoDB table name, `SESSION_DB`: SQLite file, `SESSION_STORE=memory`: this container only
+    """
+    if table_name := os.getenv("SESSION_TABLE"):
+        logger.info(f"Storing sessions in DynamoDB table {table_name}")
+        return CachedSessionStore(DynamoDBSessionStore(table_name), ttl=float(os.getenv("SESSION_CACHE_TTL", "60")))
+    if path := os.getenv("SESSION_DB"):
+        logger.info(f"Storing sessions in SQLite database {path}")
+        return SQLiteSessionStore(path)
+    if os.getenv("SESSION_STORE") == "memory":
+        return MemorySessionStore()
+    return None
@@ -0,0 +1,202 @@
+"""
+Sessions without the per-request cost of Starlette's `SessionMiddleware`.
+
+Starlette's middleware verifies the cookie (two HMACs, base64 and json) on every request and, whenever the session is
+not empty, serializes and signs it again and sends a new `Set-Cookie` with every response, including every Gradio
+queue poll. `SignedCookieSessionMiddleware` uses the same cookie format, so existing sessions stay valid, but:
+
+- remembers the cookies it has verified (LRU), a known cookie only needs its age checked and its payload parsed
+- only sends `Set-Cookie` when the session changed, or to slide the expiry once the cookie is `refresh_after` old
+
+`ServerSideSessionMiddleware` keeps the session in a `session_store.SessionStore` instead, the cookie only carries a
+random session id. Requests dont carry (and the app doesnt verify) the Okta userinfo in a multi KB cookie.
+"""
+
+import json
+import re
+import secrets
+import time
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from typing import Literal, Optional, Tuple
+import itsdangerous
+from itsdangerous.exc import BadSignature
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from gradio_app.session_store import SessionStore
+
+DEFAULT_MAX_AGE = 14 * 24 * 60 * 60  # 14 days, same as Starlette
+DEFAULT_REFRESH_AFTER = 24 * 60 * 60  # re-sign an unchanged session once a day to keep its expiry sliding
+DEFAULT_CACHE_SIZE = 1024  # verified cookies remembered per container
+SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{43}$")  # secrets.token_urlsafe(32)
+
+
+class SignedCookieSessionMiddleware:
+    """Drop in replacement for `starlette.middleware.sessions.SessionMiddleware`"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        secret_key: str,
+        session_cookie: str = "session",
+        max_age: Optional[int] = DEFAULT_MAX_AGE,
+        path: str = "/",
+        same_site: Literal["lax", "strict", "none"] = "lax",
+        https_only: bool = False,
+        domain: Optional[str] = None,
+        refresh_after: int = DEFAULT_REFRESH_AFTER,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        """
+        param secret_key: str: key the cookies are signed with
+        param max_age: int: seconds a cookie is valid after it was signed, None for browser session cookies
+        param refresh_after: int: seconds after which an unchanged session is signed again
+        param cache_size: int: number of verified cookies to remember
+        """
+        self.app = app
+        self.signer = itsdangerous.TimestampSigner(str(secret_key))
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.refresh_after = refresh_after if max_age is None else min(refresh_after, max_age)
+        self.cache_size = cache_size
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:  # Secure flag can be used with HTTPS only
+            self.security_flags += "; secure"
+        if domain is not None:
+            self.security_flags += f"; domain={domain}"
+        self.cookie_attributes = f"path={path}; " + (f"Max-Age={max_age}; " if max_age else "")
+        self.clear_cookie = f"{session_cookie}=null; path={path}; expires=Thu, 01 Jan 1970 00:00:00 GMT; "
+        self._verified: OrderedDict[str, Tuple[str, int]] = OrderedDict()  # cookie -> (payload, signed_at)
+
+    def get_cookie(self, scope: Scope) -> Optional[str]:
+        for key, value in scope["headers"]:
+            if key == b"cookie":
+                return cookie_parser(value.decode("latin-1")).get(self.session_cookie)
+        return None
+
+    def verify(self, cookie: str) -> Optional[Tuple[str, int]]:
+        """The json payload and signing time of a valid cookie, None if it is invalid or expired"""
+        if (verified := self._verified.get(cookie)) is None:
+            try:
+                data, signed_at = self.signer.unsign(cookie.encode("utf-8"), return_timestamp=True)
+                verified = b64decode(data).decode("utf-8"), int(signed_at.timestamp())
+            except (BadSignature, ValueError):
+                return None
+            self._remember(cookie, verified)
+        else:
+            self._verified.move_to_end(cookie)
+        if self.max_age is not None and time.time() - verified[1] > self.max_age:
+            self._verified.pop(cookie, None)
+            return None
+        return verified
+
+    def sign(self, payload: str) -> str:
+        cookie = self.signer.sign(b64encode(payload.encode("utf-8"))).decode("utf-8")
+        self._remember(cookie, (payload, int(time.time())))
+        return cookie
+
+    def _remember(self, cookie: str, verified: Tuple[str, int]) -> None:
+        self._verified[cookie] = verified
+        if len(self._verified) > self.cache_size:
+            self._verified.popitem(last=False)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        cookie = self.get_cookie(scope)
+        verified = self.verify(cookie) if cookie else None
+        scope["session"] = json.loads(verified[0]) if verified else {}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                if session := scope["session"]:
+                    payload = json.dumps(session)
+                    if not verified or payload != verified[0] or time.time() - verified[1] >= self.refresh_after:
+                        header = f"{self.session_cookie}={self.sign(payload)}; {self.cookie_attributes}"
+                        MutableHeaders(scope=message).append("Set-Cookie", header + self.security_flags)
+                elif verified:  # The session has been cleared.
+                    MutableHeaders(scope=message).append("Set-Cookie", self.clear_cookie + self.security_flags)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class ServerSideSessionMiddleware:
+    """Session middleware that keeps the session in a `SessionStore`, the cookie is an opaque session id"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: SessionStore,
+        session_cookie: str = "session_id",
+        max_age: int = DEFAULT_MAX_AGE,
+        path: str = "/",
+        same_site: Literal["lax", "strict", "none"] = "lax",
+        https_only: bool = False,
+        domain: Optional[str] = None,
+        refresh_after: int = DEFAULT_REFRESH_AFTER,
+    ):
+        """
+        param store: SessionStore: where the sessions are kept
+        param max_age: int: seconds a session lives after it was last saved
+        param refresh_after: int: seconds after which an unchanged session is saved again to extend its expiry
+        """
+        self.app = app
+        self.store = store
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.refresh_after = min(refresh_after, max_age)
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:  # Secure flag can be used with HTTPS only
+            self.security_flags += "; secure"
+        if domain is not None:
+            self.security_flags += f"; domain={domain}"
+        self.cookie_attributes = f"path={path}; Max-Age={max_age}; "
+        self.clear_cookie = f"{session_cookie}=null; path={path}; expires=Thu, 01 Jan 1970 00:00:00 GMT; "
+
+    def get_session_id(self, scope: Scope) -> Optional[str]:
+        for key, value in scope["headers"]:
+            if key == b"cookie":
+                session_id = cookie_parser(value.decode("latin-1")).get(self.session_cookie)
+                return session_id if session_id and SESSION_ID.match(session_id) else None
+        return None
+
+    def save(self, session_id: str, payload: str) -> str:
+        """Save the session, returns the Set-Cookie header value"""
+        self.store.save(session_id, payload, time.time() + self.max_age)
+        return f"{self.session_cookie}={session_id}; {self.cookie_attributes}{self.security_flags}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        # The store calls are synchronous (sqlite, DynamoDB), they run in the threadpool so a slow store doesnt block
+        # the event loop and every other stream. A `CachedSessionStore` still keeps most requests off the durable store.
+        session_id = self.get_session_id(scope)
+        record = await run_in_threadpool(self.store.load, session_id) if session_id else None
+        scope["session"] = json.loads(record[0]) if record else {}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                if session := scope["session"]:
+                    payload = json.dumps(session)
+                    if not record or payload != record[0]:
+                        # a new id whenever the session changes (ie. login), so an id seen before login is useless
+                        if record:
+                            await run_in_threadpool(self.store.delete, session_id)
+                        header = await run_in_threadpool(self.save, secrets.token_urlsafe(32), payload)
+                        MutableHeaders(scope=message).append("Set-Cookie", header)
+                    elif record[1] - time.time() <= self.max_age - self.refresh_after:
+                        header = await run_in_threadpool(self.save, session_id, payload)
+                        MutableHeaders(scope=message).append("Set-Cookie", header)
+                elif record:  # The session has been cleared.
+                    await run_in_threadpool(self.store.delete, session_id)
+                    MutableHeaders(scope=message).append("Set-Cookie", self.clear_cookie + self.security_flags)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,132 @@
+"""
+Cache friendly responses for the Gradio frontend assets.
+
+Gradio serves its JS, CSS and fonts from `/assets` (vite build output, the file names contain a content hash) and
+`/static` without any caching headers, so every page load invokes the Lambda for each of them. `StaticAssetMiddleware`
+answers those paths itself with a long `Cache-Control` (immutable for the hashed files), an ETag and, if the browser
+accepts it, a precompressed brotli or gzip variant, so CloudFront and the browser can keep them.
+
+The variants are written next to the assets when the image is built (the Lambda file system is read only):
+
+    python gradio_app/static.py
+
+brotli variants need the optional `brotli` package, gzip variants are always written.
+"""
+
+import gzip
+import mimetypes
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+from starlette.responses import FileResponse
+
+try:
+    import brotli
+except ImportError:  # optional, only needed to precompress
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_CACHE_CONTROL = "public, max-age=86400"
+HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8}\.[a-z0-9]+$")  # ie. Blocks-CyfcXtBq.js
+COMPRESSIBLE = (".js", ".mjs", ".css", ".html", ".json", ".svg", ".txt", ".ttf", ".otf", ".eot", ".wasm")
+MIN_COMPRESS_SIZE = 1024  # smaller files arent worth a variant
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]  # in order of preference
+
+
+def gradio_asset_dirs() -> Dict[str, str]:
+    """The url path (below the Gradio mount) and directory of the Gradio frontend assets"""
+    from gradio.routes import BUILD_PATH_LIB, STATIC_PATH_LIB
+
+    return {"/assets/": str(BUILD_PATH_LIB), "/static/": str(STATIC_PATH_LIB)}
+
+
+def cache_control(path: str) -> str:
+    return IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(path) else STATIC_CACHE_CONTROL
+
+
+def accepted_encodings(headers: List[Tuple[bytes, bytes]]) -> List[str]:
+    encodings = []
+    for key, value in headers:
+        if key == b"accept-encoding":
+            for part in value.decode("latin-1").lower().split(","):
+                encoding, *params = [param.strip() for param in part.split(";")]
+                if "q=0" not in params:  # explicitly refused
+                    encodings.append(encoding)
+    return encodings
+
+
+def precompress(directory: str, quality: int = 11) -> Tuple[int, int]:
+    """Write .br (if brotli is installed) and .gz variants of the compressible files, returns (files, variants)"""
+    files = variants = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            if not name.endswith(COMPRESSIBLE) or os.path.getsize(path) < MIN_COMPRESS_SIZE:
+                continue
+            files += 1
+            with open(path, "rb") as f:
+                data = f.read()
+            compressed = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli:
+                compressed[".br"] = brotli.compress(data, quality=quality)
+            for suffix, body in compressed.items():
+                if len(body) < len(data):
+                    with open(path + suffix, "wb") as f:
+                        f.write(body)
+                    variants += 1
+    return files, variants
+
+
+class StaticAssetMiddleware:
+    """Serve the Gradio frontend assets below `mount_path` with caching headers and precompressed variants"""
+
+    def __init__(self, app, mount_path: str = "/gradio", asset_dirs: Optional[Dict[str, str]] = None):
+        """
+        param mount_path: str: the path Gradio is mounted at
+        param asset_dirs: Dict[str, str]: url path below the mount to directory, defaults to `gradio_asset_dirs()`
+        """
+        self.app = app
+        self.routes = [
+            (mount_path.rstrip("/") + prefix, os.path.realpath(directory))
+            for prefix, directory in (asset_dirs or gradio_asset_dirs()).items()
+        ]
+
+    def resolve(self, path: str) -> Optional[str]:
+        """The file for an asset path, None if it isnt one (or tries to leave the asset directory)"""
+        for prefix, directory in self.routes:
+            if path.startswith(prefix):
+                file_path = os.path.realpath(os.path.join(directory, path[len(prefix) :]))  # noqa: E203
+                if file_path.startswith(directory + os.sep) and os.path.isfile(file_path):
+                    return file_path
+        return None
+
+    async def __call__(self, scope, receive, send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("GET", "HEAD")
+            or not (file := self.resolve(scope["path"]))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = {"Cache-Control": cache_control(file), "Vary": "Accept-Encoding"}
+        media_type = mimetypes.guess_type(file)[0] or "application/octet-stream"
+        accepted = accepted_encodings(scope["headers"])
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and os.path.isfile(file + suffix):
+                file = file + suffix
+                headers["Content-Encoding"] = encoding
+                break
+        await FileResponse(file, headers=headers, media_type=media_type)(scope, receive, send)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompress the Gradio frontend assets")
+    parser.add_argument("directories", nargs="*", help="default: the installed Gradio's asset directories")
+    parser.add_argument("--quality", type=int, default=11, help="brotli quality")
+    args = parser.parse_args()
+    for directory in args.directories or gradio_asset_dirs().values():
+        files, variants = precompress(directory, args.quality)
+        print(f"{directory}: {variants} variants of {files} files{'' if brotli else ' (gzip only, brotli missing)'}")
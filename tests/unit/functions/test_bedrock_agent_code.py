@@ -0,0 +1,93 @@
+from unittest import mock
+import pytest
+from cdk.functions import bedrock_agent_code
+from cdk.functions.waiter import Waiter, WaiterError
+from tests.unit.mock_clients import FakeBedrockAgentClient
+
+
+@pytest.fixture
+def client():
+    return FakeBedrockAgentClient(aliases=["live"])
+
+
+def make_agent(client: FakeBedrockAgentClient, **kwargs) -> bedrock_agent_code.Agent:
+    agent = bedrock_agent_code.Agent(client.agent_id, waiter=Waiter(sleep=lambda _: None), **kwargs)
+    agent._client = client
+    return agent
+
+
+@pytest.fixture
+def agent(client):
+    return make_agent(client)
+
+
+def test_create_code_action_group_lists_once(agent, client):
+    action_group_id = agent.create_agent_code_action_group("live")
+    assert client.action_group_details[action_group_id]["actionGroupName"] == bedrock_agent_code.AGENT_GROUP_NAME
+    # the alias points at the new version and the temporary alias is gone
+    assert [alias["agentAliasName"] for alias in client.alias_details.values()] == ["live"]
+    assert agent._get_agent_alias_version_number("live") == "2"
+    assert client.calls["list_agent_aliases"] == 1
+    assert client.calls["list_agent_action_groups"] == 1
+
+
+def test_delete_code_action_group_updates_cache(agent, client):
+    agent.create_agent_code_action_group("live")
+    agent.delete_code_action_group("live")
+    assert client.action_group_details == {}
+    assert agent._get_action_group_id(bedrock_agent_code.AGENT_GROUP_NAME) is None
+    assert agent._get_agent_alias_version_number("live") == "3"
+    assert client.calls["list_agent_aliases"] == 1
+    assert client.calls["list_agent_action_groups"] == 1
+
+
+def test_prepare_if_needed_skips_check_after_own_prepare(agent, client):
+    agent._prepare_if_needed()  # prepares
+    agent._prepare_if_needed()
+    assert client.calls["prepare_agent"] == 1
+
+
+def test_delete_without_code_action_group_still_prepares(agent, client):
+    state = agent.start("Delete", "live")
+    assert client.calls["prepare_agent"] == 1
+    assert client.calls["delete_agent_action_group"] == 0
+    assert state["prepared_at"]
+
+
+def test_steps_resume_in_new_invocations():
+    """Every isComplete invocation gets a new Agent, only the state returned by start() is carried"""
+    client = FakeBedrockAgentClient(aliases=["live"], alias_polls=2)
+    state = make_agent(client).start("Create", "live")
+    assert state["previous_version"] == "1"
+    steps = 1
+    while not make_agent(client).step("live", state):
+        steps += 1
+        assert steps < 20
+    assert steps > 3  # waited on the temporary alias and the alias update
+    assert [alias["agentAliasName"] for alias in client.alias_details.values()] == ["live"]
+    assert make_agent(client)._get_agent_alias_version_number("live") == "2"
+    assert client.calls["create_agent_alias"] == 1
+    assert client.calls["update_agent_alias"] == 1
+    assert make_agent(client).step("live", state)  # repeated calls stay complete
+
+
+def test_step_reports_failed_alias(agent, client):
+    state = agent.start("Create", "live")
+    assert not agent.step("live", state)  # creates the temporary alias
+    temp_alias_id = agent._get_alias_id(state["temp_alias_name"])
+    client.alias_details[temp_alias_id].update(agentAliasStatus="FAILED", failureReasons=["bad version"])
+    with pytest.raises(WaiterError, match="bad version"):
+        agent.step("live", state)
+
+
+def test_handlers_like_the_provider(client, monkeypatch):
+    monkeypatch.setattr(bedrock_agent_code.boto3, "client", lambda *args, **kwargs: client)
+    event = {
+        "RequestType": "Create",
+        "ResourceProperties": {"agent_id": client.agent_id, "agent_alias_name": "live"},
+    }
+    result = bedrock_agent_code.lambda_handler(event, mock.MagicMock())
+    assert result["PhysicalResourceId"] in client.action_group_details
+    while not bedrock_agent_code.is_complete_handler({**event, **result}, mock.MagicMock())["IsComplete"]:
+        pass
+    assert client.alias_details["ALIAS1"]["routingConfiguration"] == [{"agentVersion": "2"}]
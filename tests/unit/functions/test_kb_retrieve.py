@@ -0,0 +1,62 @@
+from unittest import mock
+import json
+import pytest
+from cdk.functions import kb_retrieve
+from cdk.functions.action_group import WARMER_EVENT
+from tests.unit.mock_data import bedrock_event
+
+
+@pytest.fixture
+def runtime_client():
+    client = mock.MagicMock()
+    client.retrieve.return_value = {
+        "retrievalResults": [
+            {
+                "content": {"text": "30 days notice"},
+                "location": {"s3Location": {"uri": "s3://kb/acme.md"}},
+                "score": 0.9,
+            }
+        ]
+    }
+    kb_retrieve.CACHE._entries.clear()
+    with mock.patch.object(kb_retrieve, "client", return_value=client):
+        yield client
+
+
+def call(query: str, **parameters) -> kb_retrieve.BedrockResponseEvent:
+    event = dict(bedrock_event, function="retrieve")
+    event["parameters"] = [{"name": "query", "type": "string", "value": query}] + [
+        {"name": name, "type": "string", "value": value} for name, value in parameters.items()
+    ]
+    return kb_retrieve.BedrockResponseEvent.model_validate(kb_retrieve.lambda_handler(event, mock.MagicMock()))
+
+
+@mock.patch.dict("os.environ", {"KB_ID": "KB"})
+def test_lambda_handler_caches_retrieve(runtime_client):
+    response = call("What is the notice period?")
+    body = json.loads(response.response.functionResponse.responseBody["TEXT"].body)
+    assert body == [{"content": "30 days notice", "uri": "s3://kb/acme.md", "score": 0.9}]
+    assert runtime_client.retrieve.call_args.kwargs["knowledgeBaseId"] == "KB"
+
+    call("what is the notice period")
+    assert runtime_client.retrieve.call_count == 1
+    call("what is the notice period", filter=json.dumps({"equals": {"key": "type", "value": "contract"}}))
+    assert runtime_client.retrieve.call_count == 2
+    configuration = runtime_client.retrieve.call_args.kwargs["retrievalConfiguration"]
+    assert configuration["vectorSearchConfiguration"]["filter"]["equals"]["value"] == "contract"
+
+
+def test_lambda_handler_bad_filter(runtime_client):
+    response = call("notice period", filter="{not json")
+    assert response.response.functionResponse.responseState == "REPROMPT"
+    assert not runtime_client.retrieve.called
+
+
+def test_lambda_handler_invalid_function():
+    event = dict(bedrock_event, function="invalid")
+    response = kb_retrieve.BedrockResponseEvent.model_validate(kb_retrieve.lambda_handler(event, mock.MagicMock()))
+    assert response.response.functionResponse.responseState == "FAILURE"
+
+
+def test_lambda_handler_warmer():
+    assert kb_retrieve.lambda_handler(WARMER_EVENT, mock.MagicMock())["warmed"] is True
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+from unittest import mock
+import pytest
+from cdk.functions import pinecone_index
+from cdk.functions.waiter import Waiter
+from tests.unit.mock_clients import FakePinecone
+
+PROPS = {"name": "kb", "dimension": "1024", "metric": "cosine", "cloud": "aws", "region": "us-east-1"}
+
+
+@pytest.fixture
+def pc(monkeypatch):
+    pc = FakePinecone(ready_polls=2)
+    monkeypatch.setattr(pinecone_index, "Pinecone", lambda api_key: pc)
+    monkeypatch.setattr(pinecone_index, "get_api_key", lambda: "key")
+    monkeypatch.setattr(pinecone_index.Waiter, "for_lambda_context", lambda context: Waiter(sleep=lambda _: None))
+    return pc
+
+
+def invoke(request_type: str, props: dict, old_props: dict = None, physical_id: str = None) -> dict:
+    event = {"RequestType": request_type, "ResourceProperties": props}
+    if old_props:
+        event["OldResourceProperties"] = old_props
+    if physical_id:
+        event["PhysicalResourceId"] = physical_id
+    return pinecone_index.lambda_handler(event, mock.MagicMock())
+
+
+def test_create_waits_until_ready(pc):
+    result = invoke("Create", PROPS)
+    assert result["Data"]["status"]["ready"]
+    assert result["PhysicalResourceId"] == f"{result['Data']['host']}/kb"
+    assert pc.calls["describe_index"] == 3
+
+
+def test_update_without_changes_keeps_the_index(pc):
+    created = invoke("Create", PROPS)
+    updated = invoke("Update", {**PROPS, "copy_vectors": "false"}, PROPS, created["PhysicalResourceId"])
+    assert updated["PhysicalResourceId"] == created["PhysicalResourceId"]
+    assert pc.calls["create_index"] == 1
+    assert pc.calls["delete_index"] == 0
+
+
+def test_update_dimension_recreates(pc):
+    created = invoke("Create", PROPS)
+    updated = invoke("Update", {**PROPS, "dimension": "512"}, PROPS, created["PhysicalResourceId"])
+    assert pc.indexes["kb"].dimension == 512
+    assert updated["PhysicalResourceId"] != created["PhysicalResourceId"]
+    # CloudFormation then deletes the old physical id, which must not delete the new index
+    invoke("Delete", PROPS, physical_id=created["PhysicalResourceId"])
+    assert "kb" in pc.indexes
+    invoke("Delete", PROPS, physical_id=updated["PhysicalResourceId"])
+    assert pc.indexes == {}
+
+
+def test_update_blue_green_copies_vectors(pc):
+    created = invoke("Create", PROPS)
+    vectors = {f"id{i}": SimpleNamespace(id=f"id{i}", values=[i], metadata={"i": i}) for i in range(5)}
+    pc.data[created["Data"]["host"]].namespaces = {"": dict(vectors), "other": {"id0": vectors["id0"]}}
+    props = {**PROPS, "metric": "dotproduct", "blue_green": "true"}
+    updated = invoke("Update", props, PROPS, created["PhysicalResourceId"])
+    assert updated["Data"]["name"] == "kb-dotproduct-1024"
+    assert set(pc.indexes) == {"kb", "kb-dotproduct-1024"}  # the old index is deleted by CloudFormation later
+    assert pc.data[updated["Data"]["host"]].namespaces == {"": vectors, "other": {"id0": vectors["id0"]}}
+    invoke("Delete", PROPS, physical_id=created["PhysicalResourceId"])
+    assert set(pc.indexes) == {"kb-dotproduct-1024"}
+
+
+@pytest.mark.parametrize(
+    "changed",
+    [{"name": "kb2"}, {"metric": "dotproduct", "blue_green": "true"}, {"dimension": "512", "blue_green": "true"}],
+)
+def test_update_rollback_reuses_the_old_index(pc, changed):
+    created = invoke("Create", PROPS)
+    props = {**PROPS, **changed}
+    updated = invoke("Update", props, PROPS, created["PhysicalResourceId"])
+    assert updated["PhysicalResourceId"] != created["PhysicalResourceId"]
+    # the stack fails later, CloudFormation updates back to the old properties then deletes the new physical id
+    rolled_back = invoke("Update", PROPS, props, updated["PhysicalResourceId"])
+    assert rolled_back["PhysicalResourceId"] == created["PhysicalResourceId"]
+    assert pc.calls["create_index"] == 2
+    invoke("Delete", props, physical_id=updated["PhysicalResourceId"])
+    assert set(pc.indexes) == {"kb"}
@@ -0,0 +1,149 @@
+from unittest import mock
+import threading
+import time
+import pytest
+from botocore.exceptions import ClientError
+from cdk.functions import rate_limit
+from tests.unit.mock_clients import Clock
+
+
+def test_in_memory_bucket_store_burst_then_rate():
+    clock = Clock()
+    store = rate_limit.InMemoryBucketStore(clock=clock)
+    assert [store.take("key", rate=2, capacity=2) for _ in range(2)] == [0.0, 0.0]
+    assert store.take("key", rate=2, capacity=2) == pytest.approx(0.5)
+    assert store.take("key", rate=2, capacity=2) == pytest.approx(1.0)
+    clock.now = 10  # refilled, never above capacity
+    assert store.take("key", rate=2, capacity=2) == 0.0
+
+
+def test_rate_limiter_acquire_sleeps_and_times_out():
+    sleep = mock.MagicMock()
+    limiter = rate_limit.RateLimiter(
+        "key", rate=1, capacity=1, store=rate_limit.InMemoryBucketStore(Clock()), sleep=sleep
+    )
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() == pytest.approx(1.0)
+    sleep.assert_called_once_with(pytest.approx(1.0))
+    with pytest.raises(rate_limit.RateLimitTimeout):
+        limiter.acquire(max_wait=1.0)
+
+
+def test_rate_limiter_timeout_refunds_the_token():
+    clock = Clock()
+    store = rate_limit.InMemoryBucketStore(clock=clock)
+    limiter = rate_limit.RateLimiter("key", rate=1, capacity=2, store=store, sleep=mock.MagicMock())
+    limiter.acquire()
+    limiter.acquire()
+    for _ in range(5):  # rejected calls dont use up the budget
+        with pytest.raises(rate_limit.RateLimitTimeout):
+            limiter.acquire(max_wait=0.5)
+    assert store._buckets["key"][0] == pytest.approx(0.0)
+    clock.now = 1
+    assert limiter.acquire(max_wait=0.5) == 0.0
+
+
+def test_rate_limiter_adapts_to_throttles():
+    limiter = rate_limit.RateLimiter("key", rate=4, capacity=4, increase_step=1)
+    assert limiter.on_throttle(attempt=0, retry_after="2") == 2.0
+    assert limiter.rate == 2
+    assert 0 <= limiter.on_throttle(attempt=3) <= limiter.max_backoff
+    assert limiter.rate == 1
+    limiter.on_success()
+    limiter.on_success()
+    limiter.on_success()
+    limiter.on_success()
+    assert limiter.rate == 4  # recovers up to the configured rate only
+
+
+def test_dynamodb_bucket_store_retries_conflicts():
+    client = mock.MagicMock()
+    client.get_item.side_effect = [
+        {},
+        {"Item": {"pk": {"S": "key"}, "tokens": {"N": "0.0"}, "updatedAt": {"N": "100.0"}}},
+    ]
+    conflict = ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem")
+    client.put_item.side_effect = [conflict, None]
+    store = rate_limit.DynamoDBBucketStore("table", client=client, clock=lambda: 100.0)
+    assert store.take("key", rate=2, capacity=2) == pytest.approx(0.5)
+    assert client.put_item.call_args.kwargs["ConditionExpression"] == "updatedAt = :previous"
+
+
+def test_dynamodb_bucket_store_fails_open():
+    client = mock.MagicMock()
+    client.get_item.side_effect = Exception("table not found")
+    assert rate_limit.DynamoDBBucketStore("table", client=client).take("key", rate=1, capacity=1) == 0.0
+
+
+def test_dynamodb_bucket_store_refund():
+    client = mock.MagicMock()
+    store = rate_limit.DynamoDBBucketStore("table", client=client)
+    store.refund("key", capacity=10)
+    kwargs = client.update_item.call_args.kwargs
+    assert kwargs["UpdateExpression"] == "ADD tokens :one"
+    assert kwargs["ExpressionAttributeValues"][":full"] == {"N": "9"}
+    client.update_item.side_effect = ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+    store.refund("key", capacity=10)  # already full
+
+
+def test_coalescer_shares_in_flight_calls():
+    coalescer = rate_limit.Coalescer()
+    started = threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(coalescer.do("key", slow_call)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(coalescer.do("key", slow_call))) for _ in range(3)]
+    [f.start() for f in followers]
+    [t.join() for t in [leader] + followers]
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert coalescer.do("key", lambda: "again") == "again"  # nothing in flight any more
+
+
+def test_dynamodb_coalescer_leader_shares_its_result():
+    client = mock.MagicMock()
+    coalescer = rate_limit.DynamoDBCoalescer("table", client=client, clock=lambda: 100.0)
+    assert coalescer.do(("search", "session", "query"), lambda: "result") == "result"
+    marker, result = [call.kwargs for call in client.put_item.call_args_list]
+    assert marker["ConditionExpression"] == "attribute_not_exists(pk) OR expiresAt < :now"
+    assert marker["Item"]["expiresAt"] == {"N": "130.0"}
+    assert result["Item"] == {"pk": marker["Item"]["pk"], "result": {"S": "result"}, "expiresAt": {"N": "160.0"}}
+
+    assert coalescer.do("key", lambda: 42) == 42  # not shared, the waiting containers make their own call
+    assert client.delete_item.call_args.kwargs["ExpressionAttributeValues"] == {":expires": {"N": "130.0"}}
+
+
+def test_dynamodb_coalescer_follower_waits_for_the_result():
+    client = mock.MagicMock()
+    client.put_item.side_effect = ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem")
+    in_flight = {"Item": {"pk": {"S": "pk"}, "expiresAt": {"N": "130.0"}}}
+    done = {"Item": {"pk": {"S": "pk"}, "result": {"S": "result"}, "expiresAt": {"N": "160.0"}}}
+    client.get_item.side_effect = [in_flight, in_flight, done]
+    clock = Clock(100.0)
+    coalescer = rate_limit.DynamoDBCoalescer("table", client=client, clock=clock, sleep=clock.sleep)
+    fn = mock.Mock(return_value="own result")
+    assert coalescer.do("key", fn) == "result"
+    assert (fn.call_count, clock.now) == (0, pytest.approx(100.4))  # polled 3 times
+
+    client.get_item.side_effect = None
+    client.get_item.return_value = in_flight
+    assert coalescer.do("key", fn, max_wait=0.5) == "own result"  # the leader takes too long
+    client.get_item.return_value = {}
+    assert coalescer.do("key", fn) == "own result"  # the leader failed
+    assert fn.call_count == 2
+
+
+def test_dynamodb_coalescer_fails_open():
+    client = mock.MagicMock()
+    client.put_item.side_effect = Exception("table not found")
+    assert rate_limit.DynamoDBCoalescer("table", client=client).do("key", lambda: "result") == "result"
+    client.get_item.assert_not_called()
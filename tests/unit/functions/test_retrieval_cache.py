@@ -0,0 +1,62 @@
+from unittest import mock
+from cdk.functions import retrieval_cache
+from tests.unit.mock_clients import Clock
+
+
+def test_cache_key_normalizes_query():
+    key = retrieval_cache.cache_key("KB", "What is the  notice period?")
+    assert key == retrieval_cache.cache_key("KB", "what is the notice period")
+    assert key != retrieval_cache.cache_key("KB2", "what is the notice period")
+    assert key != retrieval_cache.cache_key("KB", "what is the notice period", {"filter": {"equals": {"a": 1}}})
+
+
+def test_cache_hits_and_ttl():
+    clock = Clock()
+    cache = retrieval_cache.RetrievalCache(ttl=60, clock=clock)
+    retrieve = mock.MagicMock(side_effect=["result1", "result2"])
+    assert cache.get_or_retrieve("key", retrieve) == ("result1", False)
+    assert cache.get_or_retrieve("key", retrieve) == ("result1", True)
+    clock.now = 60
+    assert cache.get_or_retrieve("key", retrieve) == ("result2", False)
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.expired) == (1, 2, 1)
+    assert round(cache.stats.hit_rate, 2) == 0.33
+
+
+def test_cache_evicts_least_recently_used():
+    cache = retrieval_cache.RetrievalCache(max_entries=2, clock=Clock())
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_cache_cleared_when_ingestion_job_completes():
+    clock = Clock()
+    generation = mock.MagicMock(side_effect=["job1", "job1", "job2"])
+    cache = retrieval_cache.RetrievalCache(check_interval=30, generation=generation, clock=clock)
+    cache.put("key", "result")
+    assert cache.get("key") == "result"
+    clock.now = 10
+    assert cache.get("key") == "result"  # within the check interval
+    clock.now = 30
+    assert cache.get("key") == "result"
+    clock.now = 60
+    assert cache.get("key") is None
+    assert generation.call_count == 3
+    assert cache.stats.invalidations == 1
+
+
+def test_cache_kept_when_generation_lookup_fails():
+    cache = retrieval_cache.RetrievalCache(generation=mock.MagicMock(side_effect=Exception("throttled")))
+    cache.put("key", "result")
+    assert cache.get("key") == "result"
+
+
+def test_latest_ingestion():
+    client = mock.MagicMock()
+    client.list_ingestion_jobs.return_value = {"ingestionJobSummaries": [{"updatedAt": "2024-06-01T00:00:00"}]}
+    assert retrieval_cache.latest_ingestion(client, "KB", "DS") == "2024-06-01T00:00:00"
+    assert client.list_ingestion_jobs.call_args.kwargs["maxResults"] == 1
+    client.list_ingestion_jobs.return_value = {"ingestionJobSummaries": []}
+    assert retrieval_cache.latest_ingestion(client, "KB", "DS") is None
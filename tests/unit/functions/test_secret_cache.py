@@ -0,0 +1,69 @@
+from unittest import mock
+import json
+import pytest
+from cdk.functions import secret_cache
+from tests.unit.mock_clients import Clock
+
+
+def wait_for_refresh(cache: secret_cache.SecretCache, secret_name: str) -> None:
+    for thread in secret_cache.threading.enumerate():
+        if thread.name == f"refresh-{secret_name}":
+            thread.join(timeout=5)
+
+
+def test_secret_cache_fetches_once():
+    fetcher = mock.MagicMock(return_value=json.dumps({"apiKey": "key1"}))
+    cache = secret_cache.SecretCache(fetcher=fetcher, clock=Clock())
+    cache.prefetch("secret")
+    assert cache.get_json("secret")["apiKey"] == "key1"
+    assert cache.get("secret") == json.dumps({"apiKey": "key1"})
+    assert fetcher.call_count == 1
+
+
+def test_secret_cache_refreshes_in_background_before_expiry():
+    clock = Clock()
+    fetcher = mock.MagicMock(side_effect=["value1", "value2"])
+    cache = secret_cache.SecretCache(ttl=100, refresh_margin=20, fetcher=fetcher, clock=clock)
+    assert cache.get("secret") == "value1"
+    clock.now = 79
+    assert cache.get("secret") == "value1"
+    assert fetcher.call_count == 1
+    clock.now = 80
+    assert cache.get("secret") == "value1"  # served from the cache while the refresh runs
+    wait_for_refresh(cache, "secret")
+    assert cache.get("secret") == "value2"
+    assert fetcher.call_count == 2
+
+
+def test_secret_cache_serves_stale_value_when_refresh_fails():
+    clock = Clock()
+    fetcher = mock.MagicMock(side_effect=["value1", Exception("throttled"), "value2"])
+    cache = secret_cache.SecretCache(ttl=100, refresh_margin=20, retry_interval=10, fetcher=fetcher, clock=clock)
+    cache.get("secret")
+    clock.now = 200
+    cache.get("secret")
+    wait_for_refresh(cache, "secret")
+    assert cache.get("secret") == "value1"  # retry not due yet
+    clock.now = 210
+    cache.get("secret")
+    wait_for_refresh(cache, "secret")
+    assert cache.get("secret") == "value2"
+
+
+def test_secret_cache_prefetch_swallows_errors():
+    cache = secret_cache.SecretCache(fetcher=mock.MagicMock(side_effect=Exception("denied")))
+    cache.prefetch("secret")
+    cache.prefetch(None)
+    with pytest.raises(Exception):
+        cache.get("secret")
+
+
+@mock.patch.dict("os.environ", {"MY_KEY": "from_env"})
+def test_get_secret_value_env_fallback():
+    assert secret_cache.get_secret_value(None, key="apiKey", env_var="MY_KEY") == "from_env"
+
+
+@mock.patch.dict("os.environ", {}, clear=True)
+def test_get_secret_value_without_secret_name():
+    with pytest.raises(ValueError):
+        secret_cache.get_secret_value(None, key="apiKey", env_var="MY_KEY")
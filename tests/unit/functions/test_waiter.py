@@ -0,0 +1,46 @@
+from unittest import mock
+import pytest
+from cdk.functions.waiter import Waiter, WaiterError, WaiterTimeout
+from tests.unit.mock_clients import Clock
+
+
+def make_waiter(**kwargs) -> Waiter:
+    clock = Clock()
+    return Waiter(sleep=clock.sleep, clock=clock, **kwargs)
+
+
+def test_delay_is_jittered_exponential_and_capped():
+    waiter = make_waiter(base_delay=1, max_delay=8, multiplier=2)
+    for attempt, ceiling in enumerate([1, 2, 4, 8, 8]):
+        assert ceiling / 2 <= waiter.delay(attempt) <= ceiling
+
+
+def test_wait_returns_when_done_and_counts_polls():
+    waiter = make_waiter()
+    states = iter(["CREATING", "CREATING", "PREPARED"])
+    assert waiter.wait("thing", poll=lambda: next(states), done=lambda s: s == "PREPARED") == "PREPARED"
+    assert waiter.polls == 3
+    assert 1.5 <= waiter.waited <= 3  # delays of ~1 and ~2 seconds
+
+
+def test_wait_exits_early_on_failure():
+    waiter = make_waiter()
+    poll = mock.MagicMock(return_value="FAILED")
+    with pytest.raises(WaiterError, match="thing failed after 1 polls: broken"):
+        waiter.wait("thing", poll=poll, done=lambda s: s == "PREPARED", failed=lambda s: s == "FAILED" and "broken")
+    poll.assert_called_once()
+
+
+def test_wait_times_out_before_deadline():
+    waiter = make_waiter(max_delay=4, deadline=20)
+    with pytest.raises(WaiterTimeout, match="Timed out waiting for thing"):
+        waiter.wait("thing", poll=lambda: "CREATING", done=lambda s: s == "PREPARED")
+    assert waiter._clock() <= 20
+
+
+def test_for_lambda_context_keeps_a_safety_margin():
+    context = mock.MagicMock()
+    context.get_remaining_time_in_millis.return_value = 120_000
+    waiter = Waiter.for_lambda_context(context, clock=lambda: 100.0)
+    assert waiter.deadline == pytest.approx(100 + 120 - 10)
+    assert Waiter.for_lambda_context(mock.MagicMock()).deadline is None  # local runs
@@ -1,12 +1,15 @@
 from unittest import mock
+import io
 import json
 from cdk.functions import web_search
+from cdk.functions.action_group import WARMER_EVENT
 import pytest
 from tests.unit.mock_data import bedrock_event
 
 
-@mock.patch("requests.get")
+@mock.patch("requests.Session.get")
 @mock.patch.dict(bedrock_event)
+@mock.patch.dict("os.environ", {"JINA_API_KEY": "jina_test_key"})
 def test_lambda_handler_retrieve(mock_get):
     url = "https://foo.com"
     bedrock_event["function"] = "retrieve"
@@ -23,8 +26,9 @@ def test_lambda_handler_retrieve(mock_get):
     assert "Bearer jina_" in mock_get.call_args.kwargs["headers"]["Authorization"]
 
 
-@mock.patch("requests.get")
+@mock.patch("requests.Session.get")
 @mock.patch.dict(bedrock_event)
+@mock.patch.dict("os.environ", {"JINA_API_KEY": "jina_test_key"})
 def test_lambda_handler_search(mock_get):
     bedrock_event["function"] = "search"
     search_str = "search string"
@@ -39,7 +43,7 @@ def test_lambda_handler_search(mock_get):
     assert mock_get.called_with("https://r.jina.ai/When was cloudshift founded")
 
 
-@mock.patch("requests.get")
+@mock.patch("requests.Session.get")
 @mock.patch.dict(bedrock_event)
 def test_lambda_handler_invalid_function(mock_get):
     bedrock_event["function"] = "invalid"
@@ -49,5 +53,104 @@ def test_lambda_handler_invalid_function(mock_get):
     assert response.response.functionResponse.responseBody["TEXT"].body == "Invalid function: invalid"
 
 
+@mock.patch("time.sleep")
+@mock.patch("requests.Session.get")
+@mock.patch.dict(bedrock_event)
+@mock.patch.dict("os.environ", {"JINA_API_KEY": "jina_test_key"})
+def test_lambda_handler_search_retries_throttles(mock_get, mock_sleep):
+    bedrock_event["function"] = "search"
+    bedrock_event["parameters"] = [{"name": "query", "type": "string", "value": "search string"}]
+    data = [{"url": "https://foo.com", "content": "sample response"}]
+    throttled = mock.MagicMock(status_code=429, text="Too many requests", headers={"Retry-After": "1"})
+    mock_get.side_effect = [throttled, mock.MagicMock(status_code=200, text=json.dumps({"data": data}))]
+
+    result = web_search.lambda_handler(bedrock_event, mock.MagicMock())
+    response = web_search.BedrockResponseEvent.model_validate(result)
+    assert response.response.functionResponse.responseState is None
+    assert response.get_response_body() == json.dumps(data)
+    assert mock_get.call_count == 2
+    mock_sleep.assert_called_with(1.0)
+
+
+@mock.patch("time.sleep")
+@mock.patch("requests.Session.get")
+@mock.patch.dict(bedrock_event)
+@mock.patch.dict("os.environ", {"JINA_API_KEY": "jina_test_key"})
+def test_lambda_handler_search_stops_retrying_at_the_deadline(mock_get, mock_sleep):
+    bedrock_event["function"] = "search"
+    bedrock_event["parameters"] = [{"name": "query", "type": "string", "value": "search string"}]
+    mock_get.return_value = mock.MagicMock(status_code=429, text="Too many requests", headers={"Retry-After": "5"})
+    context = mock.MagicMock()
+    context.get_remaining_time_in_millis.return_value = 4000  # 2s left after the margin, less than the backoff
+
+    result = web_search.lambda_handler(bedrock_event, context)
+    response = web_search.BedrockResponseEvent.model_validate(result)
+    assert response.response.functionResponse.responseState == "REPROMPT"
+    assert mock_get.call_count == 1
+    assert 0 < mock_get.call_args.kwargs["timeout"] <= 2
+    mock_sleep.assert_not_called()
+
+
+@mock.patch("requests.Session.get")
+@mock.patch.dict(bedrock_event)
+@mock.patch.dict("os.environ", {"JINA_API_KEY": "jina_test_key"})
+def test_lambda_handler_retrieve_out_of_time(mock_get):
+    bedrock_event["function"] = "retrieve"
+    bedrock_event["parameters"] = [{"name": "url", "type": "string", "value": "https://foo.com"}]
+    context = mock.MagicMock()
+    context.get_remaining_time_in_millis.return_value = 1000  # within the margin
+
+    result = web_search.lambda_handler(bedrock_event, context)
+    response = web_search.BedrockResponseEvent.model_validate(result)
+    assert "No time left" in response.get_response_body()
+    mock_get.assert_not_called()
+
+    context.get_remaining_time_in_millis.return_value = 60000
+    mock_get.side_effect = web_search.requests.Timeout("read timed out")
+    response = web_search.BedrockResponseEvent.model_validate(web_search.lambda_handler(bedrock_event, context))
+    assert "timed out" in response.get_response_body()
+
+
+@mock.patch("requests.Session.get")
+@mock.patch.dict(bedrock_event)
+@mock.patch.dict("os.environ", {"SECRET_NAME": "web-search"})
+def test_lambda_handler_secret_without_jina_key(mock_get, monkeypatch):
+    monkeypatch.delenv("JINA_API_KEY", raising=False)
+    bedrock_event["function"] = "search"
+    bedrock_event["parameters"] = [{"name": "query", "type": "string", "value": "search string"}]
+    with mock.patch.object(web_search.secret_cache.SECRETS, "get_json", return_value={"otherKey": "value"}):
+        result = web_search.lambda_handler(bedrock_event, mock.MagicMock())
+    response = web_search.BedrockResponseEvent.model_validate(result)
+    assert result["response"]["functionResponse"]["responseState"] == "FAILURE"
+    assert "'web-search' has no 'jinaApiKey' value" in response.get_response_body()
+    mock_get.assert_not_called()
+
+
+def test_lambda_handler_warmer():
+    result = web_search.lambda_handler(WARMER_EVENT, mock.MagicMock())
+    assert result["warmed"] is True
+    assert result["initMs"] > 0
+
+
+@mock.patch("requests.Session.get")
+@mock.patch.dict(bedrock_event)
+@mock.patch.dict("os.environ", {"JINA_API_KEY": "jina_test_key"})
+def test_lambda_handler_logs_correlation_id_and_span(mock_get):
+    bedrock_event["function"] = "search"
+    bedrock_event["parameters"] = [{"name": "query", "type": "string", "value": "search string"}]
+    bedrock_event["sessionAttributes"] = {"correlationId": "abc123"}
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.text = json.dumps({"data": []})
+
+    with mock.patch.object(web_search.logger.registered_handler, "stream", io.StringIO()) as stream:
+        result = web_search.lambda_handler(bedrock_event, mock.MagicMock())
+    assert result["sessionAttributes"] == {"correlationId": "abc123"}  # kept for the rest of the prompt
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert records and all(record["correlation_id"] == "abc123" for record in records)
+    span = records[-1]
+    assert span["span"] == f"{bedrock_event['actionGroup']}.search" and span["response_state"] == "OK"
+    assert span["duration_ms"] >= 0
+
+
 if __name__ == "__main__":
     pytest.main()
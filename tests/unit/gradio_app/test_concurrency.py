@@ -0,0 +1,115 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest import mock
+import gradio as gr
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from gradio_app import concurrency
+
+
+def test_group_from_env(monkeypatch):
+    monkeypatch.setenv("CHAT_CONCURRENCY_LIMIT", "20")
+    monkeypatch.setenv("CHAT_QUEUE_MAX_SIZE", "none")
+    group = concurrency.ConcurrencyGroup.from_env("chat", concurrency_limit=10, max_size=50)
+    assert group == concurrency.ConcurrencyGroup("chat", concurrency_limit=20, max_size=None)
+    assert group.listener_kwargs() == dict(concurrency_id="chat", concurrency_limit=20)
+    assert concurrency.ConcurrencyGroup.from_env("kb", 2, 10) == concurrency.ConcurrencyGroup("kb", 2, 10)
+
+
+def fake_queue(waiting: dict, running: dict = None):
+    """A gradio queue with `waiting` events per concurrency id and fn_index 0, 1, 2 in the chat, kb and an own group"""
+    fns = {i: SimpleNamespace(concurrency_id=concurrency_id) for i, concurrency_id in enumerate(["chat", "kb", "1234"])}
+    event_queues = {
+        concurrency_id: SimpleNamespace(
+            queue=[object()] * count, current_concurrency=(running or {}).get(concurrency_id, 0)
+        )
+        for concurrency_id, count in waiting.items()
+    }
+    push = mock.AsyncMock(return_value=(True, "event-id"))
+    return SimpleNamespace(blocks=SimpleNamespace(fns=fns), event_queue_per_concurrency_id=event_queues, push=push)
+
+
+GROUPS = {"chat": concurrency.ConcurrencyGroup("chat", 4, 3), "kb": concurrency.ConcurrencyGroup("kb", 1, 2)}
+
+
+def test_full_group_rejects_only_its_events():
+    queue = fake_queue({"chat": 1, "kb": 2})
+    push, rejected = queue.push, []
+    concurrency.limit_group_sizes(queue, GROUPS, on_reject=rejected.append)
+
+    success, message = asyncio.run(queue.push(SimpleNamespace(fn_index=1), None, None))
+    assert not success and message.startswith("Queue is full.")  # gradio answers with a 503
+    assert asyncio.run(queue.push(SimpleNamespace(fn_index=0), None, None)) == (True, "event-id")
+    assert asyncio.run(queue.push(SimpleNamespace(fn_index=2), None, None)) == (True, "event-id")
+    assert push.await_count == 2
+    assert rejected == ["kb"]
+
+
+def test_rejections_of_the_gradio_queue_are_counted():
+    queue = fake_queue({})
+    queue.push.return_value = (False, "Queue is full. Max size is 100 and size is 100.")
+    rejected = []
+    concurrency.limit_group_sizes(queue, GROUPS, on_reject=rejected.append)
+    asyncio.run(queue.push(SimpleNamespace(fn_index=2), None, None))
+    assert rejected == ["default"]
+
+
+def test_metrics_by_group(capsys):
+    queue = fake_queue({"chat": 2, "kb": 5, "1234": 1, "5678": 1}, running={"chat": 4, "kb": 1})
+    metrics = concurrency.QueueMetrics(queue, groups=GROUPS)
+    metrics.reject("kb")
+    metrics.reject("kb")
+    assert metrics.snapshot() == {
+        "chat": dict(waiting=2, running=4, rejected=0),
+        "kb": dict(waiting=5, running=1, rejected=2),
+        "default": dict(waiting=2, running=0, rejected=0),
+    }
+    assert metrics.snapshot()["kb"]["rejected"] == 0  # counted since the last one
+
+    metrics.reject("chat")
+    metrics.publish()
+    published = {line["ConcurrencyGroup"]: line for line in map(json.loads, capsys.readouterr().out.splitlines())}
+    assert published["chat"]["QueueRejectedEvents"] == [1.0]
+    assert published["kb"]["QueueWaitingEvents"] == [5.0]
+    assert published["default"]["QueueRunningEvents"] == [0.0]
+    assert published["kb"]["_aws"]["CloudWatchMetrics"][0]["Namespace"] == concurrency.METRICS_NAMESPACE
+
+
+def test_queue_full_response_has_retry_after():
+    async def join(request):
+        return JSONResponse({"detail": "Queue is full."}, status_code=503)
+
+    app = Starlette(routes=[Route("/gradio/queue/join", join, methods=["POST"]), Route("/other", join)])
+    client = TestClient(concurrency.QueueFullMiddleware(app, retry_after=7))
+    assert client.post("/gradio/queue/join").headers["retry-after"] == "7"
+    assert "retry-after" not in client.get("/other").headers
+
+
+@pytest.fixture
+def event_loop_for_gradio():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)  # gradio creates the locks of its queue with the blocks
+    yield
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def test_configure_queue(monkeypatch, event_loop_for_gradio):
+    monkeypatch.setenv("QUEUE_MAX_SIZE", "30")
+    monkeypatch.setenv("QUEUE_METRICS_INTERVAL", "0")
+    with gr.Blocks() as demo:
+        button, text = gr.Button(), gr.Textbox()
+        button.click(lambda: "chat", outputs=text, **concurrency.CHAT.listener_kwargs())
+        button.click(lambda: "kb", outputs=text, **concurrency.KB.listener_kwargs())
+    concurrency.configure_queue(demo)
+
+    assert demo._queue.max_size == 30
+    assert [(fn.concurrency_id, fn.concurrency_limit) for fn in demo.fns.values()] == [
+        ("chat", concurrency.CHAT.concurrency_limit),
+        ("kb", concurrency.KB.concurrency_limit),
+    ]
+    assert demo._queue.push.__name__ == "bounded_push"
@@ -0,0 +1,15 @@
+from gradio_app import helpers
+from tools import app_tuning
+
+
+def test_event_label():
+    labels = [helpers.event_label(event) for event in app_tuning.synthetic_events(tool_calls=1, answer_chunks=1)]
+    assert labels == [
+        "orchestrationTrace.modelInvocationInput",
+        "orchestrationTrace.rationale",
+        "orchestrationTrace.invocationInput:KNOWLEDGE_BASE",
+        "orchestrationTrace.invocationInput:web_search.search",
+        "orchestrationTrace.observation",
+        "orchestrationTrace.observation",
+        "chunk",
+    ]
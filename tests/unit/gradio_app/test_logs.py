@@ -0,0 +1,87 @@
+import json
+import logging
+from unittest import mock
+import pytest
+from gradio_app import logs
+from tests.unit.mock_clients import Clock
+
+
+def record(level=logging.DEBUG, lineno=1, pathname="app.py") -> logging.LogRecord:
+    return logging.LogRecord("test", level, pathname, lineno, "message", None, None)
+
+
+def test_sample_rates():
+    assert logs.sample_rates("gradio_app.fixes=0.01, gradio_app.helpers=0.5,") == {
+        "gradio_app.fixes": 0.01,
+        "gradio_app.helpers": 0.5,
+    }
+    assert logs.sample_rates("") == {}
+
+
+def test_sampling_filter_keeps_a_fraction_of_debug_records():
+    values = iter([0.05, 0.5, 0.09, 0.95])
+    sampler = logs.SamplingFilter(0.1, rng=lambda: next(values))
+    assert [sampler.filter(record()) for _ in range(4)] == [True, False, True, False]
+
+
+def test_sampling_filter_keeps_info_and_above():
+    sampler = logs.SamplingFilter(0.0, rng=mock.Mock(side_effect=AssertionError))
+    assert sampler.filter(record(logging.INFO))
+    assert sampler.filter(record(logging.ERROR))
+
+
+def test_rate_limit_filter_per_call_site():
+    clock = Clock()
+    limiter = logs.RateLimitFilter(2, clock=clock)
+    assert [limiter.filter(record(lineno=1)) for _ in range(4)] == [True, True, False, False]
+    assert limiter.filter(record(lineno=2))  # another line has its own bucket
+    assert limiter.filter(record(logging.INFO, lineno=1))  # ie. the invoke_agent span
+
+    clock.now = 0.5  # one token back
+    passed = record(lineno=1)
+    assert limiter.filter(passed)
+    assert passed.suppressed == 2
+    assert not limiter.filter(record(lineno=1))
+
+
+def test_rate_limit_filter_disabled():
+    limiter = logs.RateLimitFilter(0, clock=Clock())
+    assert all(limiter.filter(record()) for _ in range(100))
+
+
+@pytest.fixture
+def listener():
+    logs.stop_listener()  # the next one writes to the captured stdout
+    yield
+    logs.stop_listener()
+
+
+def test_get_logger_writes_json_from_the_background_thread(monkeypatch, capsys, listener):
+    monkeypatch.setenv("LOG_LEVEL", "DEBUG")
+    monkeypatch.setenv("LOG_SAMPLE_RATES", "test.logs.quiet=0")
+    monkeypatch.setenv("LOG_RATE_LIMIT", "2")
+    logger = logs.get_logger("test.logs")
+    quiet = logs.get_logger("test.logs.quiet")
+
+    for i in range(5):
+        logger.debug("polled", poll=i)
+    quiet.debug("dropped")
+    quiet.warning("kept")
+    logs.stop_listener()
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(line["service"], line["message"]) for line in lines] == [
+        ("test.logs", "polled"),
+        ("test.logs", "polled"),
+        ("test.logs.quiet", "kept"),
+    ]
+
+
+def test_flush_waits_for_the_background_thread(monkeypatch, capsys, listener):
+    monkeypatch.setenv("LOG_ASYNC", "true")
+    logger = logs.get_logger("test.logs.flushed")
+    logger.info("queued")
+    assert logs.flush()
+    assert json.loads(capsys.readouterr().out)["message"] == "queued"
+    logs.stop_listener()
+    assert logs.flush()  # nothing to wait for
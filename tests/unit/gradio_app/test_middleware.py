@@ -0,0 +1,59 @@
+from unittest import mock
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from gradio_app import middleware
+
+
+def echo(request: Request) -> JSONResponse:
+    return JSONResponse({"host": request.headers["host"], "url_for": str(request.url_for("echo"))})
+
+
+def make_client() -> TestClient:
+    app = Starlette(routes=[Route("/echo", echo, name="echo")])
+    app.add_middleware(middleware.XForwardedHostMiddleware)
+    app.add_middleware(middleware.LambdaRequestLogger)
+    return TestClient(app)
+
+
+def test_x_forwarded_host_replaces_host():
+    response = make_client().get("/echo", headers={"X-Forwarded-Host": "bedrock-demo.example.com"})
+    assert response.json() == {"host": "bedrock-demo.example.com", "url_for": "http://bedrock-demo.example.com/echo"}
+
+
+def test_host_unchanged_without_x_forwarded_host():
+    assert make_client().get("/echo").json()["host"] == "testserver"
+
+
+def test_request_logged_only_when_debug_enabled():
+    client = make_client()
+    with mock.patch.object(middleware.logger, "debug") as debug, mock.patch.object(middleware, "request_summary") as s:
+        with mock.patch.object(middleware.logger, "isEnabledFor", return_value=False):
+            client.get("/echo?q=1")
+        assert not debug.called and not s.called
+        with mock.patch.object(middleware.logger, "isEnabledFor", return_value=True):
+            client.get("/echo?q=1")
+        assert debug.call_args.args[0] == "Request: GET /echo"
+
+
+def test_request_summary():
+    scope = {"type": "http", "method": "GET", "path": "/", "query_string": b"a=1", "headers": [(b"host", b"x")]}
+    assert middleware.request_summary(scope) == {
+        "method": "GET",
+        "path": "/",
+        "query_string": "a=1",
+        "headers": {"host": "x"},
+        "client": None,
+    }
+
+
+def test_log_queue_flushed_before_the_response_ends():
+    events = []
+    app = Starlette(routes=[Route("/echo", echo, name="echo")])
+    app.add_middleware(middleware.LambdaRequestLogger)
+    with mock.patch.object(middleware.logs, "flush", side_effect=lambda: events.append("flush")):
+        response = TestClient(app).get("/echo")
+    assert response.status_code == 200
+    assert events == ["flush"]
@@ -0,0 +1,96 @@
+import asyncio
+import json
+from unittest import mock
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+from authlib.integrations.starlette_client import StarletteOAuth2App
+from gradio_app import oauth_okta
+from tests.unit.mock_clients import Clock
+
+SECRET = {
+    "OKTA_OAUTH2_ISSUER": "https://example.okta.com/oauth2/default",
+    "OKTA_OAUTH2_CLIENT_ID": "client-id",
+    "OKTA_OAUTH2_CLIENT_SECRET": "client-secret",
+    "SESSION_SECRET": "session-secret",
+}
+
+
+@pytest.fixture
+def get_secret(monkeypatch):
+    for key in oauth_okta.OKTA_SETTINGS:
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setenv("OKTA_SECRET_ARN", "arn:okta")
+    oauth_okta.okta_settings.cache_clear()
+    with mock.patch.object(oauth_okta.parameters, "get_secret", return_value=json.dumps(SECRET)) as get_secret:
+        yield get_secret
+    oauth_okta.okta_settings.cache_clear()
+
+
+def test_okta_settings_fetched_once_and_env_overrides(get_secret, monkeypatch):
+    monkeypatch.setenv("OKTA_OAUTH2_CLIENT_ID", "local-client")
+    assert oauth_okta.okta_settings() == {**SECRET, "OKTA_OAUTH2_CLIENT_ID": "local-client"}
+    oauth_okta.okta_settings()
+    get_secret.assert_called_once_with("arn:okta")
+
+
+def test_okta_settings_without_secret(monkeypatch):
+    monkeypatch.delenv("OKTA_SECRET_ARN", raising=False)
+    monkeypatch.setenv("SESSION_SECRET", "local")
+    oauth_okta.okta_settings.cache_clear()
+    try:
+        assert oauth_okta.okta_settings()["SESSION_SECRET"] == "local"
+    finally:
+        oauth_okta.okta_settings.cache_clear()
+
+
+def test_login_redirects_to_okta_and_sets_session_cookie(get_secret):
+    with mock.patch.object(oauth_okta.OktaOAuth2App, "warm_jwk_set") as warm:
+        client = TestClient(oauth_okta.init_okta(FastAPI()), follow_redirects=False)
+        response = client.get("/login")
+    assert response.headers["location"].startswith(f"{SECRET['OKTA_OAUTH2_ISSUER']}/v1/authorize?")
+    assert "session=" in response.headers["set-cookie"]
+    warm.assert_called_once()
+
+
+@pytest.fixture
+def okta_app():
+    app = oauth_okta.OktaOAuth2App(mock.Mock(), "okta", client_id="id", jwks_uri="https://example.okta.com/v1/keys")
+    app.clock = Clock(1000.0)
+    with mock.patch.object(StarletteOAuth2App, "fetch_jwk_set") as fetch:
+        fetch.side_effect = lambda force: {"keys": [{"kid": str(fetch.call_count)}]}
+        yield app, fetch
+
+
+def test_jwks_cached_until_ttl(okta_app):
+    app, fetch = okta_app
+    assert asyncio.run(app.fetch_jwk_set()) == {"keys": [{"kid": "1"}]}
+    assert asyncio.run(app.fetch_jwk_set()) == {"keys": [{"kid": "1"}]}
+    app.clock.now += oauth_okta.JWKS_TTL
+    assert asyncio.run(app.fetch_jwk_set()) == {"keys": [{"kid": "2"}]}
+    assert fetch.call_count == 2
+
+
+def test_jwks_forced_refresh_rate_limited(okta_app):
+    app, fetch = okta_app
+    asyncio.run(app.fetch_jwk_set())
+    assert asyncio.run(app.fetch_jwk_set(force=True)) == {"keys": [{"kid": "1"}]}  # unknown kid, just fetched
+    app.clock.now += oauth_okta.JWKS_MIN_REFRESH_INTERVAL
+    assert asyncio.run(app.fetch_jwk_set(force=True)) == {"keys": [{"kid": "2"}]}  # rotated keys
+
+
+def test_jwks_refresh_failure_serves_cached_keys(okta_app):
+    app, fetch = okta_app
+    asyncio.run(app.fetch_jwk_set())
+    app.clock.now += oauth_okta.JWKS_TTL
+    fetch.side_effect = RuntimeError("okta down")
+    assert asyncio.run(app.fetch_jwk_set()) == {"keys": [{"kid": "1"}]}
+    assert asyncio.run(app.fetch_jwk_set()) == {"keys": [{"kid": "1"}]}
+    assert fetch.call_count == 2  # not retried until the retry interval passed
+
+
+def test_jwks_first_fetch_failure_raises(okta_app):
+    app, fetch = okta_app
+    fetch.side_effect = RuntimeError("okta down")
+    with pytest.raises(RuntimeError):
+        asyncio.run(app.fetch_jwk_set())
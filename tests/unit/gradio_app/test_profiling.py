@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import gradio as gr
+import pytest
+from gradio_app import profiling
+
+
+def busy(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@profiling.profiled("chat")
+def chat(prompt: str, request: gr.Request = None):
+    for _ in range(3):
+        busy(0.05)
+        yield prompt
+
+
+def wait_for_profiles(directory, timeout=5.0) -> list:
+    end = time.time() + timeout
+    while time.time() < end:
+        if files := list(directory.glob("*/*.collapsed")):
+            return files
+        time.sleep(0.01)
+    return []
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    for name in ["PROFILE_SAMPLE_RATE", "PROFILE_TOKEN", "PROFILE_S3_URI"]:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_generator_profiled_across_threads_with_header(profile_dir, monkeypatch):
+    monkeypatch.setenv("PROFILE_TOKEN", "secret")
+    headers = {"x-profile": "secret", "x-amzn-trace-id": "Root=1-abc-def;Parent=1"}
+    generator = chat("hi", request=gr.Request(headers=headers))
+    with ThreadPoolExecutor(3) as pool:  # like gradio, each step in a worker thread
+        assert [pool.submit(next, generator).result() for _ in range(3)] == ["hi"] * 3
+    with pytest.raises(StopIteration):
+        next(generator)
+
+    [path] = wait_for_profiles(profile_dir)
+    assert path.relative_to(profile_dir).parts[0] == "chat" and path.name.endswith("-1-abc-def.collapsed")
+    stacks = dict(line.rsplit(" ", 1) for line in path.read_text().splitlines())
+    busy_samples = sum(int(count) for stack, count in stacks.items() if stack.endswith(")") and ";busy (" in stack)
+    assert busy_samples >= 5  # ~150ms at 10ms
+
+
+def test_not_profiled_by_default(profile_dir, monkeypatch):
+    monkeypatch.setenv("PROFILE_TOKEN", "secret")
+    with mock.patch.object(profiling.SAMPLER, "start") as start:
+        assert list(chat("hi", request=gr.Request(headers={"x-profile": "wrong"}))) == ["hi"] * 3
+    start.assert_not_called()
+
+
+def test_function_profiled_by_sample_rate(profile_dir, monkeypatch):
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", "1")
+    profiled = profiling.profiled("docs")(lambda: busy(0.03) or "html")
+    assert profiled() == "html"
+    [path] = wait_for_profiles(profile_dir)
+    assert path.parent.name == "docs" and path.read_text()
+
+
+def test_write_profile_to_s3(monkeypatch):
+    monkeypatch.setenv("PROFILE_S3_URI", "s3://bucket/profiles/")
+    profile = profiling.Profile("invoke_agent", "req-1")
+    profile.stacks["a;b"] += 2
+    with mock.patch.object(profiling.boto3, "client") as client:
+        location = profiling.write_profile(profile)
+    assert location.startswith("s3://bucket/profiles/invoke_agent/") and location.endswith("-req-1.collapsed")
+    assert client.return_value.put_object.call_args.kwargs["Body"] == b"a;b 2\n"
+
+
+@pytest.mark.parametrize(
+    "handler, args", [("get_kb_docs", ()), ("get_kb_ingestion_jobs", ()), ("upload_kb_doc", ("doc.txt",))]
+)
+def test_kb_handlers_profiled_with_header(profile_dir, monkeypatch, handler, args):
+    from gradio_app import helpers, kb
+
+    monkeypatch.setenv("PROFILE_TOKEN", "secret")
+    request = gr.Request(headers={"x-profile": "secret"})
+    with mock.patch.multiple(helpers.BOTO, _s3_client=mock.MagicMock(), _br_client=mock.MagicMock()):
+        with mock.patch.object(profiling.SAMPLER, "start") as start, mock.patch.object(profiling.SAMPLER, "stop"):
+            getattr(kb, handler)(*args, request=request)
+    assert start.call_args_list[0].args[0].name == f"kb.{handler}"
@@ -0,0 +1,86 @@
+from unittest import mock
+import pytest
+from gradio_app import session_store
+from tests.unit.mock_clients import Clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store_and_clock(request, tmp_path):
+    clock = Clock(1000.0)
+    if request.param == "memory":
+        return session_store.MemorySessionStore(clock=clock), clock
+    return session_store.SQLiteSessionStore(str(tmp_path / "sessions.db"), clock=clock), clock
+
+
+def test_store_save_load_delete_and_expiry(store_and_clock):
+    store, clock = store_and_clock
+    store.save("a", '{"user": 1}', expires_at=1100)
+    assert store.load("a") == ('{"user": 1}', 1100)
+    store.save("a", '{"user": 2}', expires_at=1200)
+    assert store.load("a") == ('{"user": 2}', 1200)
+    clock.now = 1200
+    assert store.load("a") is None
+    store.save("b", "{}", expires_at=2000)
+    store.delete("b")
+    assert store.load("b") is None and store.load("missing") is None
+
+
+def test_memory_store_drops_least_recently_used():
+    store = session_store.MemorySessionStore(max_entries=2, clock=lambda: 0)
+    for session_id in "abc":
+        store.save(session_id, "{}", expires_at=10)
+        store.load("a")
+    assert store.load("a") and store.load("c") and store.load("b") is None
+
+
+def test_sqlite_store_shared_between_containers(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    session_store.SQLiteSessionStore(path).save("a", "{}", expires_at=2**40)
+    assert session_store.SQLiteSessionStore(path).load("a") == ("{}", 2**40)
+
+
+def test_dynamodb_store():
+    client = mock.MagicMock()
+    store = session_store.DynamoDBSessionStore("table", client=client, clock=lambda: 1000.0)
+    store.save("a", "{}", expires_at=1100.5)
+    assert client.put_item.call_args.kwargs["Item"] == {
+        "pk": {"S": "a"},
+        "payload": {"S": "{}"},
+        "expiresAt": {"N": "1100"},
+    }
+    client.get_item.return_value = {"Item": client.put_item.call_args.kwargs["Item"]}
+    assert store.load("a") == ("{}", 1100.0)
+    client.get_item.return_value = {"Item": {**client.put_item.call_args.kwargs["Item"], "expiresAt": {"N": "999"}}}
+    assert store.load("a") is None  # expired, not yet deleted by the DynamoDB TTL
+    client.get_item.return_value = {}
+    assert store.load("missing") is None
+
+
+def test_cached_store_reads_through_for_ttl():
+    clock = Clock(1000.0)
+    durable = mock.MagicMock(wraps=session_store.MemorySessionStore(clock=clock))
+    store = session_store.CachedSessionStore(durable, ttl=60, clock=clock)
+    store.save("a", "{}", expires_at=2000)
+    assert store.load("a") == ("{}", 2000) and store.load("missing") is None and store.load("missing") is None
+    assert durable.load.call_count == 1  # the miss, once
+    durable.delete("a")  # ie. logged out by another container
+    assert store.load("a") == ("{}", 2000)
+    clock.now += 60
+    assert store.load("a") is None
+    store.save("b", "{}", expires_at=clock.now + 1)
+    clock.now += 1
+    assert store.load("b") is None  # the session expired before the cache entry
+
+
+def test_session_store_from_env(monkeypatch, tmp_path):
+    for name in ["SESSION_TABLE", "SESSION_DB", "SESSION_STORE"]:
+        monkeypatch.delenv(name, raising=False)
+    assert session_store.session_store_from_env() is None
+    monkeypatch.setenv("SESSION_STORE", "memory")
+    assert isinstance(session_store.session_store_from_env(), session_store.MemorySessionStore)
+    monkeypatch.setenv("SESSION_DB", str(tmp_path / "sessions.db"))
+    assert isinstance(session_store.session_store_from_env(), session_store.SQLiteSessionStore)
+    monkeypatch.setenv("SESSION_TABLE", "table")
+    store = session_store.session_store_from_env()
+    assert isinstance(store, session_store.CachedSessionStore)
+    assert isinstance(store.store, session_store.DynamoDBSessionStore)
@@ -0,0 +1,152 @@
+import asyncio
+from unittest import mock
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from gradio_app import session_store, sessions
+
+
+async def login(request: Request) -> JSONResponse:
+    request.session["user"] = {"name": "Jane"}
+    return JSONResponse(request.session)
+
+
+async def poll(request: Request) -> JSONResponse:
+    return JSONResponse(request.session)
+
+
+async def logout(request: Request) -> JSONResponse:
+    request.session.clear()
+    return JSONResponse(request.session)
+
+
+def make_client(middleware_cls=sessions.SignedCookieSessionMiddleware, **kwargs) -> TestClient:
+    routes = [Route("/login", login), Route("/poll", poll), Route("/logout", logout)]
+    app = Starlette(routes=routes)
+    app.add_middleware(middleware_cls, secret_key="secret", **kwargs)
+    return TestClient(app)
+
+
+def test_set_cookie_only_when_session_changes():
+    client = make_client()
+    assert "session=" in client.get("/login").headers["set-cookie"]
+    response = client.get("/poll")
+    assert response.json() == {"user": {"name": "Jane"}}
+    assert "set-cookie" not in response.headers
+    assert "expires=Thu, 01 Jan 1970" in client.get("/logout").headers["set-cookie"]
+    assert client.get("/poll").json() == {}
+
+
+def test_unchanged_session_resigned_after_refresh_after():
+    client = make_client(refresh_after=60)
+    client.get("/login")
+    with mock.patch.object(sessions.time, "time", return_value=sessions.time.time() + 61):
+        assert "session=" in client.get("/poll").headers["set-cookie"]
+
+
+@pytest.mark.parametrize("signer,verifier", [(SessionMiddleware, None), (None, SessionMiddleware)])
+def test_cookie_compatible_with_starlette(signer, verifier):
+    first, second = make_client(signer or sessions.SignedCookieSessionMiddleware), make_client(
+        verifier or sessions.SignedCookieSessionMiddleware
+    )
+    first.get("/login")
+    second.cookies = first.cookies
+    assert second.get("/poll").json() == {"user": {"name": "Jane"}}
+
+
+def test_tampered_and_expired_cookies_rejected():
+    client = make_client(max_age=60)
+    client.get("/login")
+    cookie = client.cookies["session"]
+    client.cookies["session"] = cookie[:-2] + "xx"
+    assert client.get("/poll").json() == {}
+    client.cookies["session"] = cookie
+    with mock.patch.object(sessions.time, "time", return_value=sessions.time.time() + 61):
+        assert client.get("/poll").json() == {}  # cached, but expired
+
+
+def test_verified_cookie_cache_is_bounded():
+    middleware = sessions.SignedCookieSessionMiddleware(None, secret_key="secret", cache_size=2)
+    cookies = [middleware.sign(f'{{"n": {i}}}') for i in range(3)]
+    assert list(middleware._verified) == cookies[1:]
+    with mock.patch.object(middleware.signer, "unsign", wraps=middleware.signer.unsign) as unsign:
+        assert middleware.verify(cookies[2])[0] == '{"n": 2}'
+        assert middleware.verify(cookies[0])[0] == '{"n": 0}'
+    assert unsign.call_count == 1
+
+
+def make_server_side_client(store=None, **kwargs) -> TestClient:
+    store = store or session_store.MemorySessionStore()
+    return make_client(lambda app, secret_key, **kw: sessions.ServerSideSessionMiddleware(app, store, **kw), **kwargs)
+
+
+def test_server_side_session_cookie_is_only_an_id():
+    client = make_server_side_client()
+    client.get("/login")
+    session_id = client.cookies["session_id"]
+    assert sessions.SESSION_ID.match(session_id)
+    response = client.get("/poll")
+    assert response.json() == {"user": {"name": "Jane"}}
+    assert "set-cookie" not in response.headers
+    assert "expires=Thu, 01 Jan 1970" in client.get("/logout").headers["set-cookie"]
+    client.cookies["session_id"] = session_id
+    assert client.get("/poll").json() == {}  # deleted from the store
+
+
+def test_server_side_session_new_id_when_session_changes():
+    store = session_store.MemorySessionStore()
+    client = make_server_side_client(store)
+    client.cookies["session_id"] = "x" * 43
+    store.save("x" * 43, '{"state": "from login"}', expires_at=2**40)
+    new_id = client.get("/login").headers["set-cookie"].split(";")[0].split("=")[1]
+    assert sessions.SESSION_ID.match(new_id) and new_id != "x" * 43
+    assert store.load("x" * 43) is None
+
+
+def test_server_side_session_expiry_extended_after_refresh_after():
+    client = make_server_side_client(refresh_after=60)
+    client.get("/login")
+    with mock.patch.object(sessions.time, "time", return_value=sessions.time.time() + 61):
+        assert "Max-Age" in client.get("/poll").headers["set-cookie"]
+
+
+def test_server_side_sessions_survive_containers(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first = make_server_side_client(session_store.SQLiteSessionStore(path))
+    first.get("/login")
+    second = make_server_side_client(session_store.SQLiteSessionStore(path))
+    second.cookies = first.cookies
+    assert second.get("/poll").json() == {"user": {"name": "Jane"}}
+
+
+@pytest.mark.parametrize("session_id", ["../../etc", "short", ""])
+def test_server_side_session_ignores_malformed_ids(session_id):
+    store = mock.MagicMock()
+    client = make_server_side_client(store)
+    client.cookies["session_id"] = session_id
+    assert client.get("/poll").json() == {}
+    store.load.assert_not_called()
+
+
+def test_server_side_store_calls_run_off_the_event_loop():
+    def off_loop(method):
+        def call(*args):
+            with pytest.raises(RuntimeError):
+                asyncio.get_running_loop()
+            calls.append(method.__name__)
+            return method(*args)
+
+        return call
+
+    calls = []
+    store = session_store.MemorySessionStore()
+    store.load, store.save, store.delete = off_loop(store.load), off_loop(store.save), off_loop(store.delete)
+    client = make_server_side_client(store)
+    client.get("/login")
+    client.get("/poll")
+    client.get("/logout")
+    assert calls == ["save", "load", "load", "delete"]
@@ -0,0 +1,56 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from gradio_app import static
+
+SCRIPT = "console.log('hello');\n" * 200
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "static" / "img").mkdir(parents=True)
+    (tmp_path / "assets" / "Blocks-CyfcXtBq.js").write_text(SCRIPT)
+    (tmp_path / "static" / "img" / "logo.svg").write_text("<svg/>")
+    (tmp_path / "secret.txt").write_text("secret")
+    assert static.precompress(str(tmp_path / "assets")) == (1, 2 if static.brotli else 1)
+
+    app = Starlette(routes=[Route("/{path:path}", lambda request: PlainTextResponse("from gradio"))])
+    asset_dirs = {"/assets/": str(tmp_path / "assets"), "/static/": str(tmp_path / "static")}
+    app.add_middleware(static.StaticAssetMiddleware, mount_path="/gradio", asset_dirs=asset_dirs)
+    return TestClient(app)
+
+
+def test_hashed_asset_served_precompressed_and_immutable(client):
+    response = client.get("/gradio/assets/Blocks-CyfcXtBq.js", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["cache-control"] == static.IMMUTABLE_CACHE_CONTROL
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/javascript")
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert "etag" in response.headers
+    assert response.text == SCRIPT  # decoded by the client
+    assert int(response.headers["content-length"]) < len(SCRIPT)
+
+
+def test_identity_when_compression_not_accepted(client):
+    response = client.get("/gradio/assets/Blocks-CyfcXtBq.js", headers={"Accept-Encoding": "identity, gzip;q=0"})
+    assert "content-encoding" not in response.headers
+    assert response.text == SCRIPT
+
+
+def test_unhashed_static_file_cached_for_a_day(client):
+    response = client.get("/gradio/static/img/logo.svg")
+    assert response.headers["cache-control"] == static.STATIC_CACHE_CONTROL
+    assert response.text == "<svg/>"
+
+
+@pytest.mark.parametrize("path", ["/gradio/", "/gradio/assets/missing.js", "/gradio/assets/../secret.txt"])
+def test_other_paths_reach_the_app(client, path):
+    assert client.get(path).text == "from gradio"
+
+
+def test_accepted_encodings():
+    headers = [(b"accept-encoding", b"gzip, deflate, br;q=1.0, zstd;q=0")]
+    assert static.accepted_encodings(headers) == ["gzip", "deflate", "br"]
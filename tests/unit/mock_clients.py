@@ -0,0 +1,197 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import itertools
+from types import SimpleNamespace
+from typing import Dict, List
+from pinecone.exceptions import NotFoundException
+
+
+class Clock:
+    """Stand in for time.time() or time.monotonic() that only moves when `now` is set or `sleep()` is called"""
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class FakePaginator:
+    def __init__(self, client: "FakeBedrockAgentClient", operation: str):
+        self.client = client
+        self.operation = operation
+
+    def paginate(self, PaginationConfig: dict = None, **kwargs):
+        yield getattr(self.client, self.operation)(**kwargs)
+
+
+class FakeBedrockAgentClient:
+    """In memory stand in for boto3.client("bedrock-agent"), everything is ready as soon as it is created"""
+
+    def __init__(
+        self, agent_id: str = "AGENT", aliases: List[str] = (), action_groups: List[str] = (), alias_polls: int = 0
+    ):
+        """param alias_polls: int: how many get_agent_alias() calls see a new or updated alias as not ready"""
+        self.calls = Counter()
+        self.alias_polls = alias_polls
+        self._pending: Dict[str, int] = {}
+        self._ticks = itertools.count()
+        self._ids = itertools.count(1)
+        self.agent_id = agent_id
+        self.agent = {"agentId": agent_id, "agentStatus": "PREPARED", "updatedAt": self._now()}
+        self.agent["preparedAt"] = self._now()
+        self.versions = 1
+        self.alias_details: Dict[str, dict] = {}
+        for name in aliases:
+            self._add_alias(name, "1")
+        self.action_group_details: Dict[str, dict] = {}
+        for name in action_groups:
+            self.create_agent_action_group(agentId=agent_id, agentVersion="DRAFT", actionGroupName=name)
+        self.calls.clear()
+
+    def _now(self) -> datetime:
+        return datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=next(self._ticks))
+
+    def _add_alias(self, name: str, version: str) -> dict:
+        alias = {
+            "agentAliasId": f"ALIAS{next(self._ids)}",
+            "agentAliasName": name,
+            "agentAliasStatus": "PREPARED",
+            "routingConfiguration": [{"agentVersion": version}],
+            "updatedAt": self._now(),
+        }
+        self.alias_details[alias["agentAliasId"]] = alias
+        return alias
+
+    def get_paginator(self, operation: str) -> FakePaginator:
+        return FakePaginator(self, operation)
+
+    def get_agent(self, agentId: str) -> dict:
+        self.calls["get_agent"] += 1
+        return {"agent": dict(self.agent)}
+
+    def prepare_agent(self, agentId: str) -> dict:
+        self.calls["prepare_agent"] += 1
+        self.agent["preparedAt"] = self._now()
+        return {"agentId": agentId, "agentStatus": "PREPARING", "agentVersion": "DRAFT", **self.agent}
+
+    def list_agent_action_groups(self, agentId: str, agentVersion: str) -> dict:
+        self.calls["list_agent_action_groups"] += 1
+        return {"actionGroupSummaries": [dict(group) for group in self.action_group_details.values()]}
+
+    def create_agent_action_group(self, agentId: str, agentVersion: str, actionGroupName: str, **kwargs) -> dict:
+        self.calls["create_agent_action_group"] += 1
+        action_group = {"actionGroupId": f"GROUP{next(self._ids)}", "actionGroupName": actionGroupName}
+        action_group.update(actionGroupState=kwargs.get("actionGroupState", "ENABLED"), updatedAt=self._now())
+        self.action_group_details[action_group["actionGroupId"]] = action_group
+        return {"agentActionGroup": dict(action_group)}
+
+    def update_agent_action_group(self, actionGroupId: str, **kwargs) -> dict:
+        self.calls["update_agent_action_group"] += 1
+        action_group = self.action_group_details[actionGroupId]
+        action_group.update(actionGroupState=kwargs.get("actionGroupState", "ENABLED"), updatedAt=self._now())
+        return {"agentActionGroup": dict(action_group)}
+
+    def delete_agent_action_group(self, actionGroupId: str, **kwargs) -> dict:
+        self.calls["delete_agent_action_group"] += 1
+        del self.action_group_details[actionGroupId]
+        return {"actionGroupId": actionGroupId, "actionGroupStatus": "DELETING"}
+
+    def list_agent_aliases(self, agentId: str) -> dict:
+        self.calls["list_agent_aliases"] += 1
+        return {"agentAliasSummaries": [dict(alias) for alias in self.alias_details.values()]}
+
+    def get_agent_alias(self, agentId: str, agentAliasId: str) -> dict:
+        self.calls["get_agent_alias"] += 1
+        alias = dict(self.alias_details[agentAliasId])
+        if self._pending.get(agentAliasId):
+            self._pending[agentAliasId] -= 1
+            alias["agentAliasStatus"] = "UPDATING"
+        return {"agentAlias": alias}
+
+    def create_agent_alias(self, agentId: str, agentAliasName: str) -> dict:
+        self.calls["create_agent_alias"] += 1
+        self.versions += 1
+        alias = self._add_alias(agentAliasName, str(self.versions))
+        self._pending[alias["agentAliasId"]] = self.alias_polls
+        return {"agentAlias": {**alias, "agentAliasStatus": "CREATING", "routingConfiguration": []}}
+
+    def update_agent_alias(self, agentId: str, agentAliasId: str, agentAliasName: str, routingConfiguration) -> dict:
+        self.calls["update_agent_alias"] += 1
+        alias = self.alias_details[agentAliasId]
+        alias.update(routingConfiguration=routingConfiguration, updatedAt=self._now())
+        self._pending[agentAliasId] = self.alias_polls
+        return {"agentAlias": {**alias, "agentAliasStatus": "UPDATING"}}
+
+    def delete_agent_alias(self, agentId: str, agentAliasId: str) -> dict:
+        self.calls["delete_agent_alias"] += 1
+        del self.alias_details[agentAliasId]
+        return {"agentAliasId": agentAliasId, "agentAliasStatus": "DELETING"}
+
+
+class FakeIndexModel(SimpleNamespace):
+    def to_dict(self) -> dict:
+        return {"name": self.name, "host": self.host, "dimension": self.dimension, "metric": self.metric, **self.extra}
+
+
+class FakePineconeIndex:
+    def __init__(self, namespaces: Dict[str, Dict[str, SimpleNamespace]]):
+        self.namespaces = namespaces  # namespace -> id -> vector
+
+    def describe_index_stats(self) -> SimpleNamespace:
+        return SimpleNamespace(namespaces={name: {"vector_count": len(v)} for name, v in self.namespaces.items()})
+
+    def list(self, namespace: str = ""):
+        ids = sorted(self.namespaces.get(namespace, {}))
+        while ids:  # small pages
+            yield ids[:2]
+            ids = ids[2:]
+
+    def fetch(self, ids: List[str], namespace: str = "") -> SimpleNamespace:
+        return SimpleNamespace(vectors={id: self.namespaces[namespace][id] for id in ids})
+
+    def upsert(self, vectors: list, namespace: str = "", **kwargs) -> None:
+        self.namespaces.setdefault(namespace, {}).update({vector.id: vector for vector in vectors})
+
+
+class FakePinecone:
+    """In memory stand in for pinecone.Pinecone, new indexes are ready after `ready_polls` describe_index() calls"""
+
+    def __init__(self, ready_polls: int = 1):
+        self.ready_polls = ready_polls
+        self.indexes: Dict[str, FakeIndexModel] = {}
+        self.data: Dict[str, FakePineconeIndex] = {}  # host -> index data
+        self.calls = Counter()
+        self._hosts = itertools.count(1)
+
+    def create_index(self, name: str, dimension: int, metric: str, spec) -> None:
+        self.calls["create_index"] += 1
+        assert name not in self.indexes, f"index {name} already exists"
+        host = f"{name}-{next(self._hosts)}.svc.pinecone.io"
+        self.indexes[name] = FakeIndexModel(name=name, host=host, dimension=dimension, metric=metric, pending=0)
+        self.indexes[name].pending = self.ready_polls
+        self.indexes[name].extra = {"spec": {"serverless": {"cloud": spec.cloud, "region": spec.region}}}
+        self.data[host] = FakePineconeIndex({})
+
+    def describe_index(self, name: str) -> FakeIndexModel:
+        self.calls["describe_index"] += 1
+        if name not in self.indexes:
+            raise NotFoundException(status=404, reason=f"index {name} not found")
+        index = self.indexes[name]
+        ready = index.pending == 0
+        index.pending = max(0, index.pending - 1)
+        index.extra = {**index.extra, "status": {"ready": ready, "state": "Ready" if ready else "Initializing"}}
+        return index
+
+    def list_indexes(self) -> SimpleNamespace:
+        return SimpleNamespace(indexes=list(self.indexes.values()))
+
+    def delete_index(self, name: str) -> None:
+        self.calls["delete_index"] += 1
+        del self.indexes[name]
+
+    def Index(self, host: str) -> FakePineconeIndex:
+        return self.data[host]
@@ -1,4 +1,5 @@
-from cdk.models.models import (
+import pytest
+from cdk.models import (
     BedrockEvent,
     BedrockResponseEvent,
     FunctionResponseBody,
@@ -37,3 +38,19 @@ def test_bedrock_lambda_types_response_event_from_event():
 def test_bedrock_lambda_types_response_event_from_event_failure():
     fr_event = BedrockResponseEvent.response_event_from_event(bedrock_event, "response_text", response_state="FAILURE")
     assert fr_event.response.functionResponse.responseState == "FAILURE"
+
+
+def test_bedrock_lambda_types_from_event_reuses_validated_event():
+    fn_event = BedrockEvent.from_event(bedrock_event)
+    assert BedrockEvent.from_event(fn_event) is fn_event
+
+
+def test_bedrock_lambda_types_response_dict_from_event_invalid_state():
+    with pytest.raises(ValueError):
+        BedrockResponseEvent.response_dict_from_event(bedrock_event, "response_text", response_state="INVALID")
+
+
+def test_bedrock_lambda_types_response_dict_from_event_matches_model_dump():
+    for state in (None, "REPROMPT", "FAILURE"):
+        expected = BedrockResponseEvent.response_event_from_event(bedrock_event, "text", state).model_dump()
+        assert BedrockResponseEvent.response_dict_from_event(bedrock_event, "text", state) == expected
@@ -0,0 +1,28 @@
+import aws_cdk as core
+from aws_cdk import assertions
+from cdk.constructs.action_group_function import ActionGroupFunction
+from cdk.constructs.function_image import FunctionImage
+from cdk.stacks.helpers import prune_dir
+
+
+def test_prune_dir_is_an_allow_list():
+    excludes = prune_dir(keeps=["functions", "models.py"])
+    assert "gradio_app" in excludes and "tools" in excludes and "cdk/stacks" in excludes
+    assert not {"cdk", "cdk/functions", "cdk/models.py", "Dockerfile", "poetry.lock"}.intersection(excludes)
+    assert prune_dir(keeps=None, base_dir="gradio_app", root_keeps=["Dockerfile.ui"]).count("cdk") == 1
+
+
+def test_functions_share_one_image():
+    app = core.App()
+    stack = core.Stack(app, "test")
+    for name, handler in [("WebSearch", "web_search"), ("KbRetrieve", "kb_retrieve")]:
+        ActionGroupFunction(stack, name, handler=f"cdk.functions.{handler}.lambda_handler", description=name)
+    assert FunctionImage.of(stack) is FunctionImage.of(stack.node.find_child("WebSearch"))
+
+    template = assertions.Template.from_stack(stack)
+    functions = template.find_resources("AWS::Lambda::Function").values()
+    assert [f["Properties"]["ImageConfig"]["Command"] for f in functions] == [
+        ["cdk.functions.web_search.lambda_handler"],
+        ["cdk.functions.kb_retrieve.lambda_handler"],
+    ]
+    assert len({str(f["Properties"]["Code"]["ImageUri"]) for f in functions}) == 1
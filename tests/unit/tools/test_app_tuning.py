@@ -0,0 +1,29 @@
+from tools import app_tuning
+
+
+def test_synthetic_events_parse_into_chat_messages():
+    chatbot = app_tuning.chat(app_tuning.synthetic_events(tool_calls=1, answer_chunks=2))
+    titles = [message.metadata["title"] for message in chatbot if isinstance(message.metadata, dict)]
+    assert titles == ["0. created code", "1. rationale", "2. kb_lookup", "3. tool use", "5. observation"]
+    assert chatbot[-1].content.startswith("part 1 of the answer")
+
+
+def test_measure_workloads():
+    results = app_tuning.measure([app_tuning.synthetic_events(tool_calls=1)], repeats=1)
+    assert set(results) == {"chat", "render", "kb_tables"}
+    assert all(result.cpu_ms > 0 for result in results.values())
+
+
+def test_model_curve_and_recommendation():
+    points = app_tuning.model_curve(cpu_ms=100, rss_mb=1000, memory_sizes=[1024, 1769, 10240])
+    by_config = {(p.architecture, p.memory_mb): p for p in points}
+    assert not by_config[("x86_64", 1024)].fits  # below the peak RSS with headroom
+    assert by_config[("x86_64", 1769)].duration_ms == by_config[("x86_64", 10240)].duration_ms == 100
+    assert by_config[("x86_64", 10240)].cost_per_1k > by_config[("x86_64", 1769)].cost_per_1k
+    best = app_tuning.recommend(points)
+    assert (best.architecture, best.memory_mb) == ("arm64", 1769)
+
+    # io wait is billed at any memory size, with a slower arm64 x86_64 wins
+    slow_arm = app_tuning.model_curve(100, 100, io_ms=50, memory_sizes=[1769], relative_speed={"arm64": 0.5})
+    assert [p.duration_ms for p in slow_arm] == [150, 250]
+    assert app_tuning.recommend(slow_arm, latency_tolerance=0.1).architecture == "x86_64"
@@ -0,0 +1,90 @@
+import gzip
+import io
+from unittest import mock
+from tools import cf_logs
+
+FIELDS = (
+    "date time x-edge-location sc-bytes c-ip cs-method cs(Host) cs-uri-stem sc-status cs(Referer) cs(User-Agent) "
+    "cs-uri-query cs(Cookie) x-edge-result-type x-edge-request-id x-host-header cs-protocol cs-bytes time-taken "
+    "x-forwarded-for ssl-protocol ssl-cipher x-edge-response-result-type cs-protocol-version fle-status "
+    "fle-encrypted-fields c-port time-to-first-byte x-edge-detailed-result-type sc-content-type sc-content-len "
+    "sc-range-start sc-range-end"
+)
+
+
+def log_line(clock: str, path: str, status: int, result: str, time_taken: float, ttfb: float) -> str:
+    values = dict.fromkeys(FIELDS.split(), "-")
+    values.update({"date": "2024-10-19", "time": clock, "cs-uri-stem": path, "sc-status": str(status)})
+    values.update({"x-edge-result-type": result, "time-taken": str(time_taken), "time-to-first-byte": str(ttfb)})
+    values["sc-bytes"] = "1024"
+    return "\t".join(values.values())
+
+
+def log_file(*lines: str) -> bytes:
+    return gzip.compress(("#Version: 1.0\n#Fields: " + FIELDS + "\n" + "\n".join(lines) + "\n").encode())
+
+
+def write_log(directory, name: str, *lines: str) -> None:
+    (directory / name).write_bytes(log_file(*lines))
+
+
+def test_parse_log_into_column_batches():
+    lines = [log_line("10:00:0%d" % i, "/gradio", 200, "Miss", 0.5, 0.1) for i in range(5)]
+    batches = list(cf_logs.parse_log(io.BytesIO(log_file(*lines)), "key", batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert batches[0].columns["time-taken"] == [0.5, 0.5]
+    assert batches[0].columns["sc-status"] == [200, 200]
+    assert batches[0].columns["cs-uri-stem"] == ["/gradio", "/gradio"]
+    assert batches[0].columns["sc-content-len"] == ["-", "-"]
+
+
+def test_tailer_fetches_only_new_objects(tmp_path):
+    source = mock.MagicMock(wraps=cf_logs.LocalLogSource(str(tmp_path)))
+    write_log(tmp_path, "E1.2024-10-19-09.aaa.gz", log_line("09:59:00", "/", 200, "Miss", 1, 1))
+    write_log(tmp_path, "E1.2024-10-19-10.bbb.gz", log_line("10:00:00", "/", 200, "Miss", 1, 1))
+    tailer = cf_logs.LogTailer(source, backfill=1)
+    assert tailer.new_keys() == ["E1.2024-10-19-10.bbb.gz"]
+    assert tailer.new_keys() == []
+    assert source.list.call_args.args == ("", "E1.2024-10-19-09")  # the previous hour is listed again
+
+    write_log(tmp_path, "E1.2024-10-19-10.aaa.gz", log_line("10:00:30", "/", 200, "Miss", 1, 1))  # delivered late
+    write_log(tmp_path, "E1.2024-10-19-11.ccc.gz", log_line("11:00:00", "/", 200, "Miss", 1, 1))
+    assert tailer.new_keys() == ["E1.2024-10-19-10.aaa.gz", "E1.2024-10-19-11.ccc.gz"]
+    assert tailer.high_water_mark == "E1.2024-10-19-11.ccc.gz"
+    assert source.list.call_args.args == ("", "E1.2024-10-19-09")
+    assert tailer.new_keys() == []
+    assert source.list.call_args.args == ("", "E1.2024-10-19-10")
+
+
+def test_rolling_stats(tmp_path):
+    write_log(
+        tmp_path,
+        "E1.2024-10-19-10.aaa.gz",
+        log_line("09:00:00", "/old", 500, "Error", 9, 9),  # outside the window
+        *[log_line("10:00:%02d" % i, "/gradio/assets/a.js", 200, "Hit", 0.001, 0.001) for i in range(6)],
+        *[log_line("10:01:%02d" % i, "/gradio/queue/join", 200, "Miss", 0.5 + i, 0.1) for i in range(3)],
+        log_line("10:01:59", "/login", 302, "Miss", 0.2, 0.2),
+    )
+    stats = cf_logs.RollingStats(window=15 * 60)
+    for batch in cf_logs.LogTailer(cf_logs.LocalLogSource(str(tmp_path))).poll():
+        stats.add(batch)
+    summary = stats.summary()
+    assert summary.requests == 10
+    assert summary.window_seconds == 120
+    assert summary.cache_hit_ratio == 0.6
+    assert summary.status_classes == {"2xx": 9, "3xx": 1}
+    assert summary.status_codes == {"200": 9, "302": 1}
+    assert summary.time_taken_ms["max"] == 2500
+    assert summary.time_to_first_byte_ms["p50"] == 1
+    assert "cache hit ratio 60.0%" in cf_logs.as_text(summary)
+
+
+def test_s3_log_source_starts_after_the_mark():
+    client = mock.MagicMock()
+    client.get_paginator.return_value.paginate.return_value = [{"Contents": [{"Key": "logs/E1.a.gz"}]}, {}]
+    source = cf_logs.S3LogSource("bucket", client=client)
+    assert list(source.list("logs/", "logs/E1.0")) == ["logs/E1.a.gz"]
+    client.get_paginator.return_value.paginate.assert_called_with(
+        Bucket="bucket", Prefix="logs/", StartAfter="logs/E1.0"
+    )
+    assert cf_logs.log_source("s3://bucket/logs/")[1] == "logs/"
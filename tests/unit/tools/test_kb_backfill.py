@@ -0,0 +1,201 @@
+import io
+import sys
+import threading
+import time
+from unittest import mock
+import pytest
+from tools import chunking, vectors
+from tools.kb_backfill import (
+    Backfill,
+    Checkpoint,
+    CheckpointMismatch,
+    DocumentParser,
+    LocalDirectorySource,
+    PdfParser,
+    S3ObjectSource,
+    TextParser,
+    chunk_id,
+)
+from tools.vectors import SOURCE_URI_FIELD, TEXT_FIELD, HashEmbedder, InMemoryVectorStore
+
+
+def words(n: int, start: int = 0) -> str:
+    return " ".join(f"w{i}" for i in range(start, start + n))
+
+
+def test_fixed_size_chunks_overlap():
+    chunks = chunking.chunk_text(words(25), max_tokens=10, overlap_percentage=20)
+    assert [chunk.text.split()[0] for chunk in chunks] == ["w0", "w8", "w16"]
+    assert all(chunking.count_tokens(chunk.text) <= 10 for chunk in chunks)
+    assert chunks[-1].text.endswith("w24")
+    assert chunking.chunk_text(words(5), chunking.NONE)[0].text == words(5)
+    with pytest.raises(ValueError):
+        chunking.chunk_text("text", "SEMANTIC")
+
+
+@pytest.fixture
+def docs(tmp_path):
+    (tmp_path / "a.txt").write_text(words(50))
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b.md").write_text(words(5, start=100))
+    (tmp_path / "sub" / "b.md.metadata.json").write_text("{}")
+    (tmp_path / "c.pdf").write_bytes(b"%PDF")
+    (tmp_path / "d.docx").write_bytes(b"PK")
+    return tmp_path
+
+
+class FakePdfParser(DocumentParser):
+    extensions = (".pdf",)
+
+    def parse(self, data: bytes) -> str:
+        assert data == b"%PDF"
+        return words(5, start=200)
+
+
+def make_backfill(source, store, **kwargs) -> Backfill:
+    return Backfill(source, HashEmbedder(32), store, max_tokens=20, overlap_percentage=0, batch_size=2, **kwargs)
+
+
+def test_backfill_local_directory(docs):
+    store = InMemoryVectorStore()
+    parsers = (TextParser(), FakePdfParser())
+    stats = make_backfill(LocalDirectorySource(str(docs)), store, data_source_id="DS", parsers=parsers).run()
+    assert (stats.objects, stats.chunks, stats.unsupported, stats.failed) == (3, 5, 1, 0)
+    assert store.records[chunk_id(f"file://{docs}/c.pdf", 0)].metadata[TEXT_FIELD] == words(5, start=200)
+    record = store.records[chunk_id(f"file://{docs}/sub/b.md", 0)]
+    assert record.metadata[TEXT_FIELD] == words(5, start=100)
+    assert record.metadata[SOURCE_URI_FIELD] == f"file://{docs}/sub/b.md"
+    assert len(record.values) == 32
+    assert store.query(HashEmbedder(32).embed([words(3, start=101)])[0], top_k=1)[0] is record
+
+
+def test_pdf_parser_joins_the_pages():
+    pages = [mock.Mock(**{"extract_text.return_value": text}) for text in ("page 1", None, "page 3")]
+    pypdf = mock.Mock(**{"PdfReader.return_value.pages": pages})
+    with mock.patch.dict(sys.modules, pypdf=pypdf):
+        assert PdfParser().parse(b"%PDF") == "page 1\n\n\n\npage 3"
+    assert pypdf.PdfReader.call_args.args[0].read() == b"%PDF"
+
+
+def test_pdf_parser_needs_pypdf():
+    with mock.patch.dict(sys.modules, pypdf=None), pytest.raises(ImportError, match="pip install pypdf"):
+        PdfParser().parse(b"%PDF")
+
+
+class FlakyStore(InMemoryVectorStore):
+    def __init__(self, fail_uri: str):
+        super().__init__()
+        self.fail_uri = fail_uri
+
+    def upsert(self, records):
+        if any(record.metadata[SOURCE_URI_FIELD] == self.fail_uri for record in records):
+            raise ConnectionError("upsert failed")
+        super().upsert(records)
+
+
+def test_backfill_resumes_from_checkpoint(docs):
+    path = str(docs / "checkpoint.jsonl")
+    source = LocalDirectorySource(str(docs / "sub"))
+    (docs / "sub" / "a.txt").write_text(words(50))
+    stats = make_backfill(source, FlakyStore(f"file://{docs}/sub/a.txt"), checkpoint=Checkpoint(path)).run()
+    assert (stats.objects, stats.failed) == (1, 1)
+
+    store = InMemoryVectorStore()
+    stats = make_backfill(source, store, checkpoint=Checkpoint(path)).run()
+    assert (stats.objects, stats.skipped, stats.failed) == (1, 1, 0)
+    assert {record.metadata[SOURCE_URI_FIELD] for record in store.records.values()} == {f"file://{docs}/sub/a.txt"}
+    with open(path, "a") as f:
+        f.write('{"key": "partial')  # interrupted while writing
+    assert len(Checkpoint(path)) == 2
+
+
+def test_backfill_deletes_stale_chunks(docs):
+    path = str(docs / "checkpoint.jsonl")
+    source, store = LocalDirectorySource(str(docs / "sub")), InMemoryVectorStore()
+    (docs / "sub" / "a.txt").write_text(words(50))
+    make_backfill(source, store, checkpoint=Checkpoint(path)).run()
+    assert len(store.records) == 4  # a.txt 3 chunks, b.md 1
+
+    (docs / "sub" / "a.txt").write_text(words(10))  # shrunk to 1 chunk
+    (docs / "sub" / "b.md").unlink()
+    stats = make_backfill(source, store, checkpoint=Checkpoint(path)).run()
+    assert (stats.objects, stats.removed, stats.deleted_chunks) == (1, 1, 3)
+    assert set(store.records) == {chunk_id(f"file://{docs}/sub/a.txt", 0)}
+    assert Checkpoint(path).keys() == ["a.txt"]
+
+    (docs / "sub" / "a.txt").unlink()
+    stats = make_backfill(source, store, checkpoint=Checkpoint(path), delete_removed=False).run()
+    assert (stats.removed, len(store.records)) == (0, 1)
+
+
+def test_checkpoint_with_other_settings_is_refused_or_reset(docs):
+    path = str(docs / "checkpoint.jsonl")
+    source, store = LocalDirectorySource(str(docs / "sub")), InMemoryVectorStore()
+    (docs / "sub" / "a.txt").write_text(words(50))
+    settings = dict(max_tokens=20, model_id="hash", index_host="blue", namespace="")
+    make_backfill(source, store, checkpoint=Checkpoint(path, settings)).run()
+    assert len(store.records) == 4  # a.txt 3 chunks, b.md 1
+    assert make_backfill(source, store, checkpoint=Checkpoint(path, settings)).run().skipped == 2
+
+    bigger = {**settings, "max_tokens": 40}
+    with pytest.raises(CheckpointMismatch):
+        Checkpoint(path, bigger)
+    checkpoint = Checkpoint(path, bigger, reset=True)
+    stats = Backfill(source, HashEmbedder(32), store, checkpoint, max_tokens=40, overlap_percentage=0).run()
+    assert (stats.objects, stats.skipped, stats.deleted_chunks, len(store.records)) == (2, 0, 1, 3)
+    assert make_backfill(source, store, checkpoint=Checkpoint(path, bigger)).run().skipped == 2
+
+    green = Checkpoint(path, {**bigger, "index_host": "green"}, reset=True)
+    assert len(green) == 0  # the chunk ids are in the blue index
+    with pytest.raises(CheckpointMismatch):
+        Checkpoint(path, settings)
+
+
+def test_pinecone_store_deletes_in_batches():
+    index = mock.MagicMock()
+    vectors.PineconeVectorStore(index, "ns").delete([f"id{i}" for i in range(vectors.PINECONE_DELETE_BATCH + 1)])
+    assert [len(call.kwargs["ids"]) for call in index.delete.call_args_list] == [vectors.PINECONE_DELETE_BATCH, 1]
+    assert index.delete.call_args.kwargs["namespace"] == "ns"
+
+
+class FakeS3:
+    def __init__(self, objects: dict):
+        self.objects = objects
+
+    def get_paginator(self, operation: str):
+        assert operation == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket: str, Prefix: str):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        for start in range(0, len(keys), 2):
+            yield {"Contents": [{"Key": key, "ETag": f'"{key}"'} for key in keys[start : start + 2]]}  # noqa: E203
+
+    def get_object(self, Bucket: str, Key: str) -> dict:
+        return {"Body": io.BytesIO(self.objects[Key].encode())}
+
+
+class SlowEmbedder(HashEmbedder):
+    def __init__(self):
+        super().__init__(8)
+        self.active = self.max_active = 0
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self._lock:
+            self.active -= 1
+        return super().embed(texts)
+
+
+def test_backfill_s3_bounded_concurrency():
+    objects = {f"docs/{i}.txt": words(10, start=i) for i in range(12)}
+    store = InMemoryVectorStore()
+    embedder = SlowEmbedder()
+    stats = Backfill(S3ObjectSource("bucket", "docs/", client=FakeS3(objects)), embedder, store, concurrency=3).run()
+    assert (stats.objects, stats.chunks) == (12, 12)
+    assert 1 < embedder.max_active <= 3
+    assert all(record.metadata[SOURCE_URI_FIELD].startswith("s3://bucket/docs/") for record in store.records.values())
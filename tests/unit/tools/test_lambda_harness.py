@@ -0,0 +1,68 @@
+from unittest import mock
+import json
+import urllib.request
+import pytest
+from cdk.functions import web_search
+from tools import lambda_harness
+from tests.unit.mock_data import bedrock_event
+
+
+def echo_handler(event: dict, context) -> dict:
+    return web_search.BedrockResponseEvent.response_event_from_event(event, event["inputText"]).model_dump()
+
+
+@pytest.fixture
+def mock_jina():
+    server = lambda_harness.start_in_thread(lambda_harness.MockJinaServer(port=0, latency=0.0))
+    with mock.patch.dict("os.environ", {**server.environment, "JINA_API_KEY": "jina_test_key"}):
+        yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def echo_server():
+    server = lambda_harness.start_in_thread(lambda_harness.ActionGroupServer(echo_handler, port=0))
+    yield lambda_harness.server_url(server)
+    server.shutdown()
+
+
+def test_action_group_server_invoke(echo_server):
+    result = lambda_harness.invoke_url(echo_server, bedrock_event)
+    response = web_search.BedrockResponseEvent.model_validate(result)
+    assert response.get_response_body() == bedrock_event["inputText"]
+
+
+def test_action_group_server_rejects_invalid_event(echo_server):
+    request = urllib.request.Request(
+        echo_server + lambda_harness.INVOKE_PATH, data=json.dumps({"function": "search"}).encode(), method="POST"
+    )
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(request)
+    assert e.value.code == 400
+
+
+def test_web_search_against_mock_jina(mock_jina):
+    event = lambda_harness.make_event("search", {"query": "weather in omaha"})
+    result = web_search.lambda_handler(event, lambda_harness.LambdaContext())
+    data = json.loads(web_search.BedrockResponseEvent.model_validate(result).get_response_body())
+    assert len(data) == mock_jina.results
+    assert mock_jina.requests == 1
+
+
+def test_run_benchmark(mock_jina):
+    event = lambda_harness.make_event("search", {"query": "weather in omaha"})
+    result = lambda_harness.run_benchmark(
+        "cdk.functions.web_search.lambda_handler", event, invocations=10, concurrency=2, cold_runs=0, memory_samples=2
+    )
+    assert result.errors == 0
+    assert result.throughput_rps > 0
+    assert result.latency_ms["p50"] <= result.latency_ms["max"]
+    assert result.memory_per_invocation_kb > 0
+    assert result.cold_init_ms is None
+
+
+def test_percentiles():
+    assert lambda_harness.percentiles([]) == {}
+    result = lambda_harness.percentiles([float(i) for i in range(1, 101)])
+    assert result["p50"] == 50.0
+    assert result["max"] == 100.0
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import time
+from base64 import b64encode
+from unittest import mock
+import itsdangerous
+import pytest
+from tools import lwa_emulator
+
+CHUNKS = 5
+CHUNK_INTERVAL = 0.25  # seconds between the Bedrock chunks
+MAX_FLUSH_LAG = 0.2  # seconds from a chunk to its update reaching the client (gradio polls its queue every 50ms)
+SESSION_SECRET = "session-secret"
+
+
+def test_prelude_round_trip_split_anywhere():
+    framed = lwa_emulator.encode_prelude(
+        200, [("Content-Type", "text/event-stream"), ("Set-Cookie", "a=1"), ("Set-Cookie", "b=2"), ("Connection", "x")]
+    )
+    stream = framed + b"data: 1\n\n" + b"data: 2\n\n"
+    for split in (1, 7, len(framed) - 3, len(framed) + 2):
+        prelude, body = lwa_emulator.decode_stream([stream[:split], stream[split:]])
+        assert prelude == {
+            "statusCode": 200,
+            "headers": {"content-type": "text/event-stream"},
+            "cookies": ["a=1", "b=2"],
+        }
+        assert b"".join(body) == b"data: 1\n\ndata: 2\n\n"
+
+
+def test_flush_gaps():
+    messages = [(0.0, {"msg": "process_starts"}), (0.1, {"msg": "process_generating"}), (0.4, {"msg": "other"})]
+    messages.append((0.6, {"msg": "process_generating"}))
+    assert lwa_emulator.flush_gaps(messages) == pytest.approx([0.5])
+
+
+@pytest.fixture(scope="module")
+def app():
+    """The real app with its middlewares, Okta settings from the environment and signed cookie sessions"""
+    env = dict(
+        OKTA_OAUTH2_ISSUER="https://example.okta.com/oauth2/default",
+        OKTA_OAUTH2_CLIENT_ID="client-id",
+        OKTA_OAUTH2_CLIENT_SECRET="client-secret",
+        SESSION_SECRET=SESSION_SECRET,
+        OKTA_SECRET_ARN="",
+        SESSION_TABLE="",
+        SESSION_DB="",
+        SESSION_STORE="",
+    )
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)  # gradio creates the locks of its queue when the app is built, asyncio.run unsets it
+    with mock.patch.dict("os.environ", env):
+        from gradio_app import helpers, oauth_okta
+
+        oauth_okta.okta_settings.cache_clear()
+        # the KB tab lists the bucket and ingestion jobs when the app is built
+        with mock.patch.multiple(helpers.BOTO, _s3_client=mock.MagicMock(), _br_client=mock.MagicMock()):
+            from gradio_app import app
+
+            yield app.app
+        oauth_okta.okta_settings.cache_clear()
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def stream_prompt(app, invoke_mode: str):
+    """(when each chunk was produced, the messages as the client received them) of a prompt through the emulator"""
+    produced = []
+
+    def completion():
+        for i in range(CHUNKS):
+            time.sleep(CHUNK_INTERVAL)
+            produced.append(time.perf_counter())
+            yield {"chunk": {"bytes": f"token {i} ".encode("utf-8")}}
+
+    from gradio_app import helpers
+
+    client = mock.Mock()
+    client.invoke_agent.side_effect = lambda **kwargs: {"completion": completion()}
+    session = b64encode(json.dumps({"user": {"name": "Test"}}).encode("utf-8"))
+    cookie = itsdangerous.TimestampSigner(SESSION_SECRET).sign(session).decode("utf-8")
+    with mock.patch.object(helpers.BOTO, "_brrt_client", client):
+        with lwa_emulator.Emulator(app, invoke_mode=invoke_mode) as emulator:
+            messages = lwa_emulator.stream_event(
+                f"{emulator.url}/gradio", ["Hello", [], False], headers={"Cookie": f"session={cookie}"}
+            )
+    updates = [at for at, message in messages if message["msg"] == "process_generating"]
+    assert messages[-1][1]["msg"] == "process_completed" and messages[-1][1]["success"]
+    assert len(updates) == CHUNKS + 1  # the prompt, then one per chunk
+    return produced, updates
+
+
+def test_chunks_flush_as_bedrock_produces_them(app):
+    produced, updates = stream_prompt(app, "response_stream")
+    lags = [arrived - made for made, arrived in zip(produced, updates[1:])]
+    assert all(0 <= lag < MAX_FLUSH_LAG for lag in lags), lags
+    assert min(lwa_emulator.flush_gaps([(at, {"msg": "process_generating"}) for at in updates[1:]])) > 0.1
+
+
+def test_buffered_adapter_is_detected(app):
+    """The check above fails when a layer holds the response back, as the adapter in buffered mode does"""
+    produced, updates = stream_prompt(app, "buffered")
+    assert updates[1] - produced[0] > (CHUNKS - 1) * CHUNK_INTERVAL * 0.8
+    assert max(updates) - min(updates) < 0.1
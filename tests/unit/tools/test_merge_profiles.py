@@ -0,0 +1,27 @@
+from tools import merge_profiles
+
+PROFILE_1 = ["run (threading.py:1);invoke_agent (app.py:20);append_event_chunk (helpers.py:30) 3", "garbage"]
+PROFILE_2 = [
+    "run (threading.py:1);invoke_agent (app.py:20);append_event_chunk (helpers.py:30) 2",
+    "run (threading.py:1);invoke_agent (app.py:20) 5",
+    "run (threading.py:1);idle (threading.py:9) 7",
+]
+
+
+def test_merge_and_trim_to_root():
+    merged = merge_profiles.merge([PROFILE_1, PROFILE_2], root="invoke_agent")
+    assert merged == {"invoke_agent (app.py:20);append_event_chunk (helpers.py:30)": 5, "invoke_agent (app.py:20)": 5}
+    assert sum(merge_profiles.merge([PROFILE_1, PROFILE_2]).values()) == 17
+
+
+def test_hot_spots():
+    spots = merge_profiles.hot_spots(merge_profiles.merge([PROFILE_1, PROFILE_2]), top=2)
+    assert spots[0] == dict(function="idle (threading.py:9)", self=7, self_pct=41.2, total_pct=41.2)
+    assert spots[1]["function"] == "append_event_chunk (helpers.py:30)" and spots[1]["total_pct"] == 29.4
+
+
+def test_read_profiles_from_directory(tmp_path):
+    (tmp_path / "invoke_agent").mkdir()
+    (tmp_path / "invoke_agent" / "1-req.collapsed").write_text("\n".join(PROFILE_2))
+    (tmp_path / "invoke_agent" / "notes.txt").write_text("not a profile")
+    assert list(merge_profiles.read_profiles([str(tmp_path)])) == [PROFILE_2]
@@ -0,0 +1,17 @@
+import asyncio
+from gradio_app import middleware
+from tools import middleware_bench
+
+
+def test_asgi_middleware_sends_each_token_before_the_next_is_made():
+    yielded_at, sent_at = asyncio.run(
+        middleware_bench.stream_times(middleware.LambdaRequestLogger, middleware.XForwardedHostMiddleware, tokens=20)
+    )
+    assert len(sent_at) == 20
+    assert all(sent <= next_yielded for sent, next_yielded in zip(sent_at, yielded_at[1:]))
+
+
+def test_run_benchmark():
+    results = middleware_bench.run_benchmark(tokens=10)
+    assert [result.name for result in results] == list(middleware_bench.MIDDLEWARES)
+    assert all(result.tokens == 10 and result.latency_us["p50"] >= 0 for result in results)
@@ -0,0 +1,14 @@
+import pytest
+from tools import response_bench
+from tests.unit.mock_data import bedrock_event
+
+
+def test_paths_build_the_same_response():
+    assert response_bench.fast_path(bedrock_event) == response_bench.round_trip(bedrock_event)
+
+
+def test_run_benchmark():
+    result = response_bench.run_benchmark(bedrock_event, number=5, repeat=1)
+    assert result.number == 5
+    assert result.round_trip_us > 0 and result.fast_path_us > 0
+    assert result.speedup == pytest.approx(result.round_trip_us / result.fast_path_us)
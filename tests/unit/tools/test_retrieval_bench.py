@@ -0,0 +1,51 @@
+import json
+import pytest
+from tools import retrieval_bench
+from tools.vectors import HashEmbedder
+
+TOPICS = {
+    "contracts/acme.md": "termination notice period thirty days written notice acme supplier",
+    "contracts/globex.md": "payment terms invoice net sixty days late fee globex customer",
+    "policies/security.txt": "password rotation encryption at rest access review quarterly",
+}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    for key, topic in TOPICS.items():
+        path = tmp_path / "corpus" / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        filler = " ".join(f"filler{i}" for i in range(200))
+        path.write_text(f"{filler} {topic} {filler}")
+    queries = [
+        {"query": "what is the termination notice period", "relevant": ["contracts/acme.md"]},
+        {"query": "invoice payment terms and late fee", "relevant": ["contracts/globex.md"]},
+        {"query": "how often is access review", "relevant": ["policies/security.txt"]},
+    ]
+    (tmp_path / "queries.jsonl").write_text("\n".join(json.dumps(query) for query in queries))
+    return tmp_path
+
+
+def test_strategy_parse():
+    assert str(retrieval_bench.Strategy.parse("FIXED_SIZE:300:10")) == "FIXED_SIZE:300:10"
+    assert retrieval_bench.Strategy.parse("NONE").name == "NONE"
+    with pytest.raises(ValueError):
+        retrieval_bench.Strategy.parse("SEMANTIC")
+
+
+def test_run_benchmark(corpus):
+    results = retrieval_bench.run_benchmark(
+        retrieval_bench.load_corpus(str(corpus / "corpus")),
+        retrieval_bench.load_queries(str(corpus / "queries.jsonl")),
+        HashEmbedder(512),
+        [retrieval_bench.Strategy.parse(spec) for spec in ["FIXED_SIZE:50:20", "NONE"]],
+        top_k=1,
+    )
+    small, whole = results
+    assert (small.documents, whole.documents, whole.chunks) == (3, 3, 3)
+    assert small.chunks > whole.chunks
+    assert small.text_kb > whole.text_kb  # overlap stores text more than once
+    assert small.recall_at_k == small.mrr == 1.0  # the small chunk holding the topic stands out from the filler
+    assert whole.recall_at_k <= small.recall_at_k
+    assert set(small.query_ms) == {"mean", "p50", "p90", "p99", "max"}
+    assert "recall@1" in retrieval_bench.as_table(results, top_k=1)
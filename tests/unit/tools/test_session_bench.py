@@ -0,0 +1,13 @@
+from tools import session_bench
+
+
+def test_run_benchmark():
+    results = session_bench.run_benchmark(requests=5)
+    assert [result.name for result in results] == [
+        "SessionMiddleware",
+        "SignedCookieSessionMiddleware",
+        "ServerSideSessionMiddleware",
+    ]
+    assert all(result.requests == 5 and result.per_request_us > 0 for result in results)
+    assert results[0].cookie_bytes == results[1].cookie_bytes  # the same cookie
+    assert results[2].cookie_bytes < results[1].cookie_bytes  # only the session id
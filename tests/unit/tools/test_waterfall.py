@@ -0,0 +1,43 @@
+import json
+from datetime import datetime, timedelta, timezone
+from tools import waterfall
+
+START = datetime(2024, 10, 19, 10, 0, 0, tzinfo=timezone.utc)
+
+
+def record(end_s: float, span: str, duration_ms: float, correlation_id="abc", **keys) -> dict:
+    timestamp = (START + timedelta(seconds=end_s)).strftime(waterfall.TIMESTAMP_FORMAT)
+    keys = dict(span=span, duration_ms=duration_ms, correlation_id=correlation_id, **keys)
+    return dict(level="INFO", message=f"{span} took", timestamp=timestamp, service="svc", **keys)
+
+
+RECORDS = [
+    record(10, "invoke_agent", 10000, marks=[{"offset_ms": 1000, "event": "orchestrationTrace.rationale"}]),
+    record(4, "web_search.search", 2000),
+    record(5, "web_search.retrieve", 2000),  # overlaps the search by a second
+    record(6, "web_search.search", 1000, correlation_id="other"),
+    {"level": "INFO", "message": "not a span", "correlation_id": "abc"},
+]
+
+
+def test_group_and_attribute_spans():
+    groups = waterfall.group_spans(iter(RECORDS))
+    assert list(groups) == ["abc", "other"]
+    assert [span.name for span in groups["abc"]] == ["invoke_agent", "web_search.search", "web_search.retrieve"]
+    assert groups["abc"][1].start_ms - groups["abc"][0].start_ms == 2000
+    assert waterfall.attribute(groups["abc"]) == {
+        "web_search.search": 2000,
+        "web_search.retrieve": 2000,
+        "agent and streaming": 7000,
+        "total": 10000,
+    }
+    text = waterfall.render("abc", groups["abc"])
+    assert "orchestrationTrace.rationale" in text and "agent and streaming 7000ms" in text
+
+
+def test_read_records_from_filter_log_events_and_json_lines(tmp_path):
+    events = {"events": [{"message": json.dumps(RECORDS[1])}, {"message": "START RequestId: 1"}]}
+    (tmp_path / "tool.json").write_text(json.dumps(events))
+    (tmp_path / "app.jsonl").write_text(json.dumps(RECORDS[0]) + "\nplain print\n")
+    assert list(waterfall.read_records(str(tmp_path / "tool.json"))) == [RECORDS[1]]
+    assert list(waterfall.read_records(str(tmp_path / "app.jsonl"))) == [RECORDS[0]]
@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+"""
+Memory and architecture tuning harness for the GradioApp Lambda.
+
+Lambda gives a function CPU in proportion to its memory: one vCPU at 1769 MB, up to 6 at 10240 MB. The app's request
+handling is single threaded python, so it gets faster with memory up to about one vCPU and then only gets more
+expensive. The harness runs the CPU bound parts of the app on a synthetic or replayed workload:
+
+* `chat`: parsing an InvokeAgent response stream (chunks and traces) into the chatbot history
+* `render`: serializing the chatbot and events that the app streams to the browser after every event
+* `kb_tables`: building the pandas ingestion jobs table and the documents HTML table of the KB tab
+
+It measures their CPU time and peak memory locally, then models the duration and cost of every memory size and
+architecture. With `--docker` each memory size is instead run in the app image limited to the same CPU share
+(`--cpus`) and memory, per architecture (`--platform`, arm64 is only meaningful on an arm64 host, emulated otherwise).
+Time spent waiting on Bedrock (`--io-ms`) is billed the same at any memory size.
+
+    python -m tools.app_tuning
+    python -m tools.app_tuning --replay events.json --io-ms 8000 --json
+    python -m tools.app_tuning --docker --image gradio_app --architecture x86_64 --architecture arm64
+
+The replay file is the `Events` JSON of the app's Debug accordion (one response), or JSON lines of them.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+MEMORY_SIZES = [1024, 1769, 2048, 3008, 4096, 6144, 8192, 10240]
+ARCHITECTURES = ["x86_64", "arm64"]
+ONE_VCPU_MB = 1769
+MAX_VCPUS = 6
+# us-east-1 Lambda prices, USD
+PRICE_PER_GB_SECOND = {"x86_64": 0.0000166667, "arm64": 0.0000133334}
+PRICE_PER_REQUEST = 0.20 / 1_000_000
+MEMORY_HEADROOM = 1.25  # memory sizes below the peak RSS times this are considered too small
+
+
+def vcpus(memory_mb: int) -> float:
+    return min(MAX_VCPUS, memory_mb / ONE_VCPU_MB)
+
+
+def host_architecture() -> str:
+    return "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "x86_64"
+
+
+def synthetic_events(tool_calls: int = 4, answer_chunks: int = 20) -> List[dict]:
+    """An InvokeAgent response with traces for kb lookups, tool calls and generated code, then the answer"""
+    ids = dict(agentId="AGENT", agentAliasId="ALIAS", sessionId="session")
+    inference = dict(temperature=0.0, topP=1.0, topK=250, maximumLength=2048, stopSequences=["</invoke>"])
+    prompt = "You are a helpful agent. " * 400 + "<code>import pandas as pd\nprint(pd.__version__)</code>"
+    events = []
+    for call in range(tool_calls):
+        trace_id = f"trace-{call}"
+        orchestration = [
+            dict(
+                modelInvocationInput=dict(
+                    traceId=trace_id, text=prompt, type="ORCHESTRATION", inferenceConfiguration=inference
+                )
+            ),
+            dict(rationale=dict(traceId=trace_id, text=f"To answer the question I need to look up step {call}. " * 5)),
+            dict(
+                invocationInput=dict(
+                    traceId=trace_id,
+                    invocationType="KNOWLEDGE_BASE",
+                    knowledgeBaseLookupInput=dict(text=f"contract notice period {call}", knowledgeBaseId="KB"),
+                )
+            ),
+            dict(
+                invocationInput=dict(
+                    traceId=trace_id,
+                    invocationType="ACTION_GROUP",
+                    actionGroupInvocationInput=dict(
+                        actionGroupName="web_search",
+                        function="search",
+                        parameters=[dict(name="query", type="string", value=f"notice period law {call}")],
+                    ),
+                )
+            ),
+            dict(
+                observation=dict(
+                    traceId=trace_id,
+                    type="KNOWLEDGE_BASE",
+                    knowledgeBaseLookupOutput=dict(
+                        retrievedReferences=[
+                            dict(
+                                content=dict(text="The notice period is thirty days. " * 40),
+                                location=dict(type="S3", s3Location=dict(uri=f"s3://kb/doc{ref}.md")),
+                            )
+                            for ref in range(5)
+                        ]
+                    ),
+                )
+            ),
+        ]
+        events.extend(dict(trace=dict(trace=dict(orchestrationTrace=trace), **ids)) for trace in orchestration)
+    final = dict(observation=dict(traceId="final", type="FINISH", finalResponse=dict(text="The answer. " * 50)))
+    events.append(dict(trace=dict(trace=dict(orchestrationTrace=final), **ids)))
+    events.extend(
+        dict(chunk=dict(bytes=f"part {chunk} of the answer. ".encode() * 10)) for chunk in range(answer_chunks)
+    )
+    return events
+
+
+def load_events(path: str) -> List[List[dict]]:
+    """Responses from the Debug accordion `Events` JSON, a single response or JSON lines of them"""
+    with open(path) as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return [json.loads(text)]
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def chat(events: List[dict]) -> list:
+    from gradio_app import helpers
+
+    chatbot = []
+    for i, event_chunk in enumerate(events):
+        helpers.append_event_chunk(chatbot, i, event_chunk)
+    return chatbot
+
+
+def render(events: List[dict]) -> None:
+    """The app yields the whole chatbot and events list after every event, gradio serializes them each time"""
+    import gradio as gr
+    from gradio_app import helpers
+
+    component = gr.Chatbot(type="messages")
+    chatbot = []
+    for i, event_chunk in enumerate(events):
+        helpers.append_event_chunk(chatbot, i, event_chunk)
+        component.postprocess(chatbot).model_dump_json()
+        json.dumps(events[: i + 1], default=str)
+
+
+class FakeBedrockAgent:
+    def __init__(self, jobs: int):
+        now = datetime.now(timezone.utc)
+        stats = dict(numberOfDocumentsScanned=10, numberOfNewDocumentsIndexed=1, numberOfDocumentsFailed=0)
+        self.jobs = [
+            dict(
+                ingestionJobId=f"JOB{i}",
+                knowledgeBaseId="KB",
+                dataSourceId="DS",
+                status="COMPLETE",
+                startedAt=now - timedelta(hours=i, minutes=1),
+                updatedAt=now - timedelta(hours=i),
+                statistics=stats,
+            )
+            for i in range(jobs)
+        ]
+
+    def get_paginator(self, operation: str):
+        return mock.Mock(paginate=lambda **kwargs: [{"ingestionJobSummaries": self.jobs}])
+
+
+class FakeS3:
+    def __init__(self, documents: int):
+        now = datetime.now(timezone.utc)
+        self.contents = [dict(Key=f"contracts/doc{i}.md", LastModified=now, Size=1024 * i) for i in range(documents)]
+
+    def list_objects_v2(self, Bucket: str):
+        return {"Contents": self.contents}
+
+    def generate_presigned_url(self, method: str, Params: dict, ExpiresIn: int):
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?X-Amz-Signature={'0' * 64}"
+
+
+def kb_tables(jobs: int = 25, documents: int = 200) -> None:
+    from gradio_app import helpers, kb
+
+    with mock.patch.multiple(helpers.Boto, _br_client=FakeBedrockAgent(jobs), _s3_client=FakeS3(documents)):
+        kb.get_kb_ingestion_jobs()
+        kb.get_kb_docs()
+
+
+@dataclass
+class WorkloadResult:
+    name: str
+    cpu_ms: float  # median CPU time of a run, at one full (host) vCPU
+    wall_ms: float
+
+
+def measure(responses: List[List[dict]], repeats: int = 5) -> Dict[str, WorkloadResult]:
+    """Time each workload after a warm up run (imports, first use caches), like a warm Lambda environment"""
+    workloads: Dict[str, Callable[[], None]] = {
+        "chat": lambda: [chat(events) for events in responses],
+        "render": lambda: [render(events) for events in responses],
+        "kb_tables": kb_tables,
+    }
+    results = {}
+    for name, workload in workloads.items():
+        workload()
+        cpu, wall = [], []
+        for _ in range(repeats):
+            cpu_start, wall_start = time.process_time(), time.perf_counter()
+            workload()
+            cpu.append((time.process_time() - cpu_start) * 1000)
+            wall.append((time.perf_counter() - wall_start) * 1000)
+        results[name] = WorkloadResult(name, round(statistics.median(cpu), 2), round(statistics.median(wall), 2))
+    return results
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on linux
+
+
+@dataclass
+class TuningPoint:
+    architecture: str
+    memory_mb: int
+    vcpus: float
+    duration_ms: float  # per request: CPU bound work at this CPU share plus the io wait
+    cost_per_1k: float  # USD per 1000 requests
+    fits: bool  # memory size is above the peak RSS with headroom
+    measured: bool = False  # duration measured in a CPU limited container rather than modeled
+
+
+def cost_per_1k(architecture: str, memory_mb: int, duration_ms: float) -> float:
+    gb_seconds = memory_mb / 1024 * duration_ms / 1000
+    return round(1000 * (gb_seconds * PRICE_PER_GB_SECOND[architecture] + PRICE_PER_REQUEST), 6)
+
+
+def model_curve(
+    cpu_ms: float,
+    rss_mb: float,
+    io_ms: float = 0.0,
+    memory_sizes: List[int] = MEMORY_SIZES,
+    architectures: List[str] = ARCHITECTURES,
+    relative_speed: Optional[Dict[str, float]] = None,
+) -> List[TuningPoint]:
+    """
+    param cpu_ms: float: CPU time of a request at one full vCPU of the host
+    param relative_speed: Dict[str, float]: per architecture speed relative to the host, ie. {"arm64": 0.9}
+    """
+    relative_speed = relative_speed or {}
+    points = []
+    for architecture in architectures:
+        for memory_mb in memory_sizes:
+            # single threaded: a fraction of a vCPU slows the work down, more than one doesnt speed it up
+            cpu_share = min(1.0, vcpus(memory_mb))
+            duration_ms = cpu_ms / cpu_share / relative_speed.get(architecture, 1.0) + io_ms
+            points.append(
+                TuningPoint(
+                    architecture=architecture,
+                    memory_mb=memory_mb,
+                    vcpus=round(vcpus(memory_mb), 2),
+                    duration_ms=round(duration_ms, 1),
+                    cost_per_1k=cost_per_1k(architecture, memory_mb, duration_ms),
+                    fits=memory_mb >= rss_mb * MEMORY_HEADROOM,
+                )
+            )
+    return points
+
+
+def docker_curve(
+    image: str,
+    io_ms: float = 0.0,
+    memory_sizes: List[int] = MEMORY_SIZES,
+    architectures: List[str] = ARCHITECTURES,
+    replay: Optional[str] = None,
+    repeats: int = 5,
+) -> List[TuningPoint]:
+    """Run `measure` in the app image with the CPU share and memory of each Lambda memory size"""
+    points = []
+    for architecture in architectures:
+        for memory_mb in memory_sizes:
+            command = [
+                "docker", "run", "--rm",
+                "--platform", "linux/arm64" if architecture == "arm64" else "linux/amd64",
+                "--cpus", str(round(vcpus(memory_mb), 2)),
+                "--memory", f"{memory_mb}m",
+                "-v", f"{ROOT_DIR}:/src", "-w", "/src", "-e", "PYTHONPATH=/src",
+                "--entrypoint", "python3", image,
+                "-m", "tools.app_tuning", "measure", "--repeats", str(repeats),
+            ]  # fmt: skip
+            if replay:
+                command += ["--replay", os.path.relpath(replay, ROOT_DIR)]
+            proc = subprocess.run(command, capture_output=True, text=True)
+            if proc.returncode != 0:
+                # most likely out of memory
+                points.append(TuningPoint(architecture, memory_mb, round(vcpus(memory_mb), 2), 0.0, 0.0, False, True))
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            duration_ms = sum(w["wall_ms"] for w in result["workloads"].values()) + io_ms
+            points.append(
+                TuningPoint(
+                    architecture=architecture,
+                    memory_mb=memory_mb,
+                    vcpus=round(vcpus(memory_mb), 2),
+                    duration_ms=round(duration_ms, 1),
+                    cost_per_1k=cost_per_1k(architecture, memory_mb, duration_ms),
+                    fits=memory_mb >= result["rss_mb"] * MEMORY_HEADROOM,
+                    measured=True,
+                )
+            )
+    return points
+
+
+def recommend(points: List[TuningPoint], latency_tolerance: float = 0.1) -> Optional[TuningPoint]:
+    """The cheapest configuration within `latency_tolerance` of the fastest one"""
+    candidates = [point for point in points if point.fits]
+    if not candidates:
+        return None
+    fastest = min(point.duration_ms for point in candidates)
+    within = [point for point in candidates if point.duration_ms <= fastest * (1 + latency_tolerance)]
+    return min(within, key=lambda point: (point.cost_per_1k, point.duration_ms))
+
+
+def as_table(points: List[TuningPoint], best: Optional[TuningPoint]) -> str:
+    lines = [f"{'arch':<8}{'memory':>8}{'vCPU':>6}{'ms':>10}{'$/1k req':>12}  note"]
+    for p in points:
+        note = "too small" if not p.fits else ("<- recommended" if p == best else "")
+        lines.append(
+            f"{p.architecture:<8}{p.memory_mb:>8}{p.vcpus:>6}{p.duration_ms:>10}{p.cost_per_1k:>12.6f}  {note}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory and architecture tuning for the GradioApp Lambda")
+    parser.add_argument("mode", nargs="?", choices=["curve", "measure"], default="curve")
+    parser.add_argument("--replay", help="Debug `Events` JSON of a response, or JSON lines of them")
+    parser.add_argument("--tool-calls", type=int, default=4, help="tool calls of the synthetic response")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--io-ms", type=float, default=0.0, help="time a request waits on Bedrock, billed as well")
+    parser.add_argument("-m", "--memory", type=int, action="append", help=f"default: {MEMORY_SIZES}")
+    parser.add_argument("-a", "--architecture", choices=ARCHITECTURES, action="append")
+    parser.add_argument(
+        "--relative-speed",
+        action="append",
+        default=[],
+        metavar="ARCH=FACTOR",
+        help="speed of an architecture relative to this host when modeling, ie. arm64=0.9",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.1, help="latency within this fraction of the fastest")
+    parser.add_argument("--docker", action="store_true", help="measure in CPU and memory limited containers")
+    parser.add_argument("--image", default="gradio_app", help="app image for --docker, see `make docker-shell`")
+    parser.add_argument("--json", action="store_true", help="print the result as json")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")  # the app creates boto3 sessions on import
+    os.environ.setdefault("POWERTOOLS_LOG_LEVEL", "WARNING")  # measure the work, not the app's info logging
+    responses = load_events(args.replay) if args.replay else [synthetic_events(args.tool_calls)]
+    if args.mode == "measure":
+        workloads = measure(responses, args.repeats)
+        result = {"workloads": {name: asdict(w) for name, w in workloads.items()}, "rss_mb": round(peak_rss_mb(), 1)}
+        print(json.dumps(result))  # parsed by docker_curve()
+        raise SystemExit(0)
+
+    memory_sizes = args.memory or MEMORY_SIZES
+    architectures = args.architecture or ARCHITECTURES
+    if args.docker:
+        points = docker_curve(args.image, args.io_ms, memory_sizes, architectures, args.replay, args.repeats)
+        workloads = {}
+    else:
+        workloads = measure(responses, args.repeats)
+        relative_speed = {arch: float(factor) for arch, factor in (s.split("=") for s in args.relative_speed)}
+        if host_architecture() not in relative_speed:
+            relative_speed[host_architecture()] = 1.0
+        points = model_curve(
+            sum(w.cpu_ms for w in workloads.values()),
+            peak_rss_mb(),
+            args.io_ms,
+            memory_sizes,
+            architectures,
+            relative_speed,
+        )
+    best = recommend(points, args.tolerance)
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "workloads": {name: asdict(w) for name, w in workloads.items()},
+                    "rss_mb": round(peak_rss_mb(), 1),
+                    "curve": [asdict(p) for p in points],
+                    "recommended": asdict(best) if best else None,
+                },
+                indent=2,
+            )
+        )
+    else:
+        for w in workloads.values():
+            print(f"{w.name:<10} cpu {w.cpu_ms:>8} ms  wall {w.wall_ms:>8} ms")
+        if workloads:
+            print(f"peak RSS {round(peak_rss_mb())} MB, host {host_architecture()}, relative speed {relative_speed}\n")
+        print(as_table(points, best))
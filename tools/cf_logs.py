@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+Follow the CloudFront access logs of the app and report rolling latency percentiles, status codes and cache hit ratio.
+
+Only new log objects are fetched: the listing starts after a high-water mark (S3 `StartAfter`), re-listing the
+previous hour as CloudFront can deliver a file for an hour after later ones. Each object is decompressed as it is
+streamed and its W3C lines are parsed into columnar `LogBatch`es. The log source is pluggable, a local directory of
+downloaded `.gz` logs works like the bucket.
+
+    python -m tools.cf_logs s3://<CloudFrontLogBucket output of BedrockAppStack>
+    python -m tools.cf_logs ./logs --once --json
+"""
+import argparse
+import calendar
+import gzip
+import io
+import json
+import os
+import re
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from dataclasses import asdict, dataclass, field
+from typing import IO, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+import boto3
+
+from tools.lambda_harness import percentiles
+
+# CloudFront log file keys, ie. `prefix/E2ABCDEF.2024-10-19-18.a1b2c3d4.gz`, sort by distribution and hour
+LOG_KEY = re.compile(r"^(?P<head>.*\.)(?P<hour>\d{4}-\d{2}-\d{2}-\d{2})\.[^./]+\.gz$")
+FLOAT_COLUMNS = ("time-taken", "time-to-first-byte")
+INT_COLUMNS = ("sc-status", "sc-bytes")
+HIT_RESULT_TYPES = ("Hit", "RefreshHit")
+BATCH_SIZE = 5000  # rows per LogBatch
+
+
+class LogSource(ABC):
+    """Where the log objects are read from"""
+
+    @abstractmethod
+    def list(self, prefix: str, start_after: str = "") -> Iterator[str]:
+        """Keys below `prefix` that sort after `start_after`, in key order"""
+
+    @abstractmethod
+    def open(self, key: str) -> IO[bytes]:
+        """The (gzipped) content of the object"""
+
+
+class S3LogSource(LogSource):
+    def __init__(self, bucket: str, client=None):
+        self.bucket = bucket
+        self.client = client or boto3.client("s3")
+
+    def list(self, prefix: str, start_after: str = "") -> Iterator[str]:
+        params = dict(Bucket=self.bucket, Prefix=prefix)
+        if start_after:
+            params["StartAfter"] = start_after
+        for page in self.client.get_paginator("list_objects_v2").paginate(**params):
+            for item in page.get("Contents", []):
+                yield item["Key"]
+
+    def open(self, key: str) -> IO[bytes]:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]  # streamed, not read into memory
+
+
+class LocalLogSource(LogSource):
+    """A directory standing in for the bucket, keys are the `/` separated paths below it"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def list(self, prefix: str, start_after: str = "") -> Iterator[str]:
+        keys = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                key = os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, "/")
+                if key.startswith(prefix) and key > start_after:
+                    keys.append(key)
+        yield from sorted(keys)
+
+    def open(self, key: str) -> IO[bytes]:
+        return open(os.path.join(self.directory, *key.split("/")), "rb")
+
+
+def log_source(location: str) -> Tuple[LogSource, str]:
+    """The source and key prefix of `s3://bucket/prefix` or a local directory"""
+    if location.startswith("s3://"):
+        bucket, _, prefix = location[len("s3://") :].partition("/")  # noqa: E203
+        return S3LogSource(bucket), prefix
+    return LocalLogSource(location), ""
+
+
+@dataclass
+class LogBatch:
+    """Parsed log lines by column, `time-taken` and `time-to-first-byte` are floats, status and bytes ints"""
+
+    columns: Dict[str, list]
+    key: str = ""
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), []))
+
+
+def _convert(columns: Dict[str, list]) -> Dict[str, list]:
+    for name, cast in [(name, float) for name in FLOAT_COLUMNS] + [(name, int) for name in INT_COLUMNS]:
+        if name in columns:
+            columns[name] = [None if value == "-" else cast(value) for value in columns[name]]
+    return columns
+
+
+def parse_log(stream: IO[bytes], key: str = "", batch_size: int = BATCH_SIZE) -> Iterator[LogBatch]:
+    """Stream decompress and parse a W3C (CloudFront) access log into batches of columns"""
+    fields: List[str] = []
+    rows: List[List[str]] = []
+    with gzip.GzipFile(fileobj=stream) as unzipped:
+        for line in io.TextIOWrapper(unzipped, encoding="utf-8", errors="replace"):
+            if line.startswith("#"):
+                if line.startswith("#Fields:"):
+                    fields = line[len("#Fields:") :].split()  # noqa: E203
+                continue
+            if line := line.rstrip("\n"):
+                rows.append(line.split("\t"))
+            if len(rows) >= batch_size:
+                yield LogBatch(_convert(dict(zip(fields, map(list, zip(*rows))))), key)
+                rows = []
+    if rows:
+        yield LogBatch(_convert(dict(zip(fields, map(list, zip(*rows))))), key)
+
+
+class LogTailer:
+    """Fetch only the log objects that appeared since the last poll"""
+
+    def __init__(self, source: LogSource, prefix: str = "", backfill: int = 10):
+        """
+        param prefix: str: key prefix of the logs in the source
+        param backfill: int: number of existing objects read by the first poll
+        """
+        self.source = source
+        self.prefix = prefix
+        self.backfill = backfill
+        self.high_water_mark: Optional[str] = None
+        self._seen: Set[str] = set()  # keys at or after the re-listed hour
+
+    def _start_after(self) -> str:
+        """List from the hour before the high-water mark, late files of that hour sort before it"""
+        if not (match := LOG_KEY.match(self.high_water_mark)):
+            return self.high_water_mark
+        hour = time.strptime(match["hour"], "%Y-%m-%d-%H")
+        previous = time.strftime("%Y-%m-%d-%H", time.gmtime(calendar.timegm(hour) - 3600))
+        return f"{match['head']}{previous}"
+
+    def new_keys(self) -> List[str]:
+        if self.high_water_mark is None:
+            keys = list(self.source.list(self.prefix))  # once, to find the latest objects
+            self.high_water_mark = keys[-1] if keys else ""
+            start_after = self._start_after()
+            self._seen = {key for key in keys if key > start_after}  # skipped, not re-read by the next poll
+            return keys[-self.backfill :] if self.backfill else []  # noqa: E203
+        start_after = self._start_after()
+        keys = [key for key in self.source.list(self.prefix, start_after) if key not in self._seen]
+        self._seen = {key for key in self._seen if key > start_after} | set(keys)
+        self.high_water_mark = max([self.high_water_mark, *keys])
+        return keys
+
+    def poll(self) -> Iterator[LogBatch]:
+        for key in self.new_keys():
+            with self.source.open(key) as stream:
+                yield from parse_log(stream, key)
+
+
+@dataclass
+class Summary:
+    requests: int
+    window_seconds: float
+    requests_per_second: float
+    cache_hit_ratio: float
+    time_taken_ms: Dict[str, float] = field(default_factory=dict)
+    time_to_first_byte_ms: Dict[str, float] = field(default_factory=dict)
+    status_classes: Dict[str, int] = field(default_factory=dict)
+    status_codes: Dict[str, int] = field(default_factory=dict)
+    edge_result_types: Dict[str, int] = field(default_factory=dict)
+
+
+class RollingStats:
+    """Requests of the last `window` seconds (log time, up to the newest request seen)"""
+
+    def __init__(self, window: float = 15 * 60):
+        self.window = window
+        self._rows: Deque[Tuple[float, Optional[float], Optional[float], Optional[int], str]] = deque()
+        self._dates: Dict[str, int] = {}  # date -> epoch seconds of its midnight
+
+    def _timestamp(self, date: str, clock: str) -> float:
+        if (midnight := self._dates.get(date)) is None:
+            midnight = self._dates[date] = calendar.timegm(time.strptime(date, "%Y-%m-%d"))
+        return midnight + int(clock[0:2]) * 3600 + int(clock[3:5]) * 60 + int(clock[6:8])
+
+    def add(self, batch: LogBatch) -> None:
+        columns, rows = batch.columns, len(batch)
+        missing = [None] * rows
+        stamps = [self._timestamp(d, t) for d, t in zip(columns["date"], columns["time"])]
+        self._rows.extend(
+            zip(
+                stamps,
+                columns.get("time-taken", missing),
+                columns.get("time-to-first-byte", missing),
+                columns.get("sc-status", missing),
+                columns.get("x-edge-result-type", [""] * rows),
+            )
+        )
+        if stamps:
+            # the files arent strictly ordered, sort once per batch so the window can be trimmed from the left
+            self._rows = deque(sorted(self._rows, key=lambda row: row[0]))
+            while self._rows and self._rows[0][0] <= self._rows[-1][0] - self.window:
+                self._rows.popleft()
+
+    def summary(self) -> Summary:
+        rows = self._rows
+        span = (rows[-1][0] - rows[0][0] + 1) if rows else 0
+        results = Counter(row[4] for row in rows)
+        codes = Counter(str(row[3]) for row in rows if row[3] is not None)
+        classes = Counter(f"{code[0]}xx" for code in codes.elements())
+        return Summary(
+            requests=len(rows),
+            window_seconds=span,
+            requests_per_second=round(len(rows) / span, 2) if span else 0.0,
+            cache_hit_ratio=round(sum(results[r] for r in HIT_RESULT_TYPES) / len(rows), 3) if rows else 0.0,
+            time_taken_ms=percentiles([row[1] * 1000 for row in rows if row[1] is not None]),
+            time_to_first_byte_ms=percentiles([row[2] * 1000 for row in rows if row[2] is not None]),
+            status_classes=dict(sorted(classes.items())),
+            status_codes=dict(codes.most_common(10)),
+            edge_result_types=dict(results.most_common()),
+        )
+
+
+def as_text(summary: Summary) -> str:
+    lines = [
+        f"{summary.requests} requests in {summary.window_seconds:.0f}s ({summary.requests_per_second}/s), "
+        f"cache hit ratio {summary.cache_hit_ratio:.1%}",
+        "",
+        f"{'ms':<20}" + "".join(f"{key:>10}" for key in ["mean", "p50", "p90", "p99", "max"]),
+    ]
+    for name, values in [("time-taken", summary.time_taken_ms), ("time-to-first-byte", summary.time_to_first_byte_ms)]:
+        lines.append(f"{name:<20}" + "".join(f"{value:>10}" for value in values.values()))
+    lines += ["", "status: " + ", ".join(f"{key} {value}" for key, value in summary.status_classes.items())]
+    lines.append("codes:  " + ", ".join(f"{key} {value}" for key, value in summary.status_codes.items()))
+    lines.append("edge:   " + ", ".join(f"{key} {value}" for key, value in summary.edge_result_types.items()))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow the CloudFront access logs of the app")
+    parser.add_argument("location", help="s3://bucket[/prefix] or a local directory of .gz log files")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between polls")
+    parser.add_argument("--window", type=float, default=15 * 60, help="seconds of requests the stats cover")
+    parser.add_argument("--backfill", type=int, default=10, help="existing log objects read by the first poll")
+    parser.add_argument("--once", action="store_true", help="report once and exit")
+    parser.add_argument("--json", action="store_true", help="print the summaries as json lines")
+    args = parser.parse_args()
+
+    tailer = LogTailer(*log_source(args.location), backfill=args.backfill)
+    stats = RollingStats(args.window)
+    while True:
+        for batch in tailer.poll():
+            stats.add(batch)
+        if args.json:
+            print(json.dumps(asdict(stats.summary())), flush=True)
+        else:
+            if sys.stdout.isatty() and not args.once:
+                print("\033[2J\033[H", end="")  # clear the screen
+            print(f"{args.location} up to {tailer.high_water_mark or '(no logs)'}\n{as_text(stats.summary())}")
+        if args.once:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,64 @@
+"""
+Local equivalents of the Bedrock knowledge base chunking strategies, so documents can be chunked outside of an
+ingestion job (backfills, benchmarks) the same way `BedrockPineconeKnowledgeBase` configures the data source.
+
+Tokens are approximated by whitespace separated words, Bedrock counts model tokens so chunk boundaries are close to,
+but not exactly the same as, an ingestion job's.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List
+
+FIXED_SIZE = "FIXED_SIZE"
+NONE = "NONE"
+STRATEGIES = (FIXED_SIZE, NONE)
+
+DEFAULT_MAX_TOKENS = 1000
+DEFAULT_OVERLAP_PERCENTAGE = 20
+
+TOKEN_PATTERN = re.compile(r"\S+")
+
+
+@dataclass
+class Chunk:
+    text: str
+    index: int  # position of the chunk in the document
+    start: int  # character offsets of the chunk in the document
+    end: int
+
+
+def count_tokens(text: str) -> int:
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text))
+
+
+def fixed_size_chunks(
+    text: str, max_tokens: int = DEFAULT_MAX_TOKENS, overlap_percentage: int = DEFAULT_OVERLAP_PERCENTAGE
+) -> List[Chunk]:
+    """Split into chunks of at most `max_tokens` tokens, consecutive chunks share `overlap_percentage` of them"""
+    if max_tokens < 1 or not 0 <= overlap_percentage < 100:
+        raise ValueError("max_tokens must be positive and overlap_percentage between 0 and 99")
+    spans = [match.span() for match in TOKEN_PATTERN.finditer(text)]
+    step = max(1, max_tokens - max_tokens * overlap_percentage // 100)
+    chunks = []
+    for first in range(0, len(spans), step):
+        last = min(first + max_tokens, len(spans)) - 1
+        start, end = spans[first][0], spans[last][1]
+        chunks.append(Chunk(text=text[start:end], index=len(chunks), start=start, end=end))
+        if last == len(spans) - 1:
+            break
+    return chunks
+
+
+def chunk_text(
+    text: str,
+    strategy: str = FIXED_SIZE,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap_percentage: int = DEFAULT_OVERLAP_PERCENTAGE,
+) -> List[Chunk]:
+    """Chunk a document with a Bedrock chunking strategy, FIXED_SIZE or NONE (the whole document)"""
+    if strategy == FIXED_SIZE:
+        return fixed_size_chunks(text, max_tokens, overlap_percentage)
+    if strategy == NONE:
+        return [Chunk(text=text, index=0, start=0, end=len(text))] if text.strip() else []
+    raise ValueError(f"Unknown chunking strategy '{strategy}', expected one of {STRATEGIES}")
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+"""
+Bulk (re)index of the knowledge base documents into Pinecone, without an ingestion job.
+
+Objects are streamed from the knowledge base bucket (or a local directory), their text extracted by a `DocumentParser`
+(text and markup, and PDFs with the optional `pypdf` package), chunked locally with the data source's chunking strategy
+(see `tools.chunking`), embedded in batches and upserted with up to `--concurrency` objects in flight. Every completed
+object is appended to a checkpoint file with the ids of its chunks, so an interrupted run resumes where it stopped and
+re-running only processes new or changed objects (the checkpoint of a run with other chunking, embedding or index
+settings is refused unless `--reset-checkpoint`). Objects without a parser are logged and, like the failed ones, make
+the run exit with 1. The chunks a changed object no longer produces are deleted, and so are the chunks of objects
+removed from the source (unless `--keep-removed`).
+
+Vectors are written with the same metadata fields as a Bedrock ingestion job, but with deterministic ids
+(`<hash of the source uri>#<chunk>`), so it is intended to fill a new index, ie. the blue/green index of a
+`PinconeIndex` whose dimension changed, before the knowledge base is switched to it.
+
+    python -m tools.kb_backfill --bucket my-kb-bucket --index-host kb-1024-abc.svc.pinecone.io
+    python -m tools.kb_backfill --directory ./docs --embedder hash --dry-run
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from aws_lambda_powertools import Logger
+
+from tools import chunking
+from tools.vectors import (
+    DATA_SOURCE_ID_FIELD,
+    DEFAULT_DIMENSION,
+    DEFAULT_EMBEDDING_MODEL_ID,
+    METADATA_FIELD,
+    SOURCE_URI_FIELD,
+    TEXT_FIELD,
+    Embedder,
+    HashEmbedder,
+    InMemoryVectorStore,
+    PineconeVectorStore,
+    TitanEmbedder,
+    VectorRecord,
+    VectorStore,
+)
+
+logger = Logger(service="kb_backfill")
+
+DEFAULT_CHECKPOINT = ".kb_backfill.jsonl"
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown", ".html", ".htm", ".csv", ".json", ".xml")
+SKIP_SUFFIXES = (".metadata.json",)  # Bedrock metadata sidecar files, not documents
+
+
+@dataclass(frozen=True)
+class SourceObject:
+    key: str
+    etag: str  # changes when the content changes
+    uri: str
+
+
+class ObjectSource(ABC):
+    prefix: str = ""  # only keys under it are listed
+
+    @abstractmethod
+    def list(self) -> Iterator[SourceObject]:
+        """Stream the objects, a page at a time"""
+
+    @abstractmethod
+    def read(self, obj: SourceObject) -> bytes:
+        pass
+
+
+class S3ObjectSource(ObjectSource):
+    def __init__(self, bucket: str, prefix: str = "", client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = client
+
+    @property
+    def client(self):
+        if not self._client:
+            import boto3
+
+            self._client = boto3.client("s3")
+        return self._client
+
+    def list(self) -> Iterator[SourceObject]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                yield SourceObject(key=item["Key"], etag=item["ETag"], uri=f"s3://{self.bucket}/{item['Key']}")
+
+    def read(self, obj: SourceObject) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=obj.key)["Body"].read()
+
+
+class LocalDirectorySource(ObjectSource):
+    """Files under a local directory, keyed by their relative path like objects in the bucket"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def list(self) -> Iterator[SourceObject]:
+        for root, _, files in os.walk(self.directory):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                key = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                yield SourceObject(key=key, etag=f"{stat.st_mtime_ns}-{stat.st_size}", uri=f"file://{path}")
+
+    def read(self, obj: SourceObject) -> bytes:
+        with open(os.path.join(self.directory, obj.key), "rb") as f:
+            return f.read()
+
+
+class DocumentParser(ABC):
+    extensions: Tuple[str, ...] = ()  # lower case, the keys this parser reads
+
+    @abstractmethod
+    def parse(self, data: bytes) -> str:
+        """The text of the document"""
+
+
+class TextParser(DocumentParser):
+    extensions = TEXT_EXTENSIONS
+
+    def parse(self, data: bytes) -> str:
+        return data.decode("utf-8", errors="replace")
+
+
+class PdfParser(DocumentParser):
+    """Text of each page with `pypdf` (optional, `pip install pypdf`), scanned pages without a text layer are empty"""
+
+    extensions = (".pdf",)
+
+    def parse(self, data: bytes) -> str:
+        try:
+            from pypdf import PdfReader
+        except ImportError as e:
+            raise ImportError("Reading PDF documents needs pypdf, `pip install pypdf`") from e
+
+        return "\n\n".join(page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages)
+
+
+DEFAULT_PARSERS: Tuple[DocumentParser, ...] = (TextParser(), PdfParser())
+
+
+class CheckpointMismatch(ValueError):
+    pass
+
+
+class Checkpoint:
+    """
+    Append only record of the completed objects and the ids of their chunks, the last line of a key wins and a
+    partially written last line (crash) is ignored.
+
+    The settings the chunks depend on (chunking, embedding model, index) are recorded too: a checkpoint written with
+    other settings is refused, or with `reset` its objects are all processed again (only the chunk ids written to the
+    same index and namespace are kept, to delete the chunks the objects no longer produce)
+    """
+
+    INDEX_SETTINGS = ("index_host", "namespace")
+
+    def __init__(self, path: Optional[str], settings: Optional[dict] = None, reset: bool = False):
+        """
+        param settings: dict: what the chunks depend on, ie. strategy, max_tokens, model_id, dimension, index_host
+        param reset: bool: process every object again if the checkpoint was written with other settings
+        """
+        self.path = path
+        self.settings = settings
+        self._done: Dict[str, Tuple[Optional[str], List[str]]] = {}  # key -> (etag, chunk ids), no etag to redo
+        self._lock = threading.Lock()
+        written = None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if "settings" in record:
+                        if record["settings"] != written:
+                            self._invalidate(written, record["settings"])
+                        written = record["settings"]
+                    elif record.get("deleted"):
+                        self._done.pop(record["key"], None)
+                    else:
+                        self._done[record["key"]] = (record["etag"], record.get("ids", []))
+        if settings is None or settings == written or (written is None and not self._done):
+            if settings is not None and written is None and path:
+                self._write({"settings": settings})
+            return
+        if not reset:
+            raise CheckpointMismatch(
+                f"The checkpoint {path} was written with the settings {written}, not {settings}: "
+                "reset it to process every object again"
+            )
+        logger.warning("Resetting the checkpoint written with other settings", path=path, settings=written)
+        self._invalidate(written, settings)
+        self._write({"settings": settings})
+
+    def _invalidate(self, written: Optional[dict], settings: dict) -> None:
+        """Forget the etags written with other settings, and the chunk ids too if they are in another index"""
+        same_index = written is not None and all(written.get(k) == settings.get(k) for k in self.INDEX_SETTINGS)
+        self._done = {key: (None, ids) for key, (_, ids) in self._done.items()} if same_index else {}
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._done)
+
+    def is_done(self, obj: SourceObject) -> bool:
+        done = self._done.get(obj.key)
+        return done is not None and done[0] == obj.etag
+
+    def chunk_ids(self, key: str) -> List[str]:
+        """The ids of the chunks last written for the object, empty for checkpoints written without them"""
+        done = self._done.get(key)
+        return done[1] if done else []
+
+    def mark_done(self, obj: SourceObject, ids: List[str]) -> None:
+        self._append(obj.key, {"key": obj.key, "etag": obj.etag, "ids": ids}, (obj.etag, ids))
+
+    def mark_deleted(self, key: str) -> None:
+        self._append(key, {"key": key, "deleted": True}, None)
+
+    def _append(self, key: str, record: dict, done: Optional[Tuple[str, List[str]]]) -> None:
+        with self._lock:
+            if done is None:
+                self._done.pop(key, None)
+            else:
+                self._done[key] = done
+            self._write(record)
+
+    def _write(self, record: dict) -> None:
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+@dataclass
+class BackfillStats:
+    objects: int = 0  # objects indexed by this run
+    skipped: int = 0  # already indexed according to the checkpoint
+    unsupported: int = 0  # no parser for them
+    failed: int = 0
+    removed: int = 0  # objects gone from the source whose chunks were deleted
+    chunks: int = 0
+    deleted_chunks: int = 0  # no longer produced by their object
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+
+def chunk_id(uri: str, index: int) -> str:
+    return f"{hashlib.sha256(uri.encode()).hexdigest()[:32]}#{index}"
+
+
+def batched(items: List, size: int) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]  # noqa: E203
+
+
+class Backfill:
+    def __init__(
+        self,
+        source: ObjectSource,
+        embedder: Embedder,
+        store: VectorStore,
+        checkpoint: Optional[Checkpoint] = None,
+        strategy: str = chunking.FIXED_SIZE,
+        max_tokens: int = chunking.DEFAULT_MAX_TOKENS,
+        overlap_percentage: int = chunking.DEFAULT_OVERLAP_PERCENTAGE,
+        batch_size: int = 32,
+        concurrency: int = 4,
+        data_source_id: Optional[str] = None,
+        delete_removed: bool = True,
+        parsers: Sequence[DocumentParser] = DEFAULT_PARSERS,
+    ):
+        """
+        param batch_size: int: chunks per embedding call and per upsert
+        param concurrency: int: objects processed at the same time
+        param data_source_id: str: written to the vectors' metadata like an ingestion job does
+        param delete_removed: bool: delete the chunks of checkpointed objects the source no longer lists
+        param parsers: list: extract the text of the objects, the first one for the key's extension is used
+        """
+        self.source = source
+        self.embedder = embedder
+        self.store = store
+        self.checkpoint = checkpoint if checkpoint is not None else Checkpoint(None)
+        self.strategy = strategy
+        self.max_tokens = max_tokens
+        self.overlap_percentage = overlap_percentage
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.data_source_id = data_source_id
+        self.delete_removed = delete_removed
+        self.parsers = parsers
+        self.stats = BackfillStats()
+        self._lock = threading.Lock()
+
+    def _metadata(self, obj: SourceObject, chunk: chunking.Chunk) -> dict:
+        metadata = {TEXT_FIELD: chunk.text, METADATA_FIELD: "", SOURCE_URI_FIELD: obj.uri}
+        if self.data_source_id:
+            metadata[DATA_SOURCE_ID_FIELD] = self.data_source_id
+        return metadata
+
+    def parser(self, key: str) -> Optional[DocumentParser]:
+        return next((parser for parser in self.parsers if key.lower().endswith(parser.extensions)), None)
+
+    def process(self, obj: SourceObject) -> int:
+        """Chunk, embed and upsert one object and delete the chunks it no longer has, returns the number of chunks"""
+        text = self.parser(obj.key).parse(self.source.read(obj))
+        if not text.strip():
+            logger.warning(f"No text in {obj.uri}, a scanned document?")
+        chunks = chunking.chunk_text(text, self.strategy, self.max_tokens, self.overlap_percentage)
+        ids = [chunk_id(obj.uri, chunk.index) for chunk in chunks]
+        for batch in batched(chunks, self.batch_size):
+            vectors = self.embedder.embed([chunk.text for chunk in batch])
+            self.store.upsert(
+                [
+                    VectorRecord(id=chunk_id(obj.uri, chunk.index), values=values, metadata=self._metadata(obj, chunk))
+                    for chunk, values in zip(batch, vectors)
+                ]
+            )
+        if stale := sorted(set(self.checkpoint.chunk_ids(obj.key)) - set(ids)):
+            self.store.delete(stale)
+            with self._lock:
+                self.stats.deleted_chunks += len(stale)
+        self.checkpoint.mark_done(obj, ids)
+        return len(chunks)
+
+    def remove(self, key: str) -> None:
+        """Delete the chunks of an object that is no longer in the source"""
+        if ids := self.checkpoint.chunk_ids(key):
+            self.store.delete(ids)
+        self.checkpoint.mark_deleted(key)
+        self.stats.removed += 1
+        self.stats.deleted_chunks += len(ids)
+        logger.debug(f"Removed {key}", chunks=len(ids))
+
+    def _process(self, obj: SourceObject) -> None:
+        try:
+            chunks = self.process(obj)
+        except Exception:
+            logger.exception(f"Failed to index {obj.uri}, it will be retried on the next run")
+            with self._lock:
+                self.stats.failed += 1
+            return
+        with self._lock:
+            self.stats.objects += 1
+            self.stats.chunks += chunks
+        logger.debug(f"Indexed {obj.uri}", chunks=chunks)
+
+    def run(self) -> BackfillStats:
+        start = time.perf_counter()
+        # Bound the objects waiting to be processed, so the listing streams instead of being read up front
+        in_flight = threading.BoundedSemaphore(self.concurrency * 2)
+        listed = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="backfill") as executor:
+            for obj in self.source.list():
+                if obj.key.endswith(SKIP_SUFFIXES):
+                    continue
+                if self.parser(obj.key) is None:
+                    logger.warning(f"No parser for {obj.uri}, it is not indexed")
+                    self.stats.unsupported += 1
+                    continue
+                listed.add(obj.key)
+                if self.checkpoint.is_done(obj):
+                    self.stats.skipped += 1
+                    continue
+                in_flight.acquire()
+                executor.submit(self._process, obj).add_done_callback(lambda _: in_flight.release())
+        if self.delete_removed:  # the listing completed, anything else under the prefix was removed
+            for key in self.checkpoint.keys():
+                if key.startswith(self.source.prefix) and key not in listed:
+                    self.remove(key)
+        self.stats.seconds = time.perf_counter() - start
+        return self.stats
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Bulk (re)index knowledge base documents into Pinecone")
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--bucket", help="knowledge base bucket (KB_BUCKET)")
+    source_group.add_argument("--directory", help="local directory of documents instead of a bucket")
+    parser.add_argument("--prefix", default="", help="only objects under this prefix")
+    parser.add_argument("--index-host", help="Pinecone index host, PINECONE_API_KEY or its secret must be available")
+    parser.add_argument("--namespace", default="", help="Pinecone namespace")
+    parser.add_argument("--dry-run", action="store_true", help="upsert into an in-memory index instead of Pinecone")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help=f"default: {DEFAULT_CHECKPOINT}")
+    parser.add_argument(
+        "--reset-checkpoint", action="store_true", help="process every object again if the settings changed"
+    )
+    parser.add_argument("--strategy", choices=chunking.STRATEGIES, default=chunking.FIXED_SIZE)
+    parser.add_argument("--max-tokens", type=int, default=chunking.DEFAULT_MAX_TOKENS)
+    parser.add_argument("--overlap-percentage", type=int, default=chunking.DEFAULT_OVERLAP_PERCENTAGE)
+    parser.add_argument("--embedder", choices=["titan", "hash"], default="titan")
+    parser.add_argument("--model-id", default=DEFAULT_EMBEDDING_MODEL_ID)
+    parser.add_argument("--dimension", type=int, default=DEFAULT_DIMENSION)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4, help="objects in flight, also embedding calls per batch")
+    parser.add_argument("--data-source-id", help="DATASOURCE_ID, written to the vector metadata")
+    parser.add_argument("--keep-removed", action="store_true", help="keep the chunks of objects no longer listed")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        store = InMemoryVectorStore()
+    elif args.index_host:
+        from pinecone import Pinecone
+        from cdk.functions.pinecone_index import get_api_key
+
+        store = PineconeVectorStore(Pinecone(api_key=get_api_key()).Index(host=args.index_host), args.namespace)
+    else:
+        parser.error("--index-host is required unless --dry-run")
+    if args.embedder == "titan":
+        embedder = TitanEmbedder(args.model_id, args.dimension, concurrency=args.concurrency)
+    else:
+        embedder = HashEmbedder(args.dimension)
+
+    settings = dict(
+        strategy=args.strategy,
+        max_tokens=args.max_tokens,
+        overlap_percentage=args.overlap_percentage,
+        model_id=args.model_id if args.embedder == "titan" else args.embedder,
+        dimension=args.dimension,
+        index_host=args.index_host,
+        namespace=args.namespace,
+    )
+    try:
+        checkpoint = Checkpoint(None if args.dry_run else args.checkpoint, settings, reset=args.reset_checkpoint)
+    except CheckpointMismatch as e:
+        parser.error(f"{e} (--reset-checkpoint)")
+
+    backfill = Backfill(
+        source=S3ObjectSource(args.bucket, args.prefix) if args.bucket else LocalDirectorySource(args.directory),
+        embedder=embedder,
+        store=store,
+        checkpoint=checkpoint,
+        strategy=args.strategy,
+        max_tokens=args.max_tokens,
+        overlap_percentage=args.overlap_percentage,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        data_source_id=args.data_source_id,
+        delete_removed=not args.keep_removed,
+    )
+    stats = backfill.run()
+    print(json.dumps({**asdict(stats), "chunks_per_second": round(stats.chunks_per_second, 1)}, indent=2))
+    sys.exit(1 if stats.failed or stats.unsupported else 0)
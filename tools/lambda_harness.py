@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+"""
+Local harness for Bedrock agent action group Lambda handlers.
+
+Serves any handler (ie. `cdk.functions.web_search.lambda_handler`) behind an HTTP endpoint that emulates the
+Bedrock agent -> Lambda contract, runs a mock Jina upstream with configurable latency and benchmarks handler
+throughput, cold vs warm init cost (optionally after a warmer invocation) and memory per invocation.
+
+    python -m tools.lambda_harness mock-jina --port 9100 --jina-latency 0.2
+    python -m tools.lambda_harness serve cdk.functions.web_search.lambda_handler --port 9000 --mock-jina
+    python -m tools.lambda_harness bench cdk.functions.web_search.lambda_handler -f search -p query=weather -n 200 -c 8
+"""
+import argparse
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import unquote
+
+from pydantic import ValidationError
+
+from cdk.functions.action_group import WARMER_EVENT
+from cdk.models import BedrockEvent, BedrockResponseEvent
+
+# Same invoke path as the Lambda runtime interface emulator, so clients can target either
+INVOKE_PATH = "/2015-03-31/functions/function/invocations"
+DEFAULT_HANDLER = "cdk.functions.web_search.lambda_handler"
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..")  # root of this project
+
+Handler = Callable[[dict, object], dict]
+
+
+@dataclass
+class LambdaContext:
+    """Minimal stand-in for the Lambda context object passed to handlers"""
+
+    function_name: str = "local-action-group"
+    memory_limit_in_mb: int = 1024
+    timeout_ms: int = 60_000
+    function_version: str = "$LATEST"
+    invoked_function_arn: str = "arn:aws:lambda:us-east-1:000000000000:function:local-action-group"
+    aws_request_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    log_group_name: str = "/aws/lambda/local-action-group"
+    log_stream_name: str = "local"
+    _started: float = field(default_factory=time.monotonic, repr=False)
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int(self.timeout_ms - (time.monotonic() - self._started) * 1000))
+
+
+def load_handler(handler_path: str) -> Handler:
+    """Import a handler from a dotted path like `cdk.functions.web_search.lambda_handler`"""
+    module_name, _, attr = handler_path.rpartition(".")
+    if not module_name:
+        raise ValueError(f"Handler must be a dotted path 'module.function', got: '{handler_path}'")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def make_event(function: str, parameters: Dict[str, str], action_group="action_group", session_id=None) -> dict:
+    """Build a Bedrock agent function event like the one the agent sends to the action group Lambda"""
+    return BedrockEvent(
+        messageVersion="1.0",
+        agent={"name": "local", "id": "local", "alias": "local", "version": "DRAFT"},
+        inputText="local harness",
+        sessionId=session_id or uuid.uuid4().hex,
+        actionGroup=action_group,
+        function=function,
+        parameters=[{"name": name, "type": "string", "value": value} for name, value in parameters.items()],
+        sessionAttributes={},
+        promptSessionAttributes={},
+    ).model_dump()
+
+
+def start_in_thread(server: ThreadingHTTPServer) -> ThreadingHTTPServer:
+    """Run an http server on a daemon thread and return it, call `server.shutdown()` to stop it"""
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+class _JsonRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status: int, body, headers: Optional[dict] = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # keep the benchmark output readable
+
+
+class _InvokeRequestHandler(_JsonRequestHandler):
+    server: "ActionGroupServer"
+
+    def do_POST(self):
+        if self.path != INVOKE_PATH:
+            return self.send_json(404, {"message": f"Unknown path: {self.path}, POST events to {INVOKE_PATH}"})
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            # Bedrock only ever sends well formed function events, reject anything else
+            event = BedrockEvent.model_validate_json(body).model_dump()
+        except ValidationError as e:
+            return self.send_json(400, {"errorType": "ValidationError", "errorMessage": str(e)})
+        try:
+            result = self.server.handler(event, LambdaContext(function_name=self.server.function_name))
+            BedrockResponseEvent.model_validate(result)  # the agent rejects responses that break the contract
+        except Exception as e:
+            # Lambda reports handler errors as a 200 with the X-Amz-Function-Error header
+            error = {"errorType": type(e).__name__, "errorMessage": str(e)}
+            return self.send_json(200, error, headers={"X-Amz-Function-Error": "Unhandled"})
+        self.send_json(200, result)
+
+
+class ActionGroupServer(ThreadingHTTPServer):
+    """HTTP server that invokes an action group handler for each event POSTed to `INVOKE_PATH`"""
+
+    daemon_threads = True
+
+    def __init__(self, handler: Handler, host="127.0.0.1", port=9000, function_name="local-action-group"):
+        self.handler = handler
+        self.function_name = function_name
+        super().__init__((host, port), _InvokeRequestHandler)
+
+
+class _MockJinaRequestHandler(_JsonRequestHandler):
+    server: "MockJinaServer"
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(max(0.0, self.server.latency + random.uniform(-self.server.jitter, self.server.jitter)))
+        if random.random() < self.server.error_rate:
+            return self.send_json(429, {"code": 429, "message": "Too many requests"})
+        service, _, target = self.path.lstrip("/").partition("/")
+        target = unquote(target)
+        content = "lorem ipsum dolor sit amet " * (self.server.content_size // 27 + 1)
+        if service == "s":
+            data = [
+                {"title": f"Result {i} for {target}", "url": f"https://example.com/{i}", "content": content}
+                for i in range(self.server.results)
+            ]
+        elif service == "r":
+            data = {"title": f"Page {target}", "url": target, "content": content}
+        else:
+            return self.send_json(404, {"message": f"Unknown service: '{service}', use /s/<query> or /r/<url>"})
+        self.send_json(200, {"code": 200, "status": 20000, "data": data})
+
+
+class MockJinaServer(ThreadingHTTPServer):
+    """Mock of the Jina search (`/s/<query>`) and reader (`/r/<url>`) apis with configurable latency"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=9100,
+        latency=0.2,
+        jitter=0.0,
+        error_rate=0.0,
+        results=5,
+        content_size=6000,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.results = results
+        self.content_size = content_size
+        self.requests = 0
+        super().__init__((host, port), _MockJinaRequestHandler)
+
+    @property
+    def environment(self) -> Dict[str, str]:
+        """Environment variables that point cdk.functions.web_search at this mock"""
+        return {
+            "JINA_SEARCH_URL": f"{server_url(self)}/s/",
+            "JINA_READER_URL": f"{server_url(self)}/r/",
+            "JINA_API_KEY": "jina_mock_key",  # the mock doesnt check it, but web_search needs a key
+        }
+
+
+def invoke_url(url: str, event: dict, timeout=60) -> dict:
+    """POST an event to a running `ActionGroupServer` (or the Lambda runtime interface emulator)"""
+    request = urllib.request.Request(
+        url.rstrip("/") + INVOKE_PATH,
+        data=json.dumps(event).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+@dataclass
+class BenchmarkResult:
+    handler: str
+    invocations: int
+    concurrency: int
+    errors: int
+    duration_s: float
+    throughput_rps: float
+    latency_ms: Dict[str, float]
+    cold_init_ms: Optional[float]
+    cold_first_invoke_ms: Optional[float]
+    cold_warmer_ms: Optional[float]
+    warm_first_invoke_ms: Optional[float]
+    memory_per_invocation_kb: Optional[float]
+    max_rss_mb: float
+
+    def as_text(self) -> str:
+        lines = [f"{key:>26}: {value}" for key, value in asdict(self).items()]
+        return "\n".join(lines)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Return mean/p50/p90/p99/max of the samples, rounded to 2 decimals"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]  # nearest rank
+
+    result = {"mean": statistics.fmean(ordered), "p50": pct(50), "p90": pct(90), "p99": pct(99), "max": ordered[-1]}
+    return {key: round(value, 2) for key, value in result.items()}
+
+
+def measure_cold_start(handler_path: str, event: dict, env: Optional[dict] = None, warmer=False) -> Dict[str, float]:
+    """
+    Import the handler and invoke it once in a fresh interpreter, like a new Lambda execution environment.
+    With `warmer` the environment is first initialized with a `WARMER_EVENT`, like a scheduled warmer would.
+    """
+    cmd = [sys.executable, "-m", "tools.lambda_harness", "cold", handler_path, "--event", json.dumps(event)]
+    cmd += ["--warmer"] if warmer else []
+    result = subprocess.run(
+        cmd, cwd=ROOT_DIR, env={**os.environ, **(env or {})}, capture_output=True, text=True, check=True, timeout=120
+    )
+    # The handler may log to stdout, the measurement is the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _cold(handler_path: str, event: dict, warmer=False) -> Dict[str, float]:
+    result = {}
+    start = time.perf_counter()
+    handler = load_handler(handler_path)
+    result["init_ms"] = (time.perf_counter() - start) * 1000
+    if warmer:
+        start = time.perf_counter()
+        handler(WARMER_EVENT, LambdaContext())
+        result["warmer_ms"] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    handler(event, LambdaContext())
+    result["first_invoke_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def _mean(results: List[Dict[str, float]], key: str) -> Optional[float]:
+    values = [result[key] for result in results if key in result]
+    return round(statistics.fmean(values), 1) if values else None
+
+
+def run_benchmark(
+    handler_path: str,
+    event: dict,
+    invocations=100,
+    concurrency=1,
+    cold_runs=3,
+    memory_samples=20,
+    url: Optional[str] = None,
+    env: Optional[dict] = None,
+    warmer=False,
+) -> BenchmarkResult:
+    """
+    Benchmark a handler
+    param handler_path: str: dotted path of the handler
+    param event: dict: the Bedrock agent event to send on every invocation
+    param invocations: int: number of warm invocations used for throughput and latency
+    param concurrency: int: number of concurrent callers
+    param cold_runs: int: number of fresh interpreters used to measure init cost, 0 to skip
+    param memory_samples: int: number of invocations traced with tracemalloc, 0 to skip
+    param url: str: invoke an `ActionGroupServer` at this url instead of calling the handler in process
+    param env: dict: extra environment variables for the handler (ie. MockJinaServer.environment)
+    param warmer: bool: send a WARMER_EVENT to each cold environment before the first real event
+    return: BenchmarkResult
+    """
+    os.environ.update(env or {})
+    cold = [measure_cold_start(handler_path, event, env, warmer) for _ in range(cold_runs)]
+
+    if url:
+        handler = None
+
+        def invoke(_) -> dict:
+            return invoke_url(url, event)
+
+    else:
+        handler = load_handler(handler_path)
+
+        def invoke(_) -> dict:
+            return handler(event, LambdaContext())
+
+    # First invocation in this process pays for lazy imports, connection setup etc.
+    start = time.perf_counter()
+    invoke(None)
+    warm_first_invoke_ms = (time.perf_counter() - start) * 1000
+
+    latencies: List[float] = []
+    errors: List[int] = []  # list.append is thread safe, `+= 1` is not
+
+    def timed_invoke(i) -> None:
+        start = time.perf_counter()
+        try:
+            result = invoke(i)
+            if "errorType" in result or result["response"]["functionResponse"].get("responseState"):
+                errors.append(i)
+        except Exception:
+            errors.append(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed_invoke, range(invocations)))
+    duration = time.perf_counter() - start
+
+    memory_per_invocation_kb = None
+    if handler and memory_samples:
+        peaks = []
+        tracemalloc.start()
+        for _ in range(memory_samples):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            handler(event, LambdaContext())
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+        memory_per_invocation_kb = round(statistics.fmean(peaks) / 1024, 1)
+
+    return BenchmarkResult(
+        handler=handler_path,
+        invocations=invocations,
+        concurrency=concurrency,
+        errors=len(errors),
+        duration_s=round(duration, 3),
+        throughput_rps=round(invocations / duration, 1) if duration else 0.0,
+        latency_ms=percentiles(latencies),
+        cold_init_ms=_mean(cold, "init_ms"),
+        cold_first_invoke_ms=_mean(cold, "first_invoke_ms"),
+        cold_warmer_ms=_mean(cold, "warmer_ms"),
+        warm_first_invoke_ms=round(warm_first_invoke_ms, 1),
+        memory_per_invocation_kb=memory_per_invocation_kb,
+        max_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    )
+
+
+def _parse_params(params: List[str]) -> Dict[str, str]:
+    return dict(param.split("=", 1) for param in params or [])
+
+
+def _add_mock_jina_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--jina-latency", type=float, default=0.2, help="mock Jina latency in seconds. default: 0.2")
+    parser.add_argument("--jina-jitter", type=float, default=0.0, help="mock Jina +/- latency jitter in seconds")
+    parser.add_argument("--jina-error-rate", type=float, default=0.0, help="fraction of mock Jina calls that 429")
+
+
+def _start_mock_jina(args, port=0) -> MockJinaServer:
+    return start_in_thread(
+        MockJinaServer(port=port, latency=args.jina_latency, jitter=args.jina_jitter, error_rate=args.jina_error_rate)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local harness for Bedrock agent action group Lambda handlers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    mock_parser = subparsers.add_parser("mock-jina", help="Run a mock Jina search/reader upstream")
+    mock_parser.add_argument("--port", type=int, default=9100)
+    _add_mock_jina_args(mock_parser)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve a handler behind the Lambda invoke api")
+    serve_parser.add_argument("handler", nargs="?", default=DEFAULT_HANDLER, help=f"default: {DEFAULT_HANDLER}")
+    serve_parser.add_argument("--port", type=int, default=9000)
+    serve_parser.add_argument("--mock-jina", action="store_true", help="point the handler at a mock Jina upstream")
+    _add_mock_jina_args(serve_parser)
+
+    bench_parser = subparsers.add_parser("bench", help="Benchmark a handler")
+    bench_parser.add_argument("handler", nargs="?", default=DEFAULT_HANDLER, help=f"default: {DEFAULT_HANDLER}")
+    bench_parser.add_argument("-f", "--function", default="search", help="action group function. default: search")
+    bench_parser.add_argument("-p", "--param", action="append", help="function parameter as name=value")
+    bench_parser.add_argument("-n", "--invocations", type=int, default=100)
+    bench_parser.add_argument("-c", "--concurrency", type=int, default=1)
+    bench_parser.add_argument("--cold-runs", type=int, default=3, help="fresh interpreters used to measure init")
+    bench_parser.add_argument("--warmer", action="store_true", help="send a warmer event before the first cold call")
+    bench_parser.add_argument("--memory-samples", type=int, default=20, help="invocations traced for memory")
+    bench_parser.add_argument("--url", help="benchmark a running `serve` endpoint instead of calling in process")
+    bench_parser.add_argument("--real-jina", action="store_true", help="call the real Jina apis (costs money)")
+    bench_parser.add_argument("--quiet", action="store_true", help="disable handler logging (excludes its cost)")
+    bench_parser.add_argument("--json", action="store_true", help="print the result as json")
+    _add_mock_jina_args(bench_parser)
+
+    cold_parser = subparsers.add_parser("cold", help=argparse.SUPPRESS)
+    cold_parser.add_argument("handler")
+    cold_parser.add_argument("--event", required=True)
+    cold_parser.add_argument("--warmer", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.command == "cold":
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(_cold(args.handler, json.loads(args.event), args.warmer)))
+
+    elif args.command == "mock-jina":
+        server = MockJinaServer(
+            port=args.port, latency=args.jina_latency, jitter=args.jina_jitter, error_rate=args.jina_error_rate
+        )
+        print(f"Mock Jina listening on {server_url(server)}, export:")
+        for name, value in server.environment.items():
+            print(f"  {name}={value}")
+        server.serve_forever()
+
+    elif args.command == "serve":
+        if args.mock_jina:
+            os.environ.update(_start_mock_jina(args).environment)
+        server = ActionGroupServer(load_handler(args.handler), port=args.port)
+        print(f"Serving {args.handler} on {server_url(server)}{INVOKE_PATH}")
+        server.serve_forever()
+
+    elif args.command == "bench":
+        env = {} if args.real_jina else _start_mock_jina(args).environment
+        if args.quiet:
+            logging.disable(logging.CRITICAL)
+        result = run_benchmark(
+            args.handler,
+            make_event(args.function, _parse_params(args.param) or {"query": "weather in omaha"}),
+            invocations=args.invocations,
+            concurrency=args.concurrency,
+            cold_runs=args.cold_runs,
+            memory_samples=args.memory_samples,
+            url=args.url,
+            env=env,
+            warmer=args.warmer,
+        )
+        print(json.dumps(asdict(result), indent=2) if args.json else result.as_text())
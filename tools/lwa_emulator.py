@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Lambda Web Adapter and function URL in front of the app, to check that responses stream.
+
+The adapter proxies each invocation to the app (uvicorn on `AWS_LWA_PORT`). In `response_stream` mode it sends the
+Lambda runtime a prelude (status, headers and cookies as json, then 8 NUL bytes) followed by the body as the app writes
+it, the function URL turns that back into a chunked HTTP response. In `buffered` mode the whole body is read first.
+The emulator does the same with the same framing, so a layer that holds back the body shows up locally as it would in
+Lambda, and `buffered` shows what that looks like.
+
+    python -m tools.lwa_emulator serve gradio_app.app:app --port 9000 [--invoke-mode buffered]
+    python -m tools.lwa_emulator prompt http://localhost:9000/gradio "What is Bedrock?" --cookie session=...
+
+`prompt` sends a prompt through the Gradio queue and prints when each update arrived and the gaps between them.
+"""
+import argparse
+import http.client
+import importlib
+import json
+import os
+import secrets
+import socket
+import statistics
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import uvicorn
+
+PRELUDE_SEPARATOR = b"\0" * 8
+INVOKE_MODES = ("response_stream", "buffered")  # values of AWS_LWA_INVOKE_MODE
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-connection", "te", "trailer", "transfer-encoding", "upgrade"}
+READ_SIZE = 64 * 1024
+
+
+def encode_prelude(status: int, headers: List[Tuple[str, str]]) -> bytes:
+    """The http integration prelude of a streamed Lambda response, `Set-Cookie` headers go in `cookies`"""
+    prelude: Dict = {"statusCode": status, "headers": {}, "cookies": []}
+    for key, value in headers:
+        if key.lower() == "set-cookie":
+            prelude["cookies"].append(value)
+        elif key.lower() not in HOP_BY_HOP:
+            joined = prelude["headers"].get(key.lower())
+            prelude["headers"][key.lower()] = f"{joined}, {value}" if joined else value
+    return json.dumps(prelude).encode("utf-8") + PRELUDE_SEPARATOR
+
+
+def decode_stream(frames: Iterable[bytes]) -> Tuple[Dict, Iterator[bytes]]:
+    """The prelude and the body pieces of a streamed Lambda response, as the function URL reads it"""
+    frames = iter(frames)
+    buffer = b""
+    while PRELUDE_SEPARATOR not in buffer:
+        buffer += next(frames)  # StopIteration: the stream ended before the prelude
+    prelude, _, rest = buffer.partition(PRELUDE_SEPARATOR)
+
+    def body() -> Iterator[bytes]:
+        if rest:
+            yield rest
+        yield from frames
+
+    return json.loads(prelude), body()
+
+
+def stream_frames(response: http.client.HTTPResponse) -> Iterator[bytes]:
+    """What the adapter sends the runtime in `response_stream` mode: the prelude then each read of the app response"""
+    yield encode_prelude(response.status, response.getheaders())
+    while piece := response.read1(READ_SIZE):
+        yield piece
+
+
+class AdapterHandler(BaseHTTPRequestHandler):
+    """Proxies a request to the app like the adapter, behind a function URL"""
+
+    protocol_version = "HTTP/1.1"  # chunked responses
+    server: "AdapterServer"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def forward(self) -> None:
+        body = self.rfile.read(int(self.headers.get("content-length") or 0))
+        headers = {key: value for key, value in self.headers.items() if key.lower() not in HOP_BY_HOP}
+        # function URL and adapter headers, the app sees them in Lambda too
+        request_id = str(uuid.uuid4())
+        headers["x-forwarded-proto"] = "https"
+        headers["x-forwarded-for"] = self.client_address[0]
+        headers["x-amzn-trace-id"] = f"Root=1-{int(time.time()):08x}-{secrets.token_hex(12)}"
+        headers["x-amzn-request-context"] = json.dumps({"requestId": request_id, "http": {"method": self.command}})
+        headers["x-amzn-lambda-context"] = json.dumps({"request_id": request_id})
+
+        upstream = http.client.HTTPConnection(*self.server.upstream)
+        try:
+            upstream.request(self.command, self.path, body=body, headers=headers)
+            response = upstream.getresponse()
+            if self.server.invoke_mode == "buffered":
+                self.send_buffered(response.status, response.getheaders(), response.read())
+            else:
+                self.send_streamed(*decode_stream(stream_frames(response)))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client went away, ie. closed an event stream
+        finally:
+            upstream.close()
+
+    def send_buffered(self, status: int, headers: List[Tuple[str, str]], body: bytes) -> None:
+        self.send_response(status)
+        for key, value in headers:
+            if key.lower() not in HOP_BY_HOP and key.lower() != "content-length":
+                self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_streamed(self, prelude: Dict, body: Iterator[bytes]) -> None:
+        self.send_response(prelude["statusCode"])
+        for key, value in prelude["headers"].items():
+            if key != "content-length":
+                self.send_header(key, value)
+        for cookie in prelude["cookies"]:
+            self.send_header("Set-Cookie", cookie)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for piece in body:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = forward
+
+
+class AdapterServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], upstream: Tuple[str, int], invoke_mode: str = "response_stream"):
+        """
+        param upstream: (str, int): host and port of the app, `AWS_LWA_PORT`
+        param invoke_mode: str: `response_stream` or `buffered`, as `AWS_LWA_INVOKE_MODE`
+        """
+        super().__init__(address, AdapterHandler)
+        self.upstream = upstream
+        self.invoke_mode = invoke_mode.lower()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Emulator:
+    """The app on uvicorn and the adapter in front of it, each on a background thread"""
+
+    def __init__(self, app, port: int = 0, app_port: int = 0, invoke_mode: str = "response_stream"):
+        self.app_port = app_port or free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.app_port, log_level="warning"))
+        self.adapter = AdapterServer(("127.0.0.1", port), ("127.0.0.1", self.app_port), invoke_mode)
+        self.url = f"http://127.0.0.1:{self.adapter.server_address[1]}"
+        self._threads: List[threading.Thread] = []
+
+    def __enter__(self) -> "Emulator":
+        self._threads = [
+            threading.Thread(target=self.server.run, name="lwa-app", daemon=True),
+            threading.Thread(target=self.adapter.serve_forever, name="lwa-adapter", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if time.monotonic() > deadline or not self._threads[0].is_alive():
+                raise RuntimeError("the app did not start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.adapter.shutdown()
+        self.adapter.server_close()
+        self.server.should_exit = True
+        self._threads[0].join(10)
+
+
+def _request(url: str, data: Optional[Dict] = None, headers: Optional[Dict] = None):
+    body = json.dumps(data).encode("utf-8") if data is not None else None
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json", **(headers or {})})
+    return urllib.request.urlopen(request, timeout=60)
+
+
+def stream_event(
+    base_url: str, data: List, api_name: str = "invoke_agent", headers: Optional[Dict] = None
+) -> List[Tuple[float, Dict]]:
+    """
+    Run the Gradio event `api_name` through the queue and time its messages
+    param base_url: str: url the Gradio app is mounted at, ie. http://localhost:9000/gradio
+    param data: list: the input values of the event
+    param headers: dict: ie. the session cookie
+    return: list: (time.perf_counter() when it arrived, message) of each server sent event
+    """
+    with _request(f"{base_url}/config", headers=headers) as response:
+        config = json.load(response)
+    fn_index = next(i for i, dep in enumerate(config["dependencies"]) if dep.get("api_name") == api_name)
+    session_hash = secrets.token_hex(6)
+    join = dict(data=data, fn_index=fn_index, session_hash=session_hash, event_data=None, trigger_id=None)
+    _request(f"{base_url}/queue/join", join, headers).close()
+    messages = []
+    with _request(f"{base_url}/queue/data?session_hash={session_hash}", headers=headers) as response:
+        for line in response:  # read as it arrives
+            if line.startswith(b"data:"):
+                message = json.loads(line[len(b"data:") :])  # noqa: E203
+                messages.append((time.perf_counter(), message))
+                if message.get("msg") in ("close_stream", "process_completed"):
+                    break
+    return messages
+
+
+def flush_gaps(messages: List[Tuple[float, Dict]], msg: str = "process_generating") -> List[float]:
+    """Seconds between the consecutive `msg` messages"""
+    times = [at for at, message in messages if message.get("msg") == msg]
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lambda Web Adapter stand-in and streaming check")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the app behind the emulated adapter")
+    serve.add_argument("app", help="module:attribute of the ASGI app, ie. gradio_app.app:app")
+    serve.add_argument("--port", type=int, default=9000)
+    serve.add_argument("--app-port", type=int, default=int(os.getenv("AWS_LWA_PORT", "8080")))
+    serve.add_argument("--invoke-mode", choices=INVOKE_MODES, default=os.getenv("AWS_LWA_INVOKE_MODE", INVOKE_MODES[0]))
+    prompt = commands.add_parser("prompt", help="send a prompt and time the streamed updates")
+    prompt.add_argument("url", help="url the Gradio app is mounted at, ie. http://localhost:9000/gradio")
+    prompt.add_argument("prompt")
+    prompt.add_argument("--cookie", help="ie. session=<cookie of a logged in browser>")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        module, _, attribute = args.app.partition(":")
+        app = getattr(importlib.import_module(module), attribute or "app")
+        with Emulator(app, args.port, args.app_port, args.invoke_mode.lower()) as emulator:
+            print(f"{args.invoke_mode} adapter on {emulator.url}, app on port {emulator.app_port}")
+            threading.Event().wait()
+    else:
+        timed = stream_event(args.url, [args.prompt, [], False], headers={"Cookie": args.cookie} if args.cookie else {})
+        for at, message in timed:
+            print(f"{(at - timed[0][0]) * 1000:>9.0f}ms {message.get('msg')}")
+        if gaps := flush_gaps(timed):
+            median, longest = statistics.median(gaps) * 1000, max(gaps) * 1000
+            print(f"{len(gaps) + 1} updates, gaps between them: median {median:.0f}ms, max {longest:.0f}ms")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Merge the collapsed stack profiles written by `gradio_app/profiling.py` into one flame graph input.
+
+    python -m tools.merge_profiles s3://<bucket>/profiles/invoke_agent/ --root invoke_agent -o invoke_agent.collapsed
+    python -m tools.merge_profiles /tmp/profiles --top 20
+
+The output is the collapsed stack format read by flamegraph.pl (`flamegraph.pl out.collapsed > out.svg`) and
+speedscope.app. `--top` prints the functions with the most samples, on the CPU themselves (self) and in total.
+"""
+import argparse
+import sys
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tools.cf_logs import log_source
+
+
+def parse_collapsed(lines: Iterable[str]) -> Iterator[Tuple[str, int]]:
+    """(stack, samples) of each `frame;frame count` line"""
+    for line in lines:
+        stack, _, count = line.rstrip("\n").rpartition(" ")
+        if stack and count.isdigit():
+            yield stack, int(count)
+
+
+def trim(stack: str, root: Optional[str]) -> Optional[str]:
+    """The stack from the first frame of the function `root`, None if it isnt in the stack"""
+    if not root:
+        return stack
+    frames = stack.split(";")
+    for i, frame in enumerate(frames):
+        if frame.split(" (", 1)[0] == root:
+            return ";".join(frames[i:])
+    return None
+
+
+def merge(profiles: Iterable[Iterable[str]], root: Optional[str] = None) -> Counter:
+    merged: Counter = Counter()
+    for lines in profiles:
+        for stack, count in parse_collapsed(lines):
+            if (stack := trim(stack, root)) is not None:
+                merged[stack] += count
+    return merged
+
+
+def hot_spots(merged: Counter, top: int = 20) -> List[Dict]:
+    """The functions with the most samples on top of the stack (self) and anywhere in it (total)"""
+    own, total = Counter(), Counter()
+    for stack, count in merged.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    samples = sum(merged.values()) or 1
+    return [
+        dict(
+            function=frame,
+            self=count,
+            self_pct=round(100 * count / samples, 1),
+            total_pct=round(100 * total[frame] / samples, 1),
+        )
+        for frame, count in own.most_common(top)
+    ]
+
+
+def read_profiles(locations: List[str]) -> Iterator[List[str]]:
+    """The lines of each `.collapsed` file below the local directories or s3://bucket/prefix locations"""
+    for location in locations:
+        source, prefix = log_source(location)
+        for key in source.list(prefix):
+            if key.endswith(".collapsed"):
+                with source.open(key) as f:
+                    yield f.read().decode("utf-8").splitlines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge collapsed stack profiles into flame graph input")
+    parser.add_argument("locations", nargs="+", help="local directories or s3://bucket/prefix")
+    parser.add_argument("--root", help="keep only the stacks below this function, ie. invoke_agent")
+    parser.add_argument("-o", "--output", help="merged collapsed stacks file, default stdout")
+    parser.add_argument("--top", type=int, default=0, help="print the N hottest functions to stderr")
+    args = parser.parse_args()
+
+    profiles = list(read_profiles(args.locations))
+    merged = merge(profiles, args.root)
+    output = "".join(f"{stack} {count}\n" for stack, count in sorted(merged.items()))
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output)
+    print(f"{len(profiles)} profiles, {sum(merged.values())} samples", file=sys.stderr)
+    for spot in hot_spots(merged, args.top) if args.top else []:
+        print(f"{spot['self_pct']:>6}% self {spot['total_pct']:>6}% total  {spot['function']}", file=sys.stderr)
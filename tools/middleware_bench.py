@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Time what the Gradio app middlewares add to each streamed token, the BaseHTTPMiddleware versions the app used to have
+against the plain ASGI ones in `gradio_app.middleware`.
+
+An endpoint streams `--tokens` server sent events through the request logger and X-Forwarded-Host middlewares, the
+latency of a token is the time from the endpoint yielding it to the server being asked to send it.
+
+    python -m tools.middleware_bench
+    python -m tools.middleware_bench --tokens 5000 --json
+"""
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Tuple
+
+from starlette.applications import Starlette
+from starlette.datastructures import MutableHeaders
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+from gradio_app import middleware
+from tools.lambda_harness import percentiles
+
+DEFAULT_TOKENS = 2000
+
+
+class LegacyRequestLogger(BaseHTTPMiddleware):
+    """What the app used to do"""
+
+    async def dispatch(self, request, call_next):
+        middleware.logger.debug(f"Request: {request.method} {request.url}", request=request.scope)
+        return await call_next(request)
+
+
+class LegacyXForwardedHost(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        mutable_req_hdrs = MutableHeaders(request.headers)
+        if x_forwarded_host := mutable_req_hdrs.get("X-Forwarded-Host"):
+            mutable_req_hdrs["Host"] = x_forwarded_host
+        request._headers = mutable_req_hdrs
+        request.scope.update(headers=request.headers.raw)
+        return await call_next(request)
+
+
+MIDDLEWARES = {
+    "BaseHTTPMiddleware": (LegacyRequestLogger, LegacyXForwardedHost),
+    "ASGI middleware": (middleware.LambdaRequestLogger, middleware.XForwardedHostMiddleware),
+}
+
+
+@dataclass
+class MiddlewareBenchResult:
+    name: str
+    tokens: int
+    latency_us: Dict[str, float]  # per streamed token
+
+
+def make_app(logger_cls, forwarded_host_cls, tokens: int, yielded_at: list) -> Starlette:
+    async def stream_tokens():
+        for i in range(tokens):
+            yielded_at.append(time.perf_counter())
+            yield f"data: token {i}\n\n".encode()
+
+    async def stream(request):
+        return StreamingResponse(stream_tokens(), media_type="text/event-stream")
+
+    app = Starlette(routes=[Route("/stream", stream)])
+    app.add_middleware(forwarded_host_cls)
+    app.add_middleware(logger_cls)
+    return app
+
+
+async def stream_times(logger_cls, forwarded_host_cls, tokens: int) -> Tuple[List[float], List[float]]:
+    """When each token was yielded by the endpoint and when it was sent to the server"""
+    yielded_at, sent_at = [], []
+    app = make_app(logger_cls, forwarded_host_cls, tokens, yielded_at)
+    disconnected = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            sent_at.append(time.perf_counter())
+
+    headers = [(b"host", b"lambda-url"), (b"x-forwarded-host", b"bedrock-demo.example.com")]
+    scope = {"type": "http", "method": "GET", "path": "/stream", "headers": headers, "query_string": b""}
+    scope.update(asgi={"version": "3.0"}, http_version="1.1", scheme="https", server=("lambda-url", 443))
+    await app(scope, receive, send)
+    disconnected.set()
+    if len(sent_at) != tokens:
+        raise AssertionError(f"{len(sent_at)} of {tokens} tokens were sent")
+    return yielded_at, sent_at
+
+
+def run_benchmark(tokens: int = DEFAULT_TOKENS) -> List[MiddlewareBenchResult]:
+    results = []
+    for name, (logger_cls, forwarded_host_cls) in MIDDLEWARES.items():
+        yielded_at, sent_at = asyncio.run(stream_times(logger_cls, forwarded_host_cls, tokens))
+        latencies = [(sent - yielded) * 1e6 for yielded, sent in zip(yielded_at, sent_at)]
+        results.append(MiddlewareBenchResult(name, tokens, percentiles(latencies)))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time what the app middlewares add to each streamed token")
+    parser.add_argument("--tokens", type=int, default=DEFAULT_TOKENS, help="server sent events to stream")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.tokens)
+    if args.json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+    else:
+        for result in results:
+            latency = ", ".join(f"{key} {value:.1f}us" for key, value in result.latency_us.items())
+            print(f"{result.name:<20} per streamed token: {latency}")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Time building an action group response from a Bedrock agent event, the pydantic round trip the handlers used to do
+against the validate once fast path (`BedrockEvent.from_event` and `BedrockResponseEvent.response_dict_from_event`).
+
+    python -m tools.response_bench
+    python -m tools.response_bench -n 5000 --repeat 5 --json
+"""
+import argparse
+import json
+import timeit
+from dataclasses import asdict, dataclass
+
+from cdk.models import BedrockEvent, BedrockResponseEvent
+from tools.lambda_harness import make_event
+
+DEFAULT_NUMBER = 2000
+DEFAULT_REPEAT = 3
+
+
+@dataclass
+class ResponseBenchResult:
+    number: int
+    round_trip_us: float  # per invocation, best of the repeats
+    fast_path_us: float
+
+    @property
+    def speedup(self) -> float:
+        return self.round_trip_us / self.fast_path_us if self.fast_path_us else 0.0
+
+
+def round_trip(event: dict) -> dict:
+    """What the web_search handler used to do on every tool call"""
+    bedrock_event = BedrockEvent.model_validate(event)
+    assert bedrock_event.function
+    return BedrockResponseEvent.response_event_from_event(event, "response_text").model_dump()
+
+
+def fast_path(event: dict) -> dict:
+    """Validate once and build the response dict directly"""
+    bedrock_event = BedrockEvent.from_event(event)
+    assert bedrock_event.function
+    return BedrockResponseEvent.response_dict_from_event(bedrock_event, "response_text")
+
+
+def run_benchmark(event: dict, number: int = DEFAULT_NUMBER, repeat: int = DEFAULT_REPEAT) -> ResponseBenchResult:
+    if fast_path(event) != round_trip(event):
+        raise AssertionError("the fast path builds a different response than the round trip")
+
+    def per_invocation_us(fn) -> float:
+        return round(min(timeit.repeat(lambda: fn(event), number=number, repeat=repeat)) / number * 1e6, 2)
+
+    return ResponseBenchResult(number, per_invocation_us(round_trip), per_invocation_us(fast_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time building action group responses from Bedrock agent events")
+    parser.add_argument("-n", "--number", type=int, default=DEFAULT_NUMBER, help="invocations per repeat")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--json", action="store_true", help="print the result as json")
+    args = parser.parse_args()
+
+    result = run_benchmark(make_event("search", {"query": "When was cloudshift founded"}), args.number, args.repeat)
+    if args.json:
+        print(json.dumps(dict(asdict(result), speedup=round(result.speedup, 2)), indent=2))
+    else:
+        print(
+            f"per invocation: round trip {result.round_trip_us:.1f}us, fast path {result.fast_path_us:.1f}us "
+            f"({result.speedup:.1f}x)"
+        )
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""
+Compare knowledge base chunking settings on a local corpus.
+
+Every strategy chunks the corpus (see `tools.chunking`), embeds the chunks, indexes them in memory and runs a labelled
+query set, reporting the index size, embedding and query latency and recall@k / MRR. Queries are a JSON lines file:
+
+    {"query": "What is the notice period?", "relevant": ["contracts/acme.md"]}
+
+where `relevant` are the keys (paths relative to the corpus directory) of the documents that answer the query. A
+document counts as retrieved when any of its chunks is in the top k, like the knowledge base `numberOfResults`.
+
+    python -m tools.retrieval_bench ./corpus queries.jsonl -s FIXED_SIZE:1000:20 -s FIXED_SIZE:300:10 -s NONE
+    python -m tools.retrieval_bench ./corpus queries.jsonl --embedder titan --dimension 1024 --json
+"""
+import argparse
+import importlib
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from tools import chunking
+from tools.kb_backfill import LocalDirectorySource, TEXT_EXTENSIONS, chunk_id
+from tools.lambda_harness import percentiles
+from tools.vectors import SOURCE_URI_FIELD, Embedder, HashEmbedder, InMemoryVectorStore, TitanEmbedder, VectorRecord
+
+DEFAULT_STRATEGIES = ["FIXED_SIZE:1000:20", "FIXED_SIZE:500:20", "FIXED_SIZE:300:10", "NONE"]
+DEFAULT_TOP_K = 5
+
+
+@dataclass
+class Strategy:
+    name: str  # FIXED_SIZE or NONE
+    max_tokens: int = chunking.DEFAULT_MAX_TOKENS
+    overlap_percentage: int = chunking.DEFAULT_OVERLAP_PERCENTAGE
+
+    @classmethod
+    def parse(cls, spec: str) -> "Strategy":
+        """Parse `FIXED_SIZE:<max_tokens>:<overlap_percentage>` or `NONE`"""
+        name, *params = spec.split(":")
+        if name not in chunking.STRATEGIES:
+            raise ValueError(f"Unknown chunking strategy '{name}', expected one of {chunking.STRATEGIES}")
+        return cls(name, *map(int, params))
+
+    def __str__(self) -> str:
+        return self.name if self.name == chunking.NONE else f"{self.name}:{self.max_tokens}:{self.overlap_percentage}"
+
+
+@dataclass
+class Query:
+    query: str
+    relevant: List[str]
+
+
+@dataclass
+class StrategyResult:
+    strategy: str
+    documents: int
+    chunks: int
+    text_kb: float  # chunk text stored as metadata, overlap makes this larger than the corpus
+    vectors_kb: float
+    embed_seconds: float
+    recall_at_k: float
+    mrr: float  # mean reciprocal rank of the first relevant document
+    query_ms: Dict[str, float] = field(default_factory=dict)  # embedding and search latency per query
+
+
+def load_queries(path: str) -> List[Query]:
+    with open(path) as f:
+        return [Query(**json.loads(line)) for line in f if line.strip()]
+
+
+def load_corpus(directory: str) -> Dict[str, str]:
+    """Return the text documents by key"""
+    source = LocalDirectorySource(directory)
+    return {
+        obj.key: source.read(obj).decode("utf-8", errors="replace")
+        for obj in source.list()
+        if obj.key.lower().endswith(TEXT_EXTENSIONS)
+    }
+
+
+def load_embedder(spec: str, dimension: int) -> Embedder:
+    """`hash`, `titan` or the dotted path of an `Embedder` class taking the dimension, ie. `mypackage.module.Class`"""
+    if spec == "hash":
+        return HashEmbedder(dimension)
+    if spec == "titan":
+        return TitanEmbedder(dimension=dimension)
+    module, _, name = spec.rpartition(".")
+    return getattr(importlib.import_module(module), name)(dimension)
+
+
+def run_strategy(
+    corpus: Dict[str, str], queries: List[Query], embedder: Embedder, strategy: Strategy, top_k: int = DEFAULT_TOP_K
+) -> StrategyResult:
+    store = InMemoryVectorStore()
+    texts, records = [], []
+    for key, text in corpus.items():
+        for chunk in chunking.chunk_text(text, strategy.name, strategy.max_tokens, strategy.overlap_percentage):
+            texts.append(chunk.text)
+            records.append(VectorRecord(id=chunk_id(key, chunk.index), values=[], metadata={SOURCE_URI_FIELD: key}))
+    start = time.perf_counter()
+    for record, values in zip(records, embedder.embed(texts)):
+        record.values = values
+    embed_seconds = time.perf_counter() - start
+    store.upsert(records)
+
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        matches = store.query(embedder.embed([query.query])[0], top_k=top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        documents = list(dict.fromkeys(match.metadata[SOURCE_URI_FIELD] for match in matches))
+        relevant = set(query.relevant)
+        recalls.append(len(relevant.intersection(documents)) / len(relevant) if relevant else 1.0)
+        ranks = [rank for rank, document in enumerate(documents, start=1) if document in relevant]
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+
+    return StrategyResult(
+        strategy=str(strategy),
+        documents=len(corpus),
+        chunks=len(records),
+        text_kb=round(sum(len(text.encode()) for text in texts) / 1024, 1),
+        vectors_kb=round(store.nbytes / 1024, 1),
+        embed_seconds=round(embed_seconds, 3),
+        recall_at_k=round(sum(recalls) / len(recalls), 3) if recalls else 0.0,
+        mrr=round(sum(reciprocal_ranks) / len(reciprocal_ranks), 3) if reciprocal_ranks else 0.0,
+        query_ms=percentiles(latencies),
+    )
+
+
+def run_benchmark(
+    corpus: Dict[str, str],
+    queries: List[Query],
+    embedder: Embedder,
+    strategies: List[Strategy],
+    top_k: int = DEFAULT_TOP_K,
+) -> List[StrategyResult]:
+    return [run_strategy(corpus, queries, embedder, strategy, top_k) for strategy in strategies]
+
+
+def as_table(results: List[StrategyResult], top_k: Optional[int] = DEFAULT_TOP_K) -> str:
+    header = f"{'strategy':<22}{'chunks':>8}{'text KB':>10}{'vec KB':>10}{'embed s':>9}"
+    header += f"{'recall@' + str(top_k):>11}{'MRR':>7}{'q p50 ms':>10}{'q p99 ms':>10}"
+    lines = [header]
+    for r in results:
+        lines.append(
+            f"{r.strategy:<22}{r.chunks:>8}{r.text_kb:>10}{r.vectors_kb:>10}{r.embed_seconds:>9}"
+            f"{r.recall_at_k:>11}{r.mrr:>7}{r.query_ms.get('p50', 0):>10}{r.query_ms.get('p99', 0):>10}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Compare knowledge base chunking settings on a local corpus")
+    parser.add_argument("corpus", help="directory of documents")
+    parser.add_argument("queries", help="JSON lines of {query, relevant: [document keys]}")
+    parser.add_argument(
+        "-s",
+        "--strategy",
+        action="append",
+        help=f"FIXED_SIZE:<max_tokens>:<overlap_percentage> or NONE, repeatable. default: {DEFAULT_STRATEGIES}",
+    )
+    parser.add_argument("-k", "--top-k", type=int, default=DEFAULT_TOP_K, help="results per query (numberOfResults)")
+    parser.add_argument("--embedder", default="hash", help="hash, titan or the dotted path of an Embedder class")
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        load_corpus(args.corpus),
+        load_queries(args.queries),
+        load_embedder(args.embedder, args.dimension),
+        [Strategy.parse(spec) for spec in args.strategy or DEFAULT_STRATEGIES],
+        args.top_k,
+    )
+    print(json.dumps([asdict(r) for r in results], indent=2) if args.json else as_table(results, args.top_k))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Time what the session middleware adds to each request of a logged in user, Starlette's `SessionMiddleware` against
+`gradio_app.sessions.SignedCookieSessionMiddleware` and `ServerSideSessionMiddleware` (with the cached SQLite store).
+
+Each request is a Gradio queue poll with the session cookie of a user whose session holds the Okta userinfo, the
+endpoint reads the user like the auth dependency does.
+
+    python -m tools.session_bench
+    python -m tools.session_bench -n 10000 --json
+"""
+import argparse
+import asyncio
+import json
+import secrets
+import time
+from dataclasses import asdict, dataclass
+from typing import List
+
+from starlette.middleware.sessions import SessionMiddleware
+
+from gradio_app import session_store, sessions
+
+DEFAULT_REQUESTS = 2000
+SECRET_KEY = "secret"
+# Roughly what Okta returns as the ID token claims (userinfo)
+USERINFO = {
+    "sub": "00u1a2b3c4d5e6f7g8h9",
+    "name": "Jane Doe",
+    "email": "jane.doe@example.com",
+    "ver": 1,
+    "iss": "https://example.okta.com/oauth2/default",
+    "aud": "0oa1a2b3c4d5e6f7g8h9",
+    "iat": 1700000000,
+    "exp": 1700003600,
+    "jti": "ID.abcdefghijklmnopqrstuvwxyz0123456789ABCDEFG",
+    "amr": ["pwd", "mfa", "otp"],
+    "idp": "00o1a2b3c4d5e6f7g8h9",
+    "nonce": "abcdefghijklmnopqrst",
+    "preferred_username": "jane.doe@example.com",
+    "auth_time": 1700000000,
+    "at_hash": "abcdefghijklmnopqrstuv",
+}
+
+
+@dataclass
+class SessionBenchResult:
+    name: str
+    requests: int
+    per_request_us: float
+    cookie_bytes: int  # of the Cookie header
+
+
+async def ok(scope, receive, send):
+    scope["session"].get("user")  # what the auth dependency does
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def poll_seconds(app, cookie: str, requests: int) -> float:
+    """Seconds per request the session middleware adds, like the Gradio queue polls with a logged in session"""
+    headers = [(b"host", b"lambda-url"), (b"cookie", cookie.encode())]
+    scope = {"type": "http", "method": "GET", "path": "/gradio/queue/data", "headers": headers, "query_string": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def measure(name: str, app, cookie: str, requests: int) -> SessionBenchResult:
+    per_request_us = round(asyncio.run(poll_seconds(app, cookie, requests)) * 1e6, 2)
+    return SessionBenchResult(name, requests, per_request_us, len(cookie))
+
+
+def run_benchmark(requests: int = DEFAULT_REQUESTS) -> List[SessionBenchResult]:
+    payload = json.dumps({"user": USERINFO})
+    signed = sessions.SignedCookieSessionMiddleware(ok, secret_key=SECRET_KEY)
+    cookie = f"session={signed.sign(payload)}"  # same format as Starlette
+    store = session_store.CachedSessionStore(session_store.SQLiteSessionStore())
+    session_id = secrets.token_urlsafe(32)
+    store.save(session_id, payload, time.time() + 3600)
+    server_side_cookie = f"session_id={session_id}"
+    return [
+        measure("SessionMiddleware", SessionMiddleware(ok, secret_key=SECRET_KEY), cookie, requests),
+        measure("SignedCookieSessionMiddleware", signed, cookie, requests),
+        measure(
+            "ServerSideSessionMiddleware", sessions.ServerSideSessionMiddleware(ok, store), server_side_cookie, requests
+        ),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time what the session middleware adds to each request")
+    parser.add_argument("-n", "--requests", type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.requests)
+    if args.json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+    else:
+        for result in results:
+            print(f"{result.name:<30} {result.per_request_us:>8.1f}us per request, {result.cookie_bytes} byte cookie")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Time `cdk synth` of this app and report what the synth stages.
+
+Each run executes the app (`python3 app.py`, like the cdk cli) in a fresh interpreter with an empty output directory,
+so the timings include the asset fingerprinting and staging. The report counts the Docker image assets (images that
+a deploy builds and pushes) and the size of the staged build contexts, which the fingerprinting has to read.
+
+    python -m tools.synth_bench
+    python -m tools.synth_bench -n 5 --json
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+from tools.lambda_harness import percentiles
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+@dataclass
+class SynthResult:
+    runs: int
+    seconds: Dict[str, float] = field(default_factory=dict)
+    stacks: int = 0
+    docker_images: int = 0  # distinct images a deploy builds and pushes
+    staged_files: int = 0  # files copied into the cdk.out build contexts
+    staged_mb: float = 0.0
+
+
+def cdk_context() -> str:
+    """The context the cdk cli passes to the app, from cdk.json and the cached lookups in cdk.context.json"""
+    context = {}
+    for name in ["cdk.json", "cdk.context.json"]:
+        path = os.path.join(ROOT_DIR, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            context.update(data.get("context", {}) if name == "cdk.json" else data)
+    return json.dumps(context)
+
+
+def synth(outdir: str, app: str = "app.py") -> float:
+    env = dict(
+        os.environ, CDK_OUTDIR=outdir, CDK_CONTEXT_JSON=cdk_context(), JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1"
+    )
+    start = time.perf_counter()
+    subprocess.run([sys.executable, app], cwd=ROOT_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def inspect(outdir: str, result: SynthResult) -> None:
+    images = set()
+    for manifest in glob.glob(os.path.join(outdir, "*.assets.json")):
+        with open(manifest) as f:
+            images.update(json.load(f).get("dockerImages", {}))
+    result.stacks = len(glob.glob(os.path.join(outdir, "*.template.json")))
+    result.docker_images = len(images)
+    size = 0
+    for asset_dir in glob.glob(os.path.join(outdir, "asset.*")):
+        for root, _, files in os.walk(asset_dir):
+            result.staged_files += len(files)
+            size += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    result.staged_mb = round(size / 1024 / 1024, 1)
+
+
+def run(runs: int = 3, app: str = "app.py") -> SynthResult:
+    result = SynthResult(runs=runs)
+    samples: List[float] = []
+    for run_number in range(runs):
+        with tempfile.TemporaryDirectory(prefix="synth-bench-") as outdir:
+            samples.append(synth(outdir, app))
+            if run_number == 0:
+                inspect(outdir, result)
+    result.seconds = percentiles(samples)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time cdk synth of this app")
+    parser.add_argument("-n", "--runs", type=int, default=3)
+    parser.add_argument("--app", default="app.py", help="cdk app to synth, relative to the project root")
+    parser.add_argument("--json", action="store_true", help="print the result as json")
+    args = parser.parse_args()
+
+    result = run(args.runs, args.app)
+    if args.json:
+        print(json.dumps(asdict(result), indent=2))
+    else:
+        print(f"synth seconds:  {result.seconds}")
+        print(f"stacks:         {result.stacks}")
+        print(f"docker images:  {result.docker_images}")
+        print(f"staged files:   {result.staged_files} ({result.staged_mb} MB)")
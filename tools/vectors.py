@@ -0,0 +1,165 @@
+"""
+Pluggable embedding models and vector stores for the knowledge base tools.
+
+* `TitanEmbedder` calls the Bedrock embedding model the knowledge base is configured with, `HashEmbedder` is a
+  deterministic local stand-in for tests and offline benchmarks.
+* `PineconeVectorStore` writes to the knowledge base's Pinecone index, `InMemoryVectorStore` is a brute force index
+  that can also be queried.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+DEFAULT_EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+DEFAULT_DIMENSION = 1024
+PINECONE_DELETE_BATCH = 1000  # ids per delete request
+
+# Pinecone metadata keys written by Bedrock ingestion jobs, see the field mapping in BedrockPineconeKnowledgeBase
+TEXT_FIELD = "textField"
+METADATA_FIELD = "metadataField"
+SOURCE_URI_FIELD = "x-amz-bedrock-kb-source-uri"
+DATA_SOURCE_ID_FIELD = "x-amz-bedrock-kb-data-source-id"
+
+
+@dataclass
+class VectorRecord:
+    id: str
+    values: List[float]
+    metadata: Dict[str, str] = field(default_factory=dict)
+
+
+class Embedder(ABC):
+    dimension: int
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embed a batch of texts, returning one vector per text in the same order"""
+
+
+class TitanEmbedder(Embedder):
+    """
+    Amazon Titan text embeddings through bedrock-runtime. Titan embeds one text per InvokeModel call, so a batch is
+    embedded with up to `concurrency` calls in flight.
+    """
+
+    def __init__(
+        self,
+        model_id: str = DEFAULT_EMBEDDING_MODEL_ID,
+        dimension: int = DEFAULT_DIMENSION,
+        concurrency: int = 8,
+        client=None,
+    ):
+        self.model_id = model_id
+        self.dimension = dimension
+        self._client = client
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed")
+
+    @property
+    def client(self):
+        if not self._client:
+            import boto3
+
+            self._client = boto3.client("bedrock-runtime")
+        return self._client
+
+    def _embed_one(self, text: str) -> List[float]:
+        body = json.dumps({"inputText": text, "dimensions": self.dimension, "normalize": True})
+        response = self.client.invoke_model(modelId=self.model_id, body=body)
+        return json.loads(response["body"].read())["embedding"]
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        return list(self._executor.map(self._embed_one, texts))
+
+
+class HashEmbedder(Embedder):
+    """Deterministic bag of hashed words embedding, texts that share words get similar (normalized) vectors"""
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+                vectors[row, int.from_bytes(digest, "little") % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.where(norms == 0, 1, norms)).tolist()
+
+
+class VectorStore(ABC):
+    @abstractmethod
+    def upsert(self, records: Sequence[VectorRecord]) -> None:
+        """Insert or overwrite records by id"""
+
+    @abstractmethod
+    def delete(self, ids: Sequence[str]) -> None:
+        """Delete the records by id, unknown ids are ignored"""
+
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, index, namespace: str = ""):
+        """param index: pinecone.Index: ie. `Pinecone(api_key=...).Index(host=...)`"""
+        self.index = index
+        self.namespace = namespace
+
+    def upsert(self, records: Sequence[VectorRecord]) -> None:
+        vectors = [{"id": record.id, "values": record.values, "metadata": record.metadata} for record in records]
+        self.index.upsert(vectors=vectors, namespace=self.namespace, show_progress=False)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        ids = list(ids)
+        for start in range(0, len(ids), PINECONE_DELETE_BATCH):
+            self.index.delete(ids=ids[start : start + PINECONE_DELETE_BATCH], namespace=self.namespace)  # noqa: E203
+
+
+class InMemoryVectorStore(VectorStore):
+    """Brute force cosine similarity index"""
+
+    def __init__(self):
+        self.records: Dict[str, VectorRecord] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._lock = threading.Lock()
+
+    def upsert(self, records: Sequence[VectorRecord]) -> None:
+        with self._lock:
+            self.records.update({record.id: record for record in records})
+            self._matrix = None
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            for id in ids:
+                self.records.pop(id, None)
+            self._matrix = None
+
+    def _index(self):
+        with self._lock:
+            if self._matrix is None:
+                self._ids = list(self.records)
+                values = [self.records[id].values for id in self._ids]
+                matrix = np.array(values, dtype=np.float32).reshape(len(values), -1)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                self._matrix = matrix / np.where(norms == 0, 1, norms)
+            return self._ids, self._matrix
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the vectors in the index"""
+        return self._index()[1].nbytes
+
+    def query(self, vector: Sequence[float], top_k: int = 5) -> List[VectorRecord]:
+        """Return the `top_k` most similar records"""
+        ids, matrix = self._index()
+        if not ids:
+            return []
+        scores = matrix @ np.asarray(vector, dtype=np.float32)
+        top = np.argsort(-scores)[:top_k]
+        return [self.records[ids[i]] for i in top]
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Join the Powertools logs of the app and the action group Lambdas into a latency waterfall per prompt.
+
+The app logs an `invoke_agent` span per prompt with the arrival time of each agent event (`marks`), the action group
+handlers log a span per agent call. They share the `correlation_id` the app sends as a session attribute. The time of
+the `invoke_agent` span that no tool span covers is the agent (model and knowledge base) and the streaming.
+
+Export the log groups for the time of interest, ie.
+
+    aws logs filter-log-events --log-group-name /aws/lambda/<GradioApp> --start-time <ms> > app.json
+    aws logs filter-log-events --log-group-name /aws/lambda/<WebSearchTool> --start-time <ms> > web_search.json
+    python -m tools.waterfall app.json web_search.json [--correlation-id <id>]
+
+Files can be `filter-log-events` output or the json log lines themselves.
+"""
+import argparse
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+ROOT_SPAN = "invoke_agent"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S,%f%z"  # Powertools Logger
+
+
+@dataclass
+class Span:
+    name: str
+    service: str
+    start_ms: float  # epoch
+    duration_ms: float
+    keys: Dict = field(default_factory=dict)
+
+    @property
+    def end_ms(self) -> float:
+        return self.start_ms + self.duration_ms
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """The json log records in a `filter-log-events` output or json lines file, other lines are skipped"""
+    with open(path) as f:
+        text = f.read()
+    try:
+        messages = [event["message"] for event in json.loads(text)["events"]]
+    except (ValueError, KeyError, TypeError):
+        messages = text.splitlines()
+    for message in messages:
+        try:
+            record = json.loads(message)
+        except ValueError:
+            continue  # START/END/REPORT lines and plain prints
+        if isinstance(record, dict):
+            yield record
+
+
+def to_span(record: dict) -> Optional[Span]:
+    """A record logged at the end of a span, None for other records"""
+    if "span" not in record or "duration_ms" not in record or "timestamp" not in record:
+        return None
+    end_ms = datetime.strptime(record["timestamp"], TIMESTAMP_FORMAT).timestamp() * 1000
+    keys = {k: v for k, v in record.items() if k not in ("span", "duration_ms", "timestamp", "message", "service")}
+    return Span(record["span"], record.get("service", ""), end_ms - record["duration_ms"], record["duration_ms"], keys)
+
+
+def group_spans(records: Iterator[dict]) -> Dict[str, List[Span]]:
+    """Spans by correlation id, in start order"""
+    groups: Dict[str, List[Span]] = {}
+    for record in records:
+        if (span := to_span(record)) and (correlation_id := record.get("correlation_id")):
+            groups.setdefault(correlation_id, []).append(span)
+    return {key: sorted(spans, key=lambda span: span.start_ms) for key, spans in groups.items()}
+
+
+def attribute(spans: List[Span]) -> Dict[str, float]:
+    """Milliseconds of the prompt spent in each tool and the rest, in the agent (model, knowledge base) and streaming"""
+    root = next((span for span in spans if span.name == ROOT_SPAN), None)
+    tools = [span for span in spans if span.name != ROOT_SPAN]
+    result: Dict[str, float] = {}
+    for span in tools:
+        result[span.name] = round(result.get(span.name, 0) + span.duration_ms, 1)
+    if root:
+        covered, end = 0.0, root.start_ms  # union of the tool spans, they can overlap
+        for span in sorted(tools, key=lambda span: span.start_ms):
+            start, stop = max(span.start_ms, end), min(span.end_ms, root.end_ms)
+            if stop > start:
+                covered, end = covered + stop - start, stop
+        result["agent and streaming"] = round(root.duration_ms - covered, 1)
+        result["total"] = root.duration_ms
+    return result
+
+
+def render(correlation_id: str, spans: List[Span], width: int = 60) -> str:
+    origin = spans[0].start_ms
+    total = max(span.end_ms for span in spans) - origin or 1
+    scale = width / total
+    lines = [f"correlation id {correlation_id}"]
+    for span in spans:
+        bar = " " * int((span.start_ms - origin) * scale) + "#" * max(1, int(span.duration_ms * scale))
+        lines.append(f"{span.name:<28} {span.start_ms - origin:>8.0f} {span.duration_ms:>8.0f}ms |{bar:<{width}}|")
+        for mark in span.keys.get("marks", []) if span.name == ROOT_SPAN else []:
+            if mark["event"] != "chunk":
+                offset = span.start_ms - origin + mark["offset_ms"]
+                lines.append(f"  {mark['event'][:48]:<48} {offset:>8.0f}ms |{' ' * int(offset * scale)}^")
+    lines.append("  " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in attribute(spans).items()))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency waterfall per prompt from the app and tool Lambda logs")
+    parser.add_argument("paths", nargs="+", help="filter-log-events output or json log lines files")
+    parser.add_argument("--correlation-id", help="only this prompt")
+    parser.add_argument("--json", action="store_true", help="print the spans and attribution as json")
+    args = parser.parse_args()
+
+    groups = group_spans(record for path in args.paths for record in read_records(path))
+    if args.correlation_id:
+        groups = {args.correlation_id: groups.get(args.correlation_id, [])}
+    for correlation_id, spans in groups.items():
+        if not spans:
+            print(f"correlation id {correlation_id}: no spans")
+        elif args.json:
+            spans_dicts = [dict(span.__dict__, end_ms=span.end_ms) for span in spans]
+            print(json.dumps(dict(correlation_id=correlation_id, spans=spans_dicts, attribution=attribute(spans))))
+        else:
+            print(render(correlation_id, spans) + "\n")